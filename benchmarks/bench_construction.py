@@ -0,0 +1,90 @@
+"""Benchmark the construction of Slurm objects.
+
+Compares the current construction (shared argument schema) against the
+previous behavior, where the txt files were read and the argparse parser was
+built again on every instantiation, and where every argument went through
+argparse. Variants built from scratch are compared to derived ones.
+
+    $ python -m benchmarks.bench_construction [--number N]
+"""
+
+import argparse
+import timeit
+
+from simple_slurm import Slurm
+from simple_slurm.core import (
+    Namespace,
+    create_setter_method,
+    fmt_key,
+    fmt_value,
+    read_simple_txt,
+)
+
+KWARGS = dict(
+    array=range(3, 12),
+    cpus_per_task=15,
+    job_name="name",
+    dependency=dict(after=65541, afterok=34987),
+    output=r"%A_%a.out",
+    time="1-02:03:04",
+)
+
+
+def legacy_construction(**kwargs):
+    """Reproduce the per-instance work done before the shared schema"""
+    slurm = Slurm.__new__(Slurm)
+    slurm.namespace = Namespace()
+    parser = argparse.ArgumentParser()
+    slurm.set_shell()
+    for keys in read_simple_txt("arguments.txt"):
+        parser.add_argument(*(fmt_key(k) for k in keys))
+    for keys in read_simple_txt("arguments.txt"):
+        create_setter_method(keys[0])
+    for pattern in read_simple_txt("filename_patterns.txt"):
+        setattr(Slurm, *pattern)
+    for (var,) in read_simple_txt("output_env_vars.txt"):
+        setattr(Slurm, var, "$" + var)
+    for key, value in kwargs.items():
+        parser.parse_args([fmt_key(key), fmt_value(value)], namespace=slurm.namespace)
+    slurm.run_cmds = []
+    return slurm
+
+
+def report(label: str, func, number: int):
+    seconds = timeit.timeit(func, number=number) / number
+    print(f"{label:<34} {seconds * 1e6:>10.1f} us/object")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=1000)
+    number = parser.parse_args().number
+
+    report("legacy Slurm()", legacy_construction, number)
+    report("legacy Slurm(**kwargs)", lambda: legacy_construction(**KWARGS), number)
+    report("Slurm()", Slurm, number)
+    report("Slurm(**kwargs)", lambda: Slurm(**KWARGS), number)
+    base = Slurm(**KWARGS)
+    report(
+        "Slurm(**kwargs) + script()",
+        lambda: Slurm(**dict(KWARGS, job_name="variant")).script(),
+        number,
+    )
+    report(
+        "derive(job_name) + script()",
+        lambda: base.derive(job_name="variant").script(),
+        number,
+    )
+
+    slurm = Slurm()
+    parser, namespace = slurm.parser, slurm.namespace
+    report(
+        "argparse parse_args (per argument)",
+        lambda: parser.parse_args(["--job_name", "name"], namespace=namespace),
+        number,
+    )
+    report("set_job_name (per argument)", lambda: slurm.set_job_name("name"), number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Benchmark the rendering of sbatch scripts.
+
+Compares 'Slurm.script', which caches the "#SBATCH" lines and escapes the
+commands once, against the previous implementation rendering everything on
+every call.
+
+    $ python -m benchmarks.bench_script_render [--number N]
+"""
+
+import argparse
+import timeit
+
+from simple_slurm import Slurm
+
+KWARGS = dict(
+    array=range(3, 12),
+    cpus_per_task=15,
+    job_name="name",
+    dependency=dict(after=65541, afterok=34987),
+    gres=["gpu:kepler:2", "gpu:tesla:2", "mps:400"],
+    ignore_pbs=True,
+    output=r"%A_%a.out",
+    time="1-02:03:04",
+)
+
+
+def legacy_script(slurm: Slurm, shell: str = None, convert: bool = True) -> str:
+    """The previous implementation of 'Slurm.script'"""
+    if shell is None:
+        shell = slurm.shell
+    arguments = (
+        "\n".join(
+            (
+                f"#!{shell}",
+                "",
+                *(
+                    f"#SBATCH --{slurm._valid_key(k):<19} {v}"
+                    for k, v in vars(slurm.namespace).items()
+                    if v is not None
+                ),
+            )
+        )
+        + "\n"
+    )
+    commands = "\n".join(
+        [cmd.replace("$", "\\$") if convert else cmd for cmd in slurm.run_cmds]
+    )
+    return "\n".join((arguments, commands)).strip() + "\n"
+
+
+def report(label: str, func, number: int):
+    seconds = timeit.timeit(func, number=number) / number
+    print(f"{label:<40} {1 / seconds:>12,.0f} scripts/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20000)
+    number = parser.parse_args().number
+
+    slurm = Slurm(**KWARGS)
+    for i in range(20):
+        slurm.add_cmd(f"python step_{i}.py --task $SLURM_ARRAY_TASK_ID")
+    assert legacy_script(slurm) == slurm.script()
+
+    report("legacy, unchanged", lambda: legacy_script(slurm), number)
+    report("script(), unchanged", slurm.script, number)
+
+    def change_one_argument(render):
+        slurm.set_time("1-02:03:04")
+        return render(slurm)
+
+    report(
+        "legacy, one argument changed",
+        lambda: change_one_argument(legacy_script),
+        number,
+    )
+    report(
+        "script(), one argument changed",
+        lambda: change_one_argument(Slurm.script),
+        number,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark the parsing of squeue's output.
+
+Compares the dict based parser used by 'update_squeue' against the streaming
+parser used by 'iter_squeue', on a synthetic squeue output (default format)
+read from a file, as it would be read from squeue's pipe.
+
+    $ python -m benchmarks.bench_squeue_parse [--rows N]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from simple_slurm.squeue import SlurmSqueueWrapper, parse_squeue_stream
+
+HEADER = '"JOBID","NAME","ST","TIME","TIME_LEFT","NODES","CPUS","MIN_MEMORY","TRES_PER_NODE","NODELIST(REASON)"'
+ROW = '"{}","train_{}","R","1:02:{:02d}","1-00:00:00","1","4","16G","gres/gpu:1","node{:03d}"'
+
+
+def synthetic_output(rows: int) -> str:
+    lines = [HEADER]
+    lines.extend(ROW.format(1000000 + i, i, i % 60, i % 500) for i in range(rows))
+    return "\n".join(lines) + "\n"
+
+
+def measure(label: str, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<36} {elapsed:>8.3f} s {peak / 2**20:>10.1f} MiB peak")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    rows = parser.parse_args().rows
+
+    wrapper = SlurmSqueueWrapper()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "squeue.out")
+        with open(path, "w") as fid:
+            fid.write(synthetic_output(rows))
+
+        def parse_dict():
+            with open(path) as fid:
+                return wrapper._parse_output(fid.read())
+
+        def parse_records():
+            with open(path) as fid:
+                return list(parse_squeue_stream(fid))
+
+        def stream_records():
+            with open(path) as fid:
+                return sum(1 for _ in parse_squeue_stream(fid))
+
+        print(f"{rows} rows")
+        measure("dict rows (update_squeue)", parse_dict)
+        measure("typed records, materialized", parse_records)
+        measure("typed records, streamed", stream_records)
+
+
+if __name__ == "__main__":
+    main()
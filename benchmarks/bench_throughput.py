@@ -0,0 +1,82 @@
+"""Benchmark the throughput (jobs per second) of the submission, polling and
+cancellation paths against the local fake Slurm controller.
+
+For each number of jobs:
+    - sbatch:         'Slurm.sbatch', one call per job (and 'sbatch_many')
+    - update_squeue:  'SlurmSqueueWrapper.update_squeue' listing all the jobs
+    - cancel_jobs:    'SlurmScancelWrapper.cancel_jobs' cancelling all the jobs
+
+Each sbatch call starts a process, so the submission measurements stop after
+'--budget' seconds and report the rate of the jobs submitted so far.
+
+    $ python -m benchmarks.bench_throughput [--jobs 1000 10000 100000]
+"""
+
+import argparse
+import time
+
+from simple_slurm import Slurm
+from simple_slurm.fake_slurm import FakeSlurm
+from simple_slurm.scancel import SlurmScancelWrapper
+from simple_slurm.squeue import SlurmSqueueWrapper
+
+
+def report(label: str, jobs: int, count: int, elapsed: float):
+    partial = "" if count == jobs else f" ({count} submitted)"
+    print(f"{jobs:>8} jobs  {label:<22} {count / elapsed:>12.1f} jobs/s{partial}")
+
+
+def bench_sbatch(jobs: int, budget: float):
+    with FakeSlurm():
+        slurm = Slurm(job_name="bench", output="bench.out")
+        slurm.add_cmd("echo Hello!")
+        count, start = 0, time.perf_counter()
+        while count < jobs and time.perf_counter() - start < budget:
+            slurm.sbatch(verbose=False)
+            count += 1
+        report("sbatch", jobs, count, time.perf_counter() - start)
+
+    with FakeSlurm():
+        count, start = 0, time.perf_counter()
+        for _ in slurm._sbatch_stream((dict() for _ in range(jobs)), 8, 0, 0):
+            count += 1
+            if time.perf_counter() - start > budget:
+                break
+        report("sbatch_many", jobs, count, time.perf_counter() - start)
+
+
+def bench_squeue(jobs: int):
+    with FakeSlurm(pending_time=3600) as fake:
+        fake.populate(jobs)
+        squeue = SlurmSqueueWrapper()
+        start = time.perf_counter()
+        squeue.update_squeue(force=True)
+        elapsed = time.perf_counter() - start
+        assert len(squeue.jobs) == jobs
+        report("update_squeue", jobs, jobs, elapsed)
+
+
+def bench_scancel(jobs: int):
+    with FakeSlurm(pending_time=3600) as fake:
+        job_ids = fake.populate(jobs)
+        start = time.perf_counter()
+        failed = SlurmScancelWrapper().cancel_jobs(job_ids)
+        elapsed = time.perf_counter() - start
+        assert not failed
+        report("cancel_jobs", jobs, jobs, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--budget", type=float, default=30.0)
+    args = parser.parse_args()
+
+    for jobs in args.jobs:
+        bench_sbatch(jobs, args.budget)
+        bench_squeue(jobs)
+        bench_scancel(jobs)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,59 @@
+import sys
+
 from .__about__ import __version__
 
-from .core import Slurm
+from .core import Slurm, SlurmJob
+
+# module of each class imported when it is first accessed, so that importing
+# the package stays cheap (no sqlite3, asyncio, concurrent.futures...)
+_LAZY_IMPORTS = {
+    "AsyncSlurm": "async_slurm",
+    "JobArray": "job_array",
+    "LogTailer": "logs",
+    "ScriptStore": "script_store",
+    "SubmissionFeeder": "feeder",
+    "SubmissionJournal": "journal",
+    "TaskFarm": "farm",
+    "Workflow": "workflow",
+}
+
+# the Slurm class attributes (setters, filename patterns and output environment
+# variables) are also defined on first use
+if sys.version_info < (3, 7):  # no module __getattr__ (PEP 562)
+    from .async_slurm import AsyncSlurm
+    from .farm import TaskFarm
+    from .feeder import SubmissionFeeder
+    from .job_array import JobArray
+    from .journal import SubmissionJournal
+    from .logs import LogTailer
+    from .script_store import ScriptStore
+    from .workflow import Workflow
+else:
+
+    def __getattr__(name: str):
+        if name in _LAZY_IMPORTS:
+            import importlib
+
+            module = importlib.import_module(f"{__name__}.{_LAZY_IMPORTS[name]}")
+            value = getattr(module, name)
+            globals()[name] = value
+            return value
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    def __dir__():
+        return sorted(set(globals()) | set(_LAZY_IMPORTS))
 
-# create a dummy Slurm object, this forces the creation of attributes for
-# file patterns and output environment variables
-_ = Slurm()
 
 __all__ = [
     "__version__",
+    "Slurm",
+    "SlurmJob",
+    "AsyncSlurm",
+    "JobArray",
+    "LogTailer",
+    "ScriptStore",
+    "SubmissionFeeder",
+    "SubmissionJournal",
+    "TaskFarm",
+    "Workflow",
 ]
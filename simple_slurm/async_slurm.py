@@ -0,0 +1,282 @@
+import asyncio
+import shlex
+import subprocess
+from typing import Iterable, List, Optional, Union
+
+from simple_slurm.commands import (
+    is_transient_error,
+    output_size,
+    record_retry,
+    track,
+)
+from simple_slurm.core import Slurm, SlurmJob
+from simple_slurm.journal import SubmissionJournal
+from simple_slurm.script_store import ScriptStore, write_atomic
+
+
+class AsyncSlurm(Slurm):
+    """Asyncio counterpart of the Slurm class.
+
+    The arguments and commands are handled as in the Slurm class, but the
+    methods calling Slurm ('sbatch', 'srun', 'update_squeue', 'cancel_job' and
+    'cancel_all') are coroutines. The commands are run with asyncio
+    subprocesses, without any intermediate shell, so they never block the
+    event loop and many of them can run concurrently:
+        > job_ids = await asyncio.gather(
+        >     *(AsyncSlurm(job_name=f"job_{i}").sbatch("python main.py") for i in range(100))
+        > )
+
+    All of them accept a 'timeout' (in seconds), after which the command is
+    killed and 'asyncio.TimeoutError' is raised. The command is also killed
+    if the coroutine is cancelled.
+
+    'sbatch_many' is a coroutine too, while the other methods built on the
+    synchronous 'sbatch' ('sbatch_array', 'sbatch_farm', 'wait'...) raise a
+    TypeError: use a Slurm object for them.
+    """
+
+    async def sbatch_many(
+        self,
+        variants: Iterable,
+        max_workers: int = 8,
+        retries: int = 2,
+        retry_delay: float = 1.0,
+        raise_errors: bool = True,
+        **sbatch_kwargs,
+    ) -> List[Optional[int]]:
+        """Submit many variants of this job concurrently and return their job
+        ids, in the same order as 'variants' (see 'Slurm.sbatch_many').
+
+        At most 'max_workers' submissions run at once, only the transient
+        errors (and timeouts) are retried. If a submission still fails and
+        'raise_errors' is True, the variants not started yet are not
+        submitted and the error is raised, with the job ids of all the
+        variants (None if not submitted) in its 'job_ids'.
+        """
+        sbatch_kwargs.setdefault("verbose", False)
+        jobs = [self._variant(variant) for variant in variants]
+        for job in jobs:
+            if not isinstance(job, AsyncSlurm):
+                raise TypeError("The variants of AsyncSlurm must be AsyncSlurm objects")
+        semaphore = asyncio.Semaphore(max_workers)
+        failed = asyncio.Event()
+
+        async def submit(slurm: AsyncSlurm) -> Optional[int]:
+            async with semaphore:
+                if raise_errors and failed.is_set():
+                    return None
+                for attempt in range(retries + 1):
+                    try:
+                        return await slurm.sbatch(**sbatch_kwargs)
+                    except Exception as error:
+                        transient = isinstance(
+                            error, asyncio.TimeoutError
+                        ) or is_transient_error(error)
+                        if attempt == retries or not transient:
+                            failed.set()
+                            raise
+                        record_retry(
+                            sbatch_kwargs.get("sbatch_cmd", "sbatch"),
+                            "AsyncSlurm.sbatch",
+                        )
+                        await asyncio.sleep(retry_delay * 2**attempt)
+
+        results = await asyncio.gather(
+            *(submit(job) for job in jobs), return_exceptions=True
+        )
+        job_ids = [
+            None if isinstance(result, BaseException) else result for result in results
+        ]
+        for result in results:
+            if isinstance(result, BaseException):
+                if raise_errors or not isinstance(result, Exception):
+                    result.job_ids = job_ids
+                    raise result
+        return job_ids
+
+    def _synchronous_only(self, *args, **kwargs):
+        raise TypeError(
+            "This method relies on the synchronous 'sbatch', use a Slurm object"
+        )
+
+    sbatch_array = sbatch_farm = wait = _synchronous_only
+    _sbatch_stream = _sbatch_with_retries = _synchronous_only
+
+    async def srun(
+        self,
+        *run_cmd: str,
+        connector: str = ";",
+        srun_cmd: str = "srun",
+        timeout: Optional[float] = None,
+    ) -> int:
+        """Run the srun command with all the (previously) set arguments and
+        the provided commands in 'run_cmd' alongside with the previously set
+        commands using 'add_cmd'.
+
+        The commands are connected with 'connector' (see 'Slurm.srun') and run
+        by the shell ('set_shell') inside the job step, ie.
+            $ srun [arguments] /bin/sh -c "command_1 ; command_2"
+
+        A 'subprocess.CalledProcessError' is raised if srun fails.
+        """
+        self.add_cmd(*run_cmd)
+        commands = f" {connector} ".join(self.run_cmds)
+        args = [srun_cmd, *self._srun_arguments(), self.shell, "-c", commands]
+        returncode, _, _ = await run_command(
+            args, timeout=timeout, capture=False, caller="AsyncSlurm.srun"
+        )
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, args)
+        return returncode
+
+    async def sbatch(
+        self,
+        *run_cmd: str,
+        verbose: bool = True,
+        sbatch_cmd: str = "sbatch",
+        shell: str = None,
+        job_file: Union[str, ScriptStore] = None,
+        timeout: Optional[float] = None,
+        journal: Optional[SubmissionJournal] = None,
+    ) -> SlurmJob:
+        """Run the sbatch command with all the (previously) set arguments and
+        the provided command in 'run_cmd' alongside with the previously set
+        commands using 'add_cmd'.
+
+        The script is given to sbatch through its standard input, or written
+        to 'job_file' if provided (a path or a 'ScriptStore'). As no shell is
+        involved, the '$' of bash variables do not need to be escaped.
+
+        Already submitted scripts are skipped if a 'journal' is given (see
+        'Slurm.sbatch'). As for 'Slurm.sbatch', the job id is returned as a
+        'SlurmJob' ('sbatch_cmd' may carry arguments, ex. "sbatch --quiet").
+        """
+        if shell is None:
+            shell = self.shell
+        else:
+            self.set_shell(shell)
+
+        self.add_cmd(*run_cmd)
+        script = self.script(shell, convert=False)
+        if journal is not None:
+            digest = journal.digest(script)
+            job_id = journal.lookup(digest)
+            if job_id is not None:
+                if verbose:
+                    print(f"Job already submitted: {job_id}")
+                return SlurmJob(job_id, self.squeue)
+
+        if isinstance(job_file, ScriptStore):
+            job_file = job_file.put(script)
+        elif job_file is not None:
+            write_atomic(job_file, script)
+        args = shlex.split(sbatch_cmd)
+        if job_file is not None:
+            args, script = [*args, job_file], None
+        returncode, stdout, stderr = await run_command(
+            args, input=script, timeout=timeout, caller="AsyncSlurm.sbatch"
+        )
+        job_id, stdout = self._parse_sbatch_output(stdout, returncode, stderr)
+        if journal is not None and job_id is not None:
+            journal.record(digest, job_id, self._journal_arguments())
+        if verbose:
+            print(stdout)
+        return SlurmJob(job_id, self.squeue)
+
+    async def update_squeue(
+        self, timeout: Optional[float] = None, force: bool = False
+    ) -> dict:
+        """Refresh the information from the current queue for the current user
+        (see 'SlurmSqueueWrapper.update_squeue'), return the jobs. The
+        snapshots are shared with the synchronous calls, and the concurrent
+        calls of the same event loop share a single squeue call.
+        """
+        squeue = self.squeue
+        command = squeue._squeue_command()
+        snapshot = None if force else squeue.cache.peek(tuple(command), squeue.ttl)
+        if snapshot is None:
+            key = (asyncio.get_event_loop(), tuple(command))
+            flight = _squeue_flights.get(key)
+            if flight is None:
+                flight = asyncio.ensure_future(self._fetch_squeue(command, timeout))
+                _squeue_flights[key] = flight
+                flight.add_done_callback(
+                    lambda _: (
+                        _squeue_flights.pop(key, None)
+                        if _squeue_flights.get(key) is flight
+                        else None
+                    )
+                )
+            # a cancelled caller does not cancel the call shared with others
+            snapshot = await asyncio.shield(flight)
+        squeue.snapshot = snapshot
+        squeue.jobs = snapshot.jobs
+        return squeue.jobs
+
+    async def _fetch_squeue(self, command: List[str], timeout: Optional[float]):
+        returncode, stdout, stderr = await run_command(
+            command, timeout=timeout, caller="AsyncSlurm.update_squeue"
+        )
+        if returncode != 0:
+            raise RuntimeError(f"Error running squeue: {stderr}")
+        return self.squeue.cache.put(tuple(command), self.squeue._parse_output(stdout))
+
+    async def cancel_job(self, job_id: int, timeout: Optional[float] = None):
+        """Sends a straightforward scancel to a job"""
+        await self._scancel([str(job_id)], timeout, "AsyncSlurm.cancel_job")
+
+    async def cancel_all(self, timeout: Optional[float] = None):
+        """Cancels all jobs from the current user"""
+        await self._scancel(["--me"], timeout, "AsyncSlurm.cancel_all")
+
+    async def _scancel(self, args: List[str], timeout: Optional[float], caller: str):
+        returncode, _, stderr = await run_command(
+            ["scancel", *args], timeout=timeout, caller=caller
+        )
+        if returncode != 0:
+            raise RuntimeError(f"Error cancelling job: {stderr.strip()}")
+
+
+# squeue calls in progress, by event loop and command
+_squeue_flights = {}
+
+
+async def run_command(
+    args: List[str],
+    input: Optional[str] = None,
+    timeout: Optional[float] = None,
+    capture: bool = True,
+    caller: str = "AsyncSlurm",
+) -> tuple:
+    """Run a command in an asyncio subprocess, return the tuple
+    (returncode, stdout, stderr). The output is only captured (as text) if
+    'capture' is True, otherwise it is inherited from the current process.
+
+    On timeout ('asyncio.TimeoutError') or cancellation the process is killed.
+    The invocation is recorded as 'caller' (see 'simple_slurm.commands').
+    """
+    pipe = subprocess.PIPE if capture else None
+    with track(args, caller) as call:
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=subprocess.DEVNULL if input is None else subprocess.PIPE,
+            stdout=pipe,
+            stderr=pipe,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(None if input is None else input.encode()),
+                timeout,
+            )
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            raise
+        call.returncode = process.returncode
+        call.output_size = output_size(stdout) + output_size(stderr)
+    return (
+        process.returncode,
+        "" if stdout is None else stdout.decode(),
+        "" if stderr is None else stderr.decode(),
+    )
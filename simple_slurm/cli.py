@@ -1,27 +1,38 @@
 import argparse
+import collections
+import contextlib
+import json
+import sys
+from typing import Iterable, Iterator, List, Optional
 
-from .core import Slurm, fmt_key, read_simple_txt
+from .core import Slurm, fmt_key, get_schema, read_simple_txt
+from .journal import SubmissionJournal
+from .scancel import SlurmScancelWrapper
+from .squeue import SlurmSqueueWrapper, _job_id_key
 
 
-def cli():
+def cli(argv: Optional[List[str]] = None) -> int:
+    """Entry point of 'simple_slurm', either submitting a single command:
+        $ simple_slurm [OPTIONS] "COMMAND_TO_RUN_WITH_SBATCH"
+    or running one of the subcommands:
+        $ simple_slurm batch [OPTIONS] [--from FILE]
+        $ simple_slurm queue [--name NAME] [--states STATES] ...
+        $ simple_slurm cancel [JOB_ID ...] [--from FILE] [--name NAME] ...
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in SUBCOMMANDS:
+        return SUBCOMMANDS[argv[0]](argv[1:])
+
     __sbatch = "COMMAND_TO_RUN_WITH_SBATCH"
 
-    # initialize parser
-    parser = argparse.ArgumentParser(add_help=False)
-
-    # add arguments into argparser
-    arguments = read_simple_txt("arguments.txt")
-    arguments_help = read_simple_txt("arguments_help.txt", False)
-    for keys, help in zip(arguments, arguments_help):
-        parser.add_argument(
-            *(fmt_key(k) for k in keys), action=None if help else "store_true"
-        )
+    # initialize parser, with the slurm arguments
+    parser = slurm_parser()
 
     # add positional argument for sbatch command
     parser.add_argument(__sbatch, type=str)
 
     # retrieve given arguments into dict
-    kwargs = vars(parser.parse_args())
+    kwargs = vars(parser.parse_args(argv))
     kwargs = {k: v for k, v in kwargs.items() if v is not None}
 
     # retrieve sbatch command and remove it from kwargs dict
@@ -33,3 +44,185 @@ def cli():
     print(slurm)
     print(cmd)
     slurm.sbatch(cmd)
+    return 0
+
+
+def slurm_parser(**kwargs) -> argparse.ArgumentParser:
+    """Return a parser of the slurm arguments (the flags being 'store_true'),
+    the other options can then be added
+    """
+    parser = argparse.ArgumentParser(add_help=False, **kwargs)
+    arguments = get_schema().arguments
+    arguments_help = read_simple_txt("arguments_help.txt", False)
+    for keys, help in zip(arguments, arguments_help):
+        parser.add_argument(
+            *(fmt_key(k) for k in keys), action=None if help else "store_true"
+        )
+    return parser
+
+
+def batch(argv: List[str]) -> int:
+    """Submit many jobs concurrently, read from a file (or stdin), one per
+    line: either a command or a JSON object of slurm arguments, the command
+    being given by "cmd" (a string or a list of arguments), ex.
+        python train.py --lr 0.1
+        {"job_name": "lr_0.2", "cmd": "python train.py --lr 0.2"}
+    The slurm arguments given as options apply to every job. Writes a JSON
+    line per job, with its line number and job id (or error):
+        {"line": 1, "job_id": 1234}
+    """
+    options = ("from_file", "max_workers", "retries", "retry_delay", "journal")
+    parser = slurm_parser(prog="simple_slurm batch")
+    parser.add_argument("--from", dest="from_file", default="-")
+    parser.add_argument("--max_workers", type=int, default=8)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--retry_delay", type=float, default=1.0)
+    parser.add_argument("--journal")
+    kwargs = vars(parser.parse_args(argv))
+    options = {option: kwargs.pop(option) for option in options}
+    slurm = Slurm(**{k: v for k, v in kwargs.items() if v is not None})
+
+    sbatch_kwargs = {}
+    if options["journal"] is not None:
+        sbatch_kwargs["journal"] = SubmissionJournal(options["journal"])
+
+    failures = 0
+    with _open_input(options["from_file"]) as lines:
+        # line numbers of the jobs being submitted, in order
+        numbers = collections.deque()
+        errors = []
+        variants = _read_variants(slurm, lines, numbers, errors)
+        for job_id, error in slurm._sbatch_stream(
+            variants,
+            options["max_workers"],
+            options["retries"],
+            options["retry_delay"],
+            **sbatch_kwargs,
+        ):
+            failures += _write_errors(errors)
+            if error is None:
+                _write(line=numbers.popleft(), job_id=int(job_id))
+            else:
+                failures += 1
+                _write(line=numbers.popleft(), error=str(error) or repr(error))
+        failures += _write_errors(errors)
+    return 1 if failures else 0
+
+
+def queue(argv: List[str]) -> int:
+    """Write the jobs of the current user in the queue as JSON lines (with
+    the columns of 'SlurmSqueueWrapper')
+    """
+    parser = argparse.ArgumentParser(prog="simple_slurm queue")
+    parser.add_argument("--jobs", help="job ids, separated by commas")
+    parser.add_argument("--name", help="job names, separated by commas")
+    parser.add_argument("--states", help="ex. PD,R")
+    parser.add_argument("--partition", help="partitions, separated by commas")
+    args = parser.parse_args(argv)
+    jobs = SlurmSqueueWrapper().query(
+        job_ids=args.jobs, name=args.name, states=args.states, partitions=args.partition
+    )
+    for job in jobs.values():
+        _write(**job)
+    return 0
+
+
+def cancel(argv: List[str]) -> int:
+    """Cancel the given jobs (or send them a signal) with as few scancel
+    calls as possible. The job ids can also be read from a file (or stdin),
+    one per line or as the JSON lines written by 'batch'. Writes a JSON line
+    per job: {"job_id": 1234, "cancelled": true}
+    """
+    parser = argparse.ArgumentParser(prog="simple_slurm cancel")
+    parser.add_argument("job_ids", nargs="*")
+    parser.add_argument("--from", dest="from_file")
+    parser.add_argument("--name")
+    parser.add_argument("--state")
+    parser.add_argument("--partition")
+    parser.add_argument("--signal")
+    args = parser.parse_args(argv)
+
+    job_ids = [_job_id_key(job_id) for job_id in args.job_ids]
+    if args.from_file is not None:
+        with _open_input(args.from_file) as lines:
+            job_ids.extend(_read_job_ids(lines))
+    try:
+        failed = SlurmScancelWrapper().cancel_jobs(
+            job_ids,
+            name=args.name,
+            state=args.state,
+            partition=args.partition,
+            signal=args.signal,
+        )
+    except ValueError as error:
+        parser.error(str(error))
+    failed = set(failed)
+    for job_id in job_ids:
+        _write(job_id=job_id, cancelled=job_id not in failed)
+    return 1 if failed else 0
+
+
+SUBCOMMANDS = dict(batch=batch, queue=queue, cancel=cancel)
+
+
+@contextlib.contextmanager
+def _open_input(path: str):
+    """Open the given file, or use stdin for '-'"""
+    if path == "-":
+        yield sys.stdin
+    else:
+        with open(path) as fid:
+            yield fid
+
+
+def _read_variants(
+    slurm: Slurm, lines: Iterable[str], numbers: collections.deque, errors: list
+) -> Iterator[Slurm]:
+    """Yield the job of each line (see 'batch'), lazily. The line numbers of
+    the jobs are appended to 'numbers', the invalid lines to 'errors'.
+    """
+    aliases = get_schema().aliases
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            if line.startswith("{"):
+                spec = json.loads(line)
+                cmd = spec.pop("cmd", ())
+                unknown = sorted(key for key in spec if fmt_key(key) not in aliases)
+                if unknown:
+                    raise ValueError(f"Unknown arguments: {unknown}")
+                variant = slurm._variant((spec, cmd))
+            else:
+                variant = slurm._variant(line)
+        except (ValueError, TypeError, AttributeError) as error:
+            errors.append((number, error))
+            continue
+        numbers.append(number)
+        yield variant
+
+
+def _read_job_ids(lines: Iterable[str]) -> Iterator:
+    """Read the job ids, one per line or in JSON lines (as written by batch)"""
+    for line in lines:
+        line = line.strip()
+        if line.startswith("{"):
+            job_id = json.loads(line).get("job_id")
+            if job_id is not None:
+                yield job_id
+        elif line:
+            yield _job_id_key(line)
+
+
+def _write_errors(errors: list) -> int:
+    """Write (and forget) the invalid lines, return their number"""
+    count = len(errors)
+    for number, error in errors:
+        _write(line=number, error=str(error))
+    errors.clear()
+    return count
+
+
+def _write(**record):
+    print(json.dumps(record), flush=True)
@@ -0,0 +1,318 @@
+"""Central execution of the Slurm commands (sbatch, srun, squeue, scancel...).
+
+Every call made by the Slurm class and the wrappers goes through
+'run_command' (or 'track' for the streaming and asyncio calls), which:
+    - calls the pre hooks, before running the command
+    - records the call in 'metrics' (latency histogram, calls, failures,
+      retries and output size, per command and per caller)
+    - calls the post hooks, once the command is done
+ex.
+    > from simple_slurm import commands
+    > commands.add_hook(post=lambda call: print(call.command, call.duration))
+    > print(commands.metrics.to_prometheus())
+"""
+
+import bisect
+import contextlib
+import logging
+import os
+import subprocess
+import threading
+import time
+from typing import IO, Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# messages of the errors worth retrying (slurmctld busy or unreachable)
+TRANSIENT_MESSAGES = (
+    "socket timed out",
+    "try again",
+    "resource temporarily unavailable",
+    "unable to contact slurm controller",
+    "connection refused",
+)
+
+# upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class CommandCall:
+    """A single command invocation, as given to the hooks"""
+
+    def __init__(self, args, caller: str):
+        self.args = args
+        self.caller = caller
+        self.command = command_name(args)
+        self.start = time.time()
+        self.duration = None
+        self.returncode = None
+        self.output_size = 0
+        self.error = None
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None or self.returncode not in (None, 0)
+
+    def __repr__(self) -> str:
+        return (
+            f"CommandCall({self.command!r}, caller={self.caller!r}, "
+            f"returncode={self.returncode}, duration={self.duration})"
+        )
+
+
+class _Series:
+    """Counters of a (command, caller) pair"""
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.output_bytes = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+
+class CommandMetrics:
+    """Counters and latency histograms of the commands, per command and
+    caller, which can be exported in the Prometheus text format or as JSON
+    """
+
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, call: CommandCall):
+        """Record a finished call"""
+        with self._lock:
+            series = self._get(call.command, call.caller)
+            series.calls += 1
+            series.failures += call.failed
+            series.output_bytes += call.output_size
+            series.latency_sum += call.duration
+            series.latency_buckets[
+                bisect.bisect_left(LATENCY_BUCKETS, call.duration)
+            ] += 1
+
+    def record_retry(self, command: str, caller: str):
+        """Record that a failed call is being retried"""
+        with self._lock:
+            self._get(command, caller).retries += 1
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def _get(self, command: str, caller: str) -> _Series:
+        series = self._series.get((command, caller))
+        if series is None:
+            series = self._series[command, caller] = _Series()
+        return series
+
+    def snapshot(self) -> list:
+        """Return the metrics as a list of dicts, one per command and caller"""
+        with self._lock:
+            return [
+                dict(
+                    command=command,
+                    caller=caller,
+                    calls=series.calls,
+                    failures=series.failures,
+                    retries=series.retries,
+                    output_bytes=series.output_bytes,
+                    latency_sum=series.latency_sum,
+                    latency_buckets=dict(
+                        zip(
+                            [*map(str, LATENCY_BUCKETS), "+Inf"],
+                            series.latency_buckets,
+                        )
+                    ),
+                )
+                for (command, caller), series in sorted(self._series.items())
+            ]
+
+    def to_json(self) -> str:
+        import json
+
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        """Export the metrics in the Prometheus text format"""
+        lines = []
+        snapshot = self.snapshot()
+        for name, kind, key, help in (
+            ("calls_total", "counter", "calls", "Command invocations"),
+            ("failures_total", "counter", "failures", "Failed invocations"),
+            ("retries_total", "counter", "retries", "Retried invocations"),
+            ("output_bytes_total", "counter", "output_bytes", "Output size"),
+        ):
+            lines.append(f"# HELP simple_slurm_command_{name} {help}")
+            lines.append(f"# TYPE simple_slurm_command_{name} {kind}")
+            for series in snapshot:
+                labels = _labels(series)
+                lines.append(f"simple_slurm_command_{name}{{{labels}}} {series[key]}")
+
+        name = "simple_slurm_command_duration_seconds"
+        lines.append(f"# HELP {name} Duration of the invocations")
+        lines.append(f"# TYPE {name} histogram")
+        for series in snapshot:
+            labels = _labels(series)
+            cumulative = 0
+            for bound, count in series["latency_buckets"].items():
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {series['latency_sum']}")
+            lines.append(f"{name}_count{{{labels}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, format: str = "prometheus"):
+        """Write the metrics to 'path' ("prometheus" or "json" format), ex.
+        for the textfile collector of the Prometheus node exporter
+        """
+        text = self.to_json() if format == "json" else self.to_prometheus()
+        # written atomically, as it may be read at any time
+        with open(path + ".tmp", "w") as fid:
+            fid.write(text)
+        os.replace(path + ".tmp", path)
+
+
+def _labels(series: dict) -> str:
+    return ",".join(f'{key}="{_escape(series[key])}"' for key in ("command", "caller"))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# metrics of all the commands run in this process
+metrics = CommandMetrics()
+
+_pre_hooks = []
+_post_hooks = []
+
+
+def add_hook(
+    pre: Optional[Callable[[CommandCall], None]] = None,
+    post: Optional[Callable[[CommandCall], None]] = None,
+):
+    """Register functions called with the 'CommandCall' before ('pre') and
+    after ('post') every command. An exception raised by a pre hook aborts
+    the command, those raised by post hooks are logged.
+    """
+    if pre is not None:
+        _pre_hooks.append(pre)
+    if post is not None:
+        _post_hooks.append(post)
+
+
+def remove_hook(
+    pre: Optional[Callable[[CommandCall], None]] = None,
+    post: Optional[Callable[[CommandCall], None]] = None,
+):
+    """Unregister hooks added with 'add_hook'"""
+    if pre is not None:
+        _pre_hooks.remove(pre)
+    if post is not None:
+        _post_hooks.remove(post)
+
+
+def command_name(args) -> str:
+    """Name of the command run by 'args' (a list or a shell command line)"""
+    if isinstance(args, str):
+        args = args.split(None, 1) or [""]
+    return os.path.basename(str(args[0]))
+
+
+@contextlib.contextmanager
+def track(args, caller: str):
+    """Context manager recording the invocation of 'args' run within it. It
+    yields the 'CommandCall', whose 'returncode' (and 'output_size') must be
+    set by the caller. Used within a generator, the consumer stopping early
+    (GeneratorExit) is not a failure.
+    """
+    call = CommandCall(args, caller)
+    for hook in list(_pre_hooks):
+        hook(call)
+    start = time.perf_counter()
+    try:
+        yield call
+    except GeneratorExit:
+        raise
+    except BaseException as error:
+        call.error = error
+        if isinstance(error, subprocess.CalledProcessError):
+            call.returncode = error.returncode
+        raise
+    finally:
+        call.duration = time.perf_counter() - start
+        metrics.observe(call)
+        for hook in list(_post_hooks):
+            try:
+                hook(call)
+            except Exception:
+                logger.exception(f"Error in the post hook {hook!r}")
+
+
+def run_command(args, caller: str, **kwargs) -> subprocess.CompletedProcess:
+    """Run 'args' with 'subprocess.run' (given the other arguments) and
+    record the invocation, see 'track'
+    """
+    with track(args, caller) as call:
+        result = subprocess.run(args, **kwargs)
+        call.returncode = result.returncode
+        call.output_size = output_size(result.stdout) + output_size(result.stderr)
+    return result
+
+
+def stream_command(args, caller: str, parse: Callable[[IO[str]], Iterator]) -> Iterator:
+    """Run 'args' and yield the items parsed by 'parse' from its standard
+    output as it is written, recording the invocation (see 'track'). The
+    command is killed if the consumer stops early, a RuntimeError is raised
+    if it fails.
+    """
+    with track(args, caller) as call:
+        process = subprocess.Popen(
+            args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        completed = False
+        try:
+            yield from parse(process.stdout)
+            completed = True
+        finally:
+            if not completed:
+                process.kill()
+            process.stdout.close()
+            stderr = process.stderr.read()
+            process.stderr.close()
+            returncode = process.wait()
+            if completed:
+                call.returncode = returncode
+    if returncode != 0:
+        raise RuntimeError(f"Error running {call.command}: {stderr}")
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Whether a failed command is worth retrying: timeouts, system errors
+    and the messages of a busy (or unreachable) slurmctld. The others (ex.
+    an invalid partition or option) fail again.
+    """
+    if isinstance(error, (OSError, subprocess.TimeoutExpired)):
+        return True
+    message = str(error).lower()
+    return any(pattern in message for pattern in TRANSIENT_MESSAGES)
+
+
+def record_retry(command, caller: str):
+    """Record that a failed command ('args' or a command line, as for
+    'track') is being retried
+    """
+    metrics.record_retry(command_name(command), caller)
+
+
+def output_size(output) -> int:
+    """Size (in bytes) of a captured output (None if it was not captured)"""
+    if output is None:
+        return 0
+    return len(output.encode() if isinstance(output, str) else output)
@@ -1,60 +1,101 @@
 import argparse
+import collections
 import datetime
+import itertools
 import math
 import os
+import shlex
 import subprocess
-from typing import Iterable
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Union
 
+from simple_slurm.commands import is_transient_error, record_retry, run_command
 from simple_slurm.squeue import SlurmSqueueWrapper
 from simple_slurm.scancel import SlurmScancelWrapper
 
+# the other modules (sqlite3, concurrent.futures, fcntl...) are imported by
+# the methods using them, so that importing the package stays cheap
+if TYPE_CHECKING:
+    from simple_slurm.farm import TaskFarm
+    from simple_slurm.job_array import JobArray
+    from simple_slurm.journal import SubmissionJournal
+    from simple_slurm.script_store import ScriptStore
+
 IGNORE_BOOLEAN = "IGNORE_BOOLEAN"
 
 
-class Slurm:
+class _SlurmMeta(type):
+    """Metaclass of Slurm, defining the setter methods, filename patterns and
+    output environment variables (ex. 'Slurm.SLURM_ARRAY_TASK_ID') when any
+    of them is first accessed, so that importing the package reads no file.
+    """
+
+    def __getattr__(cls, name: str):
+        if name.startswith("_") or _schema is not None:
+            raise AttributeError(
+                f"type object {cls.__name__!r} has no attribute {name!r}"
+            )
+        get_schema()
+        return getattr(cls, name)
+
+    def __dir__(cls) -> list:
+        get_schema()
+        return super().__dir__()
+
+
+class Slurm(metaclass=_SlurmMeta):
     """Simple Slurm class for running sbatch commands.
 
     See https://slurm.schedmd.com/sbatch.html for a complete list of arguments
     accepted by the sbatch command (ex. -a, --array).
 
-    Validation of arguments is handled by the argparse module.
+    Validation of arguments is handled by a precompiled table of the accepted
+    keys, falling back to the argparse module for anything else.
 
     Multiple syntaxes are allowed for defining the arguments.
     """
 
+    # whether 'sbatch' and 'srun' run their command through a local shell (the
+    # original behavior), set it at the class level to modify the default of
+    # all objects
+    use_shell = True
+
     def __init__(self, *args, **kwargs):
         """Initialize the parser with the given arguments."""
 
-        # initialize parser
+        # the argument schema (aliases, setters, static attributes) is built
+        # only once and shared by all Slurm objects
+        get_schema()
+
+        # initialize namespace
         self.namespace = Namespace()
-        self.parser = argparse.ArgumentParser()
         self.squeue = SlurmSqueueWrapper()
         self.scancel = SlurmScancelWrapper()
 
         # set default shell
         self.set_shell()
 
-        # add arguments into argparser
-        for keys in read_simple_txt("arguments.txt"):
-            self.parser.add_argument(*(fmt_key(k) for k in keys))
-
-        # create setter methods for each argument
-        for keys in read_simple_txt("arguments.txt"):
-            create_setter_method(keys[0])
-
-        # add filename patterns as static variables
-        for pattern in read_simple_txt("filename_patterns.txt"):
-            setattr(Slurm, *pattern)
-
-        # add output environment variables as static variables
-        for (var,) in read_simple_txt("output_env_vars.txt"):
-            setattr(Slurm, var, "$" + var)
+        # rendered "#SBATCH" lines (per argument) and header, only updated
+        # when the corresponding arguments change, and the arguments they
+        # were rendered from
+        self._header_lines = {}
+        self._header = None
+        self._header_from = {}
+        # snapshot of the arguments shared by the derived objects (see
+        # 'derive'), taken again when the arguments change
+        self._template = None
 
         # add provided arguments in constructor
         self.add_arguments(*args, **kwargs)
 
         # contain a list of "single-line" commands to dispatch
         self.run_cmds = []
+        # the same commands, with '$' escaped once when they are added, and
+        # the commands they were escaped from
+        self._escaped_cmds = []
+        self._escaped_from = []
 
     def __str__(self) -> str:
         """Print the generated sbatch script."""
@@ -66,11 +107,37 @@ class Slurm:
         params["run_cmds"] = self.run_cmds
         return repr(params)
 
+    @property
+    def parser(self) -> argparse.ArgumentParser:
+        """The argparse parser shared by all Slurm objects"""
+        return get_schema().parser
+
     def _add_one_argument(self, key: str, value: str):
-        """Parse the given key-value pair (the argument is given in key)."""
+        """Parse the given key-value pair (the argument is given in key).
+
+        Exact keys are resolved through the precompiled alias table of the
+        schema. Anything else (abbreviated or unknown keys, option-like
+        values) goes through argparse, which keeps its error messages.
+        """
         key, value = fmt_key(key), fmt_value(value)
-        if value is not IGNORE_BOOLEAN:
+        if value is IGNORE_BOOLEAN:
+            return
+        schema = get_schema()
+        dest = schema.aliases.get(key)
+        self._header = None
+        self._template = None
+        if dest is None or value.startswith("-"):
+            # the modified argument is not known beforehand
+            self._header_lines.clear()
             self.parser.parse_args([key, value], namespace=self.namespace)
+            return
+        self._header_lines.pop(dest, None)
+        arguments = vars(self.namespace)
+        if dest not in arguments:
+            # as argparse does, initialize every argument (keeps the order)
+            for default_key in schema.defaults:
+                arguments.setdefault(default_key, None)
+        arguments[dest] = value
 
     def add_arguments(self, *args, **kwargs):
         """Parse the given key-value pairs.
@@ -99,12 +166,68 @@ class Slurm:
         """
         cmd = " ".join([str(cmd) for cmd in cmd_args]).strip()
         if len(cmd):
+            escaped_cmds = self._escaped_commands()
             self.run_cmds.append(cmd)
+            self._escaped_from.append(cmd)
+            escaped_cmds.append(cmd.replace("$", "\\$"))
         return self
 
     def reset_cmd(self):
         """Reset the command list"""
         self.run_cmds = []
+        self._escaped_cmds = []
+        self._escaped_from = []
+
+    def _clone(self) -> "Slurm":
+        """Return an independent copy of this object, with its own arguments
+        and commands
+        """
+        clone = type(self).__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone.namespace = Namespace()
+        vars(clone.namespace).update(vars(self.namespace))
+        clone.run_cmds = list(self.run_cmds)
+        clone._escaped_cmds = list(self._escaped_cmds)
+        clone._escaped_from = list(self._escaped_from)
+        clone._header_lines = dict(self._header_lines)
+        return clone
+
+    def derive(self, **overrides) -> "Slurm":
+        """Return a lightweight copy of this object with the given arguments
+        overridden, ex.
+            > base = Slurm(partition="gpu", time="02:00:00", output="%j.out")
+            > variant = base.derive(job_name="lr_0.1", cpus_per_task=8)
+            > variant.sbatch("python train.py --lr 0.1")
+
+        The derived object shares the (validated) arguments and the rendered
+        "#SBATCH" lines of this one, as they were when 'derive' was called,
+        and only stores its overrides: rendering its script formats the
+        overridden lines only. It can be modified, rendered and submitted as
+        any Slurm object, independently of this one (and from another thread).
+        """
+        return DerivedSlurm(self, overrides)
+
+    def grid(self, **param_lists) -> Iterator["Slurm"]:
+        """Yield a derived object (see 'derive') for each combination of the
+        given argument values (their Cartesian product), ex.
+            > for variant in slurm.grid(partition=["cpu", "gpu"], mem=["4G", "8G"]):
+            >     variant.sbatch("python main.py")
+        The combinations are generated lazily, in the order of
+        'itertools.product', and can also be given to 'sbatch_many'.
+        """
+        keys = list(param_lists)
+        for values in itertools.product(*param_lists.values()):
+            yield self.derive(**dict(zip(keys, values)))
+
+    def _get_template(self) -> tuple:
+        """Return the snapshot (arguments, rendered lines) shared by the
+        derived objects, taken again only when the arguments change
+        """
+        arguments = vars(self.namespace)
+        if self._template is None or self._template[0] != arguments:
+            self._render_header()
+            self._template = (dict(arguments), dict(self._header_lines))
+        return self._template
 
     @staticmethod
     def _valid_key(key: str) -> str:
@@ -119,27 +242,58 @@ class Slurm:
         if shell is None:
             shell = self.shell
 
-        arguments = (
-            "\n".join(
-                (
-                    f"#!{shell}",
-                    "",
-                    *(
-                        f"#SBATCH --{self._valid_key(k):<19} {v}"
-                        for k, v in vars(self.namespace).items()
-                        if v is not None
-                    ),
-                )
-            )
-            + "\n"
-        )
-        commands = "\n".join(
-            [cmd.replace("$", "\\$") if convert else cmd for cmd in self.run_cmds]
-        )
+        header = self._render_header()
+        arguments = f"#!{shell}\n\n" + (header + "\n" if header else "")
+        commands = "\n".join(self._escaped_commands() if convert else self.run_cmds)
         script = "\n".join((arguments, commands)).strip() + "\n"
         return script
 
-    def srun(self, *run_cmd: str, connector: str = ";", srun_cmd: str = "srun") -> int:
+    def _render_header(self) -> str:
+        """Return the "#SBATCH" lines of the set arguments. Each line is only
+        formatted again when its argument changes.
+        """
+        arguments = vars(self.namespace)
+        if arguments != self._header_from:
+            # changed by 'add_arguments', or directly (ex. 'namespace.job_name'
+            # or argparse): the lines of the changed arguments are dropped
+            previous = self._header_from
+            for k, v in arguments.items():
+                if previous.get(k) != v:
+                    self._header_lines.pop(k, None)
+            self._header = None
+        if self._header is None:
+            lines = self._header_lines
+            rendered = []
+            for k, v in arguments.items():
+                if v is not None:
+                    line = lines.get(k)
+                    if line is None:
+                        line = lines[k] = self._header_line(k, v)
+                    rendered.append(line)
+            self._header = "\n".join(rendered)
+            self._header_from = dict(arguments)
+        return self._header
+
+    @classmethod
+    def _header_line(cls, key: str, value: str) -> str:
+        return f"#SBATCH --{cls._valid_key(key):<19} {value}"
+
+    def _escaped_commands(self) -> List[str]:
+        """Return the commands with '$' escaped (for the 'here document')"""
+        if self._escaped_from != self.run_cmds:
+            # the command list was modified or replaced directly (the
+            # comparison is cheap, the same strings being compared by identity)
+            self._escaped_from = list(self.run_cmds)
+            self._escaped_cmds = [cmd.replace("$", "\\$") for cmd in self.run_cmds]
+        return self._escaped_cmds
+
+    def srun(
+        self,
+        *run_cmd: str,
+        connector: str = ";",
+        srun_cmd: str = "srun",
+        use_shell: Optional[bool] = None,
+    ) -> int:
         """Run the srun command with all the (previously) set arguments and
         the provided commands in 'run_cmd' alongside with the previously set
         commands using 'add_cmd'.
@@ -154,18 +308,32 @@ class Slurm:
             - A ; B   : Run A and then B, regardless of success of A.
             - A && B  : Run B if and only if A succeeded.
             - A || B  : Run B if and only if A failed.
+
+        By default, the srun call is run by a local shell. If 'use_shell' is
+        False (see 'Slurm.use_shell'), srun is run directly and the commands
+        are run by the shell ('set_shell') inside the job step, ie.
+            $ srun [arguments] /bin/sh -c "command_1 ; command_2"
+        so that the arguments need no quoting.
         """
-        args = (
-            f"--{self._valid_key(k)}" + f"={v}" if len(v) else ""
-            for k, v in vars(self.namespace).items()
-            if v is not None
-        )
+        args = self._srun_arguments()
         self.add_cmd(*run_cmd)
         commands = f" {connector} ".join(self.run_cmds)
-        cmd = " ".join((srun_cmd, *args, commands))
-        result = subprocess.run(cmd, shell=True, check=True)
+        if self.use_shell if use_shell is None else use_shell:
+            cmd = " ".join((srun_cmd, *args, commands))
+            result = run_command(cmd, "Slurm.srun", shell=True, check=True)
+        else:
+            cmd = [*shlex.split(srun_cmd), *args, self.shell, "-c", commands]
+            result = run_command(cmd, "Slurm.srun", check=True)
         return result.returncode
 
+    def _srun_arguments(self) -> List[str]:
+        """Format the set arguments as srun options (ex. '--job-name=name')"""
+        return [
+            f"--{self._valid_key(k)}" + (f"={v}" if len(v) else "")
+            for k, v in vars(self.namespace).items()
+            if v is not None
+        ]
+
     @property
     def is_parsable(self) -> bool:
         return getattr(self.namespace, "parsable", None) is not None
@@ -177,7 +345,9 @@ class Slurm:
         verbose: bool = True,
         sbatch_cmd: str = "sbatch",
         shell: str = None,
-        job_file: str = None,
+        job_file: Union[str, "ScriptStore"] = None,
+        journal: Optional["SubmissionJournal"] = None,
+        use_shell: Optional[bool] = None,
     ) -> int:
         """Run the sbatch command with all the (previously) set arguments and
         the provided command in 'run_cmd' alongside with the previously set
@@ -203,9 +373,19 @@ class Slurm:
         the '$' should be scaped into '\\$'. This behavior is default, set
         'convert' to False to disable it.
 
-        If the argument 'job_file' is used, the script will be written to the
-        designated file, and then the command `sbatch <job_file>` will be
-        executed.
+        If the argument 'job_file' is used, the script will be written
+        (atomically) to the designated file, and then the command
+        `sbatch <job_file>` will be executed. 'job_file' can also be a
+        'ScriptStore', storing the script under its content hash.
+
+        If 'use_shell' is False (see 'Slurm.use_shell'), sbatch is run directly
+        (without any intermediate shell) and the script is given through its
+        standard input, or written to 'job_file'. As no shell is involved, the
+        '$' of bash variables are never escaped ('convert' is ignored).
+
+        If a 'journal' (see 'SubmissionJournal') is given, the submission is
+        skipped when the same script was already submitted, and the recorded
+        job id is returned instead.
         """
         if shell is None:
             shell = self.shell
@@ -213,38 +393,474 @@ class Slurm:
             self.set_shell(shell)
 
         self.add_cmd(*run_cmd)
+        use_shell = self.use_shell if use_shell is None else use_shell
+        script = self.script(shell, convert and use_shell)
+        if journal is not None:
+            digest = journal.digest(script)
+            job_id = journal.lookup(digest)
+            if job_id is not None:
+                if verbose:
+                    print(f"Job already submitted: {job_id}")
+                return SlurmJob(job_id, self.squeue)
+
         if job_file is not None:
-            with open(job_file, "w") as fid:
-                fid.write(self.script(shell, convert))
-            cmd = sbatch_cmd + " " + job_file
+            from simple_slurm.script_store import ScriptStore, write_atomic
+
+            if isinstance(job_file, ScriptStore):
+                job_file = job_file.put(script)
+            else:
+                write_atomic(job_file, script)
+        if not use_shell:
+            cmd = shlex.split(sbatch_cmd) + ([] if job_file is None else [job_file])
+            result = run_command(
+                cmd,
+                "Slurm.sbatch",
+                input=None if job_file is not None else script.encode(),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
         else:
-            cmd = "\n".join(
-                (
-                    sbatch_cmd + " << EOF",
-                    self.script(shell, convert),
-                    "EOF",
-                )
+            if job_file is not None:
+                cmd = sbatch_cmd + " " + job_file
+            else:
+                cmd = "\n".join((sbatch_cmd + " << EOF", script, "EOF"))
+            result = run_command(
+                cmd,
+                "Slurm.sbatch",
+                shell=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
             )
-        result = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE)
+        job_id, stdout = self._parse_sbatch_output(
+            result.stdout.decode(), result.returncode, result.stderr.decode()
+        )
+        if journal is not None and job_id is not None:
+            journal.record(digest, job_id, self._journal_arguments())
+        if verbose:
+            print(stdout)
+        return SlurmJob(job_id, self.squeue)
+
+    def _journal_arguments(self) -> dict:
+        """Arguments and commands of the job, as recorded in a journal"""
+        arguments = {k: v for k, v in vars(self.namespace).items() if v is not None}
+        return dict(arguments=arguments, commands=self.run_cmds)
+
+    def output_paths(
+        self,
+        job_id: int,
+        stream: str = "output",
+        task_job_ids: Optional[dict] = None,
+    ) -> dict:
+        """Return the output files (or the error files, with stream="error")
+        of a job submitted by this object, as {array_task_id: path} (with a
+        single None key if it is not a job array), ex.
+            > slurm = Slurm(array=range(100), output=f"logs/{Slurm.JOB_ARRAY_MASTER_ID}_{Slurm.JOB_ARRAY_ID}.out")
+            > job_id = slurm.sbatch("python main.py")
+            > slurm.output_paths(job_id)  # {0: '/home/user/logs/1234_0.out', ...}
+
+        The job ids of the array tasks ('task_job_ids') are only needed if
+        the pattern uses 'Slurm.JOB_ID'. Without '--error', the errors are
+        written to the output files. See 'LogTailer' to follow these files.
+        """
+        if stream not in ("output", "error"):
+            raise ValueError(f"Unknown stream {stream!r}, expected output or error")
+        from simple_slurm.logs import output_paths
+
+        arguments = vars(self.namespace)
+        pattern = arguments.get(stream) or None
+        if stream == "error" and pattern is None:
+            pattern = arguments.get("output") or None
+        return output_paths(
+            job_id,
+            pattern,
+            array=arguments.get("array"),
+            job_name=arguments.get("job_name"),
+            directory=arguments.get("chdir"),
+            task_job_ids=task_job_ids,
+        )
+
+    def wait(self, job_ids: Iterable[int], timeout: float = None, **kwargs) -> dict:
+        """Wait for the given jobs to finish and return their final states,
+        as a dict {job_id: state}. See 'SlurmSqueueWrapper.wait' for the
+        other arguments.
+        """
+        return self.squeue.wait(job_ids, timeout=timeout, **kwargs)
+
+    def _parse_sbatch_output(self, stdout: str, returncode: int, stderr) -> tuple:
+        """Retrieve the job id from the output of sbatch, return the pair
+        (job_id, stdout)
+        """
         # init for clarity
         job_id = None
-        stdout = ""
         if self.is_parsable:
+            # checked first, so that the error message is that of sbatch
+            assert returncode == 0, stderr
             # gather the first line from stdout
-            stdout = result.stdout.decode().strip()
+            stdout = stdout.strip()
             # parsable will be of format job_id[:cluster]
             # ref: https://slurm.schedmd.com/sbatch.html#OPT_parsable
             job_id = int(stdout.split(":")[0])
-            assert result.returncode == 0, result.stderr
         else:
             success_msg = "Submitted batch job"
-            stdout = result.stdout.decode()
-            assert success_msg in stdout, result.stderr
+            assert success_msg in stdout, stderr
             job_id = int(stdout.split(" ")[3])
         assert job_id is not None, "this should never happen, assert for linter"
-        if verbose:
-            print(stdout)
-        return job_id
+        return job_id, stdout
+
+    def sbatch_many(
+        self,
+        variants: Iterable,
+        max_workers: int = 8,
+        retries: int = 2,
+        retry_delay: float = 1.0,
+        raise_errors: bool = True,
+        **sbatch_kwargs,
+    ) -> List[Optional[int]]:
+        """Submit many variants of this job concurrently and return their job
+        ids, in the same order as 'variants'.
+
+        Each variant is built from a copy of this object (which is not
+        modified) and can be given as:
+            - a dict of arguments overriding the current ones
+            - a command (string) to be run, as in 'sbatch'
+            - a pair (arguments, command), the command being a string or a
+              sequence of strings
+            - a Slurm object (ex. from 'derive' or 'grid'), submitted as is
+        For example:
+            > slurm.sbatch_many([
+            >     (dict(job_name="lr_0.1"), "python train.py --lr 0.1"),
+            >     (dict(job_name="lr_0.2"), ("python", "train.py", "--lr", 0.2)),
+            > ])
+
+        Up to 'max_workers' submissions run in parallel. A submission failing
+        with a transient error (see 'commands.is_transient_error', ex. a
+        timeout of slurmctld) is retried up to 'retries' times, waiting
+        'retry_delay' seconds (doubled after each attempt), the other errors
+        are not retried. If it still fails the error is raised,
+        unless 'raise_errors' is False, in which case its job id is None. On
+        an error, the submissions not started yet are cancelled and the error
+        is raised once the running ones are done, with the job ids of the
+        variants read so far (None if not submitted) in 'error.job_ids'.
+
+        Any other argument (ex. 'convert', 'sbatch_cmd') is passed to 'sbatch',
+        note that 'verbose' defaults to False. With a 'journal', a restarted
+        driver skips the variants that were already submitted.
+        """
+        job_ids = []
+        first_error = None
+        stop = threading.Event()
+        for job_id, error in self._sbatch_stream(
+            variants, max_workers, retries, retry_delay, stop, **sbatch_kwargs
+        ):
+            if error is not None and raise_errors and first_error is None:
+                first_error = error
+                stop.set()
+            job_ids.append(job_id)
+        if first_error is not None:
+            first_error.job_ids = job_ids
+            raise first_error
+        return job_ids
+
+    def sbatch_array(
+        self,
+        tasks: Iterable,
+        task_file: str,
+        command: Optional[str] = None,
+        throttle: Optional[int] = None,
+        max_array_size: Optional[int] = None,
+        **sbatch_kwargs,
+    ) -> "JobArray":
+        """Pack many similar tasks into a single job array, instead of
+        submitting one job per task.
+
+        The command line of each task is written to 'task_file' (one per
+        line), and each array task runs its own line, found with
+        'Slurm.SLURM_ARRAY_TASK_ID'. Tasks are commands, or the parameters of
+        the 'command' template (see 'format_tasks'), ex.
+            > slurm.sbatch_array(
+            >     [dict(lr=0.1), dict(lr=0.2)],
+            >     "tasks.txt",
+            >     command="python train.py --lr {lr}",
+            >     throttle=50,  # at most 50 tasks running at once
+            > )
+
+        Slurm limits the size of job arrays (MaxArraySize), 'max_array_size'
+        splits the tasks into several job arrays of at most this size.
+
+        The previously set arguments and commands are kept (the latter run
+        before the task) and this object is not modified. Any other argument
+        is passed to 'sbatch'. Returns a JobArray, mapping the tasks to their
+        array task ids.
+        """
+        from simple_slurm.job_array import JobArray, format_tasks, task_lookup_cmd
+
+        tasks = list(tasks)
+        lines = format_tasks(tasks, command)
+        if not lines:
+            raise ValueError("No task to submit")
+        with open(task_file, "w") as fid:
+            fid.write("\n".join(lines) + "\n")
+
+        chunk_size = len(lines) if max_array_size is None else max_array_size
+        job_ids = []
+        for offset in range(0, len(lines), chunk_size):
+            size = min(chunk_size, len(lines) - offset)
+            array = fmt_value(range(size))
+            if throttle is not None:
+                array += f"%{throttle}"
+            slurm = self._clone()
+            slurm.set_array(array)
+            slurm.add_cmd(
+                task_lookup_cmd(
+                    os.path.abspath(task_file), Slurm.SLURM_ARRAY_TASK_ID, offset
+                )
+            )
+            job_ids.append(slurm.sbatch(**sbatch_kwargs))
+        return JobArray(job_ids, tasks, task_file, chunk_size)
+
+    def sbatch_farm(
+        self,
+        directory: str,
+        tasks: Optional[Iterable[str]] = None,
+        mode: str = "worker",
+        python: str = sys.executable,
+        srun_cmd: str = "srun",
+        **sbatch_kwargs,
+    ) -> "TaskFarm":
+        """Run many short commands inside a single allocation, instead of
+        submitting one job per command.
+
+        The commands are those given in 'tasks' or, if None, the previously
+        set commands ('add_cmd'). They are written to 'directory' (which must
+        be reachable from the compute nodes), alongside a results file
+        recording the exit code of each command.
+
+        The commands are dispatched (see 'simple_slurm.farm') either by
+        workers claiming the next pending command (mode "worker") or in
+        batches with 'srun --multi-prog' (mode "multi-prog"). In both cases
+        '--ntasks' commands run concurrently, each with '--cpus-per-task'
+        CPUs, ex.
+            > slurm = Slurm(ntasks=16, cpus_per_task=2, time="02:00:00")
+            > farm = slurm.sbatch_farm("farm", tasks=commands)
+            > farm.failed()  # {index: exit_code}, once the job is done
+
+        'python' is the interpreter running the workers on the compute nodes.
+        This object is not modified and any other argument is passed to
+        'sbatch'.
+        """
+        from simple_slurm.farm import FARM_MODES, TaskFarm, farm_commands
+        from simple_slurm.job_array import format_tasks
+
+        if mode not in FARM_MODES:
+            raise ValueError(
+                f"Unknown farm mode {mode!r}, expected one of {FARM_MODES}"
+            )
+        slurm = self._clone()
+        if tasks is None:
+            tasks = self.run_cmds
+            slurm.reset_cmd()
+        tasks = format_tasks(tasks)
+        if not tasks:
+            raise ValueError("No task to run")
+
+        directory = os.path.abspath(directory)
+        os.makedirs(directory, exist_ok=True)
+        for name in ("results.tsv", "counter"):
+            if os.path.exists(os.path.join(directory, name)):
+                os.remove(os.path.join(directory, name))
+        with open(os.path.join(directory, "tasks.txt"), "w") as fid:
+            fid.write("\n".join(tasks) + "\n")
+
+        ntasks = int(getattr(self.namespace, "ntasks", None) or 1)
+        for cmd in farm_commands(directory, ntasks, mode, python, self.shell, srun_cmd):
+            slurm.add_cmd(cmd)
+        job_id = slurm.sbatch(**sbatch_kwargs)
+        return TaskFarm(job_id, tasks, directory)
+
+    def _sbatch_stream(
+        self,
+        variants: Iterable,
+        max_workers: int = 8,
+        retries: int = 2,
+        retry_delay: float = 1.0,
+        stop: Optional[threading.Event] = None,
+        **sbatch_kwargs,
+    ):
+        """Submit the variants (see 'sbatch_many') and yield a pair
+        (job_id, error) for each of them, in order. At most 2 * max_workers
+        submissions are pending at any time, so 'variants' may be a lazy
+        iterable of any length. Once 'stop' is set, no other variant is read
+        and the submissions not started yet are cancelled (their error being
+        a CancelledError).
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        sbatch_kwargs.setdefault("verbose", False)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = collections.deque()
+            for variant in variants:
+                if stop is not None and stop.is_set():
+                    break
+                # arguments are validated here, not in the worker threads
+                slurm = self._variant(variant)
+                pending.append(
+                    executor.submit(
+                        slurm._sbatch_with_retries, retries, retry_delay, sbatch_kwargs
+                    )
+                )
+                if len(pending) >= 2 * max_workers:
+                    yield _future_result(pending.popleft())
+            while pending:
+                if stop is not None and stop.is_set():
+                    for future in pending:
+                        future.cancel()
+                yield _future_result(pending.popleft())
+
+    def _variant(self, variant) -> "Slurm":
+        """Return a copy of this object updated with the given variant"""
+        if isinstance(variant, Slurm):
+            return variant
+        if isinstance(variant, str):
+            arguments, run_cmd = {}, (variant,)
+        elif isinstance(variant, dict):
+            arguments, run_cmd = variant, ()
+        else:
+            arguments, run_cmd = variant
+            if isinstance(run_cmd, str):
+                run_cmd = (run_cmd,)
+        slurm = self._clone()
+        slurm.add_arguments(**arguments)
+        slurm.add_cmd(*run_cmd)
+        return slurm
+
+    def _sbatch_with_retries(
+        self, retries: int, retry_delay: float, sbatch_kwargs: dict
+    ) -> int:
+        """Run 'sbatch', retrying on transient errors"""
+        for attempt in range(retries + 1):
+            try:
+                return self.sbatch(**sbatch_kwargs)
+            except Exception as error:
+                if attempt == retries or not is_transient_error(error):
+                    raise
+                record_retry(sbatch_kwargs.get("sbatch_cmd", "sbatch"), "Slurm.sbatch")
+                time.sleep(retry_delay * 2**attempt)
+
+
+class DerivedSlurm(Slurm):
+    """Copy-on-write variant of a Slurm object (see 'Slurm.derive').
+
+    The arguments of the parent are shared until the namespace of the derived
+    object is first accessed (ex. to add arguments), when they are copied.
+    """
+
+    def __init__(self, parent: Slurm, overrides: dict):
+        # taken first, as it copies the arguments of a derived parent
+        base = parent._get_template()
+        self.__dict__.update(parent.__dict__)
+        self.__dict__.pop("namespace", None)
+        self._base = base
+        self.run_cmds = list(parent.run_cmds)
+        self._escaped_cmds = list(parent._escaped_commands())
+        self._escaped_from = list(parent.run_cmds)
+        self._header_lines = {}
+        self._header = None
+        self._header_from = {}
+        self._template = None
+
+        # validate the overrides as 'add_arguments' does
+        self.overrides = {}
+        schema = get_schema()
+        for key, value in overrides.items():
+            key, value = fmt_key(key), fmt_value(value)
+            if value is IGNORE_BOOLEAN:
+                continue
+            dest = schema.aliases.get(key)
+            if dest is None or value.startswith("-"):
+                namespace = self.parser.parse_args([key, value], namespace=Namespace())
+                for dest, value in vars(namespace).items():
+                    if value is not None:
+                        self.overrides[dest] = value
+            else:
+                self.overrides[dest] = value
+
+    @property
+    def namespace(self) -> "Namespace":
+        namespace = self.__dict__.get("namespace")
+        if namespace is None:
+            # copy the shared arguments, in the order argparse would use
+            arguments, lines = self._base
+            namespace = Namespace()
+            values = vars(namespace)
+            values.update(arguments)
+            if any(dest not in values for dest in self.overrides):
+                for default_key in get_schema().defaults:
+                    values.setdefault(default_key, None)
+            values.update(self.overrides)
+            self._header_lines = {
+                k: v for k, v in lines.items() if k not in self.overrides
+            }
+            self._header = None
+            self._header_from = arguments
+            self.__dict__["namespace"] = namespace
+        return namespace
+
+    @namespace.setter
+    def namespace(self, namespace: "Namespace"):
+        self.__dict__["namespace"] = namespace
+
+    def _add_one_argument(self, key: str, value: str):
+        self.namespace  # copy the shared arguments before modifying them
+        super()._add_one_argument(key, value)
+
+    @property
+    def is_parsable(self) -> bool:
+        if "namespace" in self.__dict__:
+            return super().is_parsable
+        parsable = self.overrides.get("parsable", self._base[0].get("parsable"))
+        return parsable is not None
+
+    def _render_header(self) -> str:
+        arguments, lines = self._base
+        if "namespace" in self.__dict__:
+            return super()._render_header()
+        if self._header is not None:
+            return self._header  # the shared arguments cannot change
+        if any(dest not in arguments for dest in self.overrides):
+            self.namespace  # new arguments: their order is that of the schema
+            return super()._render_header()
+
+        rendered = []
+        for k, v in arguments.items():
+            if k in self.overrides:
+                rendered.append(self._header_line(k, self.overrides[k]))
+            elif v is not None:
+                rendered.append(lines[k])
+        self._header = "\n".join(rendered)
+        return self._header
+
+
+class SlurmJob(int):
+    """The id of a submitted job (as returned by 'Slurm.sbatch'), which can
+    also be used to wait for the job to finish:
+        > job = slurm.sbatch("python main.py")
+        > state = job.wait(timeout=3600)  # ex. 'COMPLETED'
+    """
+
+    def __new__(cls, job_id: int, squeue: SlurmSqueueWrapper = None):
+        job = super().__new__(cls, job_id)
+        job.squeue = squeue
+        return job
+
+    def __reduce__(self):
+        return int, (int(self),)
+
+    def wait(self, timeout: float = None, **kwargs) -> str:
+        """Wait for the job to finish and return its final state. See
+        'SlurmSqueueWrapper.wait' for the other arguments.
+        """
+        squeue = SlurmSqueueWrapper() if self.squeue is None else self.squeue
+        return squeue.wait([self], timeout=timeout, **kwargs)[int(self)]
 
 
 class Namespace:
@@ -253,7 +869,80 @@ class Namespace:
     pass
 
 
-def create_setter_method(key: str):
+class ArgumentSchema:
+    """Arguments, filename patterns and output environment variables read from
+    the package's txt files. It is built once per process (see 'get_schema')
+    and shared by all Slurm objects.
+    """
+
+    def __init__(self):
+        self.arguments = read_simple_txt("arguments.txt")
+        self.filename_patterns = read_simple_txt("filename_patterns.txt")
+        self.output_env_vars = [
+            var for (var,) in read_simple_txt("output_env_vars.txt")
+        ]
+
+        # map every accepted spelling of a key (ex. '-a', '--array', 'array')
+        # into its canonical name, as used in the namespace
+        self.aliases = {
+            fmt_key(alias): keys[0] for keys in self.arguments for alias in keys
+        }
+        self.defaults = {keys[0]: None for keys in self.arguments}
+
+        self._parser = None
+
+    @property
+    def parser(self) -> argparse.ArgumentParser:
+        """The argparse parser, only built when it is first required"""
+        if self._parser is None:
+            parser = argparse.ArgumentParser()
+            for keys in self.arguments:
+                parser.add_argument(*(fmt_key(k) for k in keys))
+            self._parser = parser
+        return self._parser
+
+    def install(self, cls: type):
+        """Add the setter methods, filename patterns and output environment
+        variables as attributes of the given class
+        """
+        # create setter methods for each argument
+        for keys in self.arguments:
+            create_setter_method(keys[0], cls)
+
+        # add filename patterns as static variables
+        for pattern in self.filename_patterns:
+            setattr(cls, *pattern)
+
+        # add output environment variables as static variables
+        for var in self.output_env_vars:
+            setattr(cls, var, "$" + var)
+
+
+_schema = None
+_schema_lock = threading.Lock()
+
+
+def get_schema() -> ArgumentSchema:
+    """Return the shared argument schema, building it on first use"""
+    global _schema
+    if _schema is None:
+        with _schema_lock:
+            if _schema is None:
+                schema = ArgumentSchema()
+                schema.install(Slurm)
+                _schema = schema
+    return _schema
+
+
+def _future_result(future) -> tuple:
+    """Return the pair (result, error) of a finished future"""
+    try:
+        return future.result(), None
+    except Exception as error:
+        return None, error
+
+
+def create_setter_method(key: str, cls: type = None):
     """Creates the setter method for the given 'key' attribute of a Slurm
     object
     """
@@ -263,7 +952,7 @@ def create_setter_method(key: str):
 
     set_key.__name__ = f"set_{key}"
     set_key.__doc__ = f'Setter method for the argument "{key}"'
-    setattr(Slurm, set_key.__name__, set_key)
+    setattr(Slurm if cls is None else cls, set_key.__name__, set_key)
 
 
 def fmt_key(key: str) -> str:
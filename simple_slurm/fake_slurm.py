@@ -0,0 +1,524 @@
+"""Local stand-in for a Slurm controller, to test and benchmark without a
+cluster.
+
+'FakeSlurm' writes pure Python 'sbatch', 'squeue', 'scancel' and 'sacct'
+executables into a directory, backed by a small SQLite store of the submitted
+jobs. Putting them first on PATH is enough for the Slurm class (and the squeue
+and scancel wrappers) to use them:
+    > with FakeSlurm(pending_time=1, run_time=5) as fake:
+    >     job_id = Slurm(job_name="name").sbatch("echo Hello!")
+    >     fake.jobs()[job_id]["state"]  # 'PENDING', 'RUNNING', 'COMPLETED'...
+
+The lifecycle of the jobs is simulated from their submission time: each job is
+pending for 'pending_time' seconds, then running for 'run_time' seconds, and
+then completed (or failed, with probability 'job_failure_rate'), unless it is
+cancelled. Every command sleeps 'latency' seconds and fails with probability
+'failure_rate', as an overloaded controller would.
+
+The executables can also be installed for use from the shell:
+    $ python -m simple_slurm.fake_slurm DIRECTORY
+    $ export PATH=DIRECTORY/bin:$PATH
+"""
+
+import argparse
+import contextlib
+import getpass
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Dict, Iterable, List, Optional
+
+COMMANDS = ("sbatch", "squeue", "scancel", "sacct")
+
+DEFAULT_CONFIG = dict(
+    latency=0.0,
+    failure_rate=0.0,
+    job_failure_rate=0.0,
+    pending_time=0.0,
+    run_time=0.0,
+    first_job_id=1000,
+    seed=0,
+)
+
+ACTIVE_STATES = ("PENDING", "RUNNING")
+
+# compact form of the states (squeue's '%t')
+COMPACT_STATES = {
+    "PENDING": "PD",
+    "RUNNING": "R",
+    "COMPLETED": "CD",
+    "FAILED": "F",
+    "CANCELLED": "CA",
+}
+
+# header of the squeue format codes
+SQUEUE_HEADERS = {
+    "i": "JOBID",
+    "j": "NAME",
+    "t": "ST",
+    "T": "STATE",
+    "M": "TIME",
+    "L": "TIME_LEFT",
+    "D": "NODES",
+    "C": "CPUS",
+    "m": "MIN_MEMORY",
+    "b": "TRES_PER_NODE",
+    "R": "NODELIST(REASON)",
+    "P": "PARTITION",
+    "u": "USER",
+}
+SQUEUE_CODE = re.compile(r"%\.?(\d*)([a-zA-Z])")
+
+SCHEMA = """CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    partition TEXT NOT NULL,
+    user TEXT NOT NULL,
+    submit REAL NOT NULL,
+    cancelled REAL,
+    signal TEXT,
+    script TEXT
+)"""
+
+# the module is imported on its own (not with the package) and without the
+# site packages, for the commands to start as fast as possible
+EXECUTABLE = """#!{python} -S
+import sys
+sys.path.insert(0, {path!r})
+from fake_slurm import main
+sys.exit(main({name!r}, sys.argv[1:], {directory!r}))
+"""
+
+
+class FakeSlurm:
+    """Fake Slurm controller stored in 'directory' (a temporary directory if
+    None, removed on exit). See the module documentation for the options.
+    """
+
+    def __init__(self, directory: Optional[str] = None, **config):
+        self._temporary = directory is None
+        self.directory = tempfile.mkdtemp() if directory is None else directory
+        self._path = None
+        install(self.directory, **config)
+
+    @property
+    def bin_dir(self) -> str:
+        return os.path.join(self.directory, "bin")
+
+    def configure(self, **config):
+        """Update the options (ex. 'latency') of the controller"""
+        write_config(self.directory, dict(read_config(self.directory), **config))
+
+    def __enter__(self) -> "FakeSlurm":
+        """Put the executables first on PATH"""
+        self._path = os.environ.get("PATH", "")
+        os.environ["PATH"] = self.bin_dir + os.pathsep + self._path
+        return self
+
+    def __exit__(self, *exc_info):
+        os.environ["PATH"] = self._path
+        if self._temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def populate(
+        self, count: int, name: str = "job", partition: str = "debug"
+    ) -> List[int]:
+        """Submit 'count' jobs directly into the store (much faster than
+        running sbatch), return their ids
+        """
+        config = read_config(self.directory)
+        with contextlib.closing(connect(self.directory)) as db:
+            return insert_jobs(db, config, [(name, partition, None)] * count)
+
+    def jobs(self) -> Dict[int, dict]:
+        """Return all the jobs with their current state, as {job_id: job}"""
+        config = read_config(self.directory)
+        with contextlib.closing(connect(self.directory)) as db:
+            return {job["job_id"]: job for job in select_jobs(db, config)}
+
+
+def install(directory: str, **config):
+    """Create the store, the configuration and the executables in 'directory'"""
+    bin_dir = os.path.join(directory, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+    unknown = set(config) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown options: {sorted(unknown)}")
+    write_config(directory, dict(DEFAULT_CONFIG, **config))
+    connect(directory).close()
+
+    for name in COMMANDS:
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as fid:
+            fid.write(
+                EXECUTABLE.format(
+                    python=sys.executable,
+                    path=os.path.dirname(os.path.abspath(__file__)),
+                    name=name,
+                    directory=os.path.abspath(directory),
+                )
+            )
+        os.chmod(path, 0o755)
+
+
+def read_config(directory: str) -> dict:
+    with open(os.path.join(directory, "config.json"), "r") as fid:
+        return json.load(fid)
+
+
+def write_config(directory: str, config: dict):
+    # written atomically, as the executables may be reading it
+    path = os.path.join(directory, "config.json")
+    with open(path + ".tmp", "w") as fid:
+        json.dump(config, fid)
+    os.replace(path + ".tmp", path)
+
+
+def connect(directory: str) -> sqlite3.Connection:
+    """Connect to the store (shared by concurrent commands)"""
+    db = sqlite3.connect(os.path.join(directory, "state.db"), timeout=60)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute(SCHEMA)
+    return db
+
+
+def insert_jobs(
+    db: sqlite3.Connection, config: dict, jobs: Iterable[tuple]
+) -> List[int]:
+    """Insert the (name, partition, script) jobs, return their ids"""
+    jobs = list(jobs)
+    db.execute("BEGIN IMMEDIATE")
+    (last,) = db.execute("SELECT MAX(job_id) FROM jobs").fetchone()
+    start = config["first_job_id"] if last is None else last + 1
+    job_ids = list(range(start, start + len(jobs)))
+    user, now = getpass.getuser(), time.time()
+    db.executemany(
+        "INSERT INTO jobs (job_id, name, partition, user, submit, script) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (job_id, name, partition, user, now, script)
+            for job_id, (name, partition, script) in zip(job_ids, jobs)
+        ],
+    )
+    db.commit()
+    return job_ids
+
+
+def select_jobs(
+    db: sqlite3.Connection, config: dict, job_ids: Optional[Iterable[int]] = None
+) -> List[dict]:
+    """Return the jobs (all of them, or the given ids) with their state"""
+    if job_ids is None:
+        rows = db.execute("SELECT * FROM jobs ORDER BY job_id")
+    else:
+        job_ids = sorted(set(job_ids))
+        rows = []
+        # stay below the maximum number of parameters of a query
+        for i in range(0, len(job_ids), 500):
+            chunk = job_ids[i : i + 500]
+            marks = ",".join("?" * len(chunk))
+            rows.extend(
+                db.execute(f"SELECT * FROM jobs WHERE job_id IN ({marks})", chunk)
+            )
+    now = time.time()
+    return [job_state(dict(row), config, now) for row in rows]
+
+
+def job_state(job: dict, config: dict, now: float) -> dict:
+    """Add the simulated 'state', 'start' and 'end' times of a job"""
+    start = job["submit"] + config["pending_time"]
+    end = start + config["run_time"]
+    cancelled = job["cancelled"]
+    if cancelled is not None and cancelled < end:
+        state, end = "CANCELLED", cancelled
+        if cancelled < start:
+            start = None
+    elif now < start:
+        state, start, end = "PENDING", None, None
+    elif now < end:
+        state, end = "RUNNING", None
+    else:
+        # the outcome of a job is drawn once and for all from its id
+        draw = random.Random(job["job_id"] + config["seed"]).random()
+        state = "FAILED" if draw < config["job_failure_rate"] else "COMPLETED"
+    job.update(state=state, start=start, end=end)
+    return job
+
+
+def main(command: str, argv: List[str], directory: str) -> int:
+    """Run the given fake command, return its exit code"""
+    config = read_config(directory)
+    if config["latency"]:
+        time.sleep(config["latency"])
+    if random.random() < config["failure_rate"]:
+        print(
+            f"{command}: error: Socket timed out on send/recv operation",
+            file=sys.stderr,
+        )
+        return 1
+    run = dict(sbatch=sbatch, squeue=squeue, scancel=scancel, sacct=sacct)[command]
+    with contextlib.closing(connect(directory)) as db:
+        return run(db, config, argv)
+
+
+def sbatch(db: sqlite3.Connection, config: dict, argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="sbatch")
+    parser.add_argument("script", nargs="?")
+    parser.add_argument("--parsable", action="store_true")
+    parser.add_argument("-J", "--job-name")
+    parser.add_argument("-p", "--partition")
+    args, _ = parser.parse_known_args(argv)
+
+    if args.script is None:
+        script = sys.stdin.read()
+    else:
+        with open(args.script, "r") as fid:
+            script = fid.read()
+
+    # options given in the script, as "#SBATCH --key value" or "--key=value"
+    options = {}
+    for line in script.splitlines():
+        if line.startswith("#SBATCH"):
+            key, _, value = (
+                line[len("#SBATCH") :].strip().replace("=", " ", 1).partition(" ")
+            )
+            options[key] = value.strip()
+    name = args.job_name or options.get("--job-name") or "sbatch"
+    partition = args.partition or options.get("--partition") or "debug"
+
+    (job_id,) = insert_jobs(db, config, [(name, partition, script)])
+    if args.parsable or "--parsable" in options:
+        print(job_id)
+    else:
+        print(f"Submitted batch job {job_id}")
+    return 0
+
+
+def squeue(db: sqlite3.Connection, config: dict, argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="squeue", add_help=False)
+    parser.add_argument("--me", action="store_true")
+    parser.add_argument(
+        "-o", "--format", default="%.18i %.9P %.8j %.8u %.2t %.10M %.6D %R"
+    )
+    parser.add_argument("-j", "--jobs")
+    parser.add_argument("-n", "--name")
+    parser.add_argument("-t", "--states")
+    parser.add_argument("-p", "--partition")
+    parser.add_argument("-R", "--reservation")
+    parser.add_argument("-h", "--noheader", action="store_true")
+    args = parser.parse_args(argv)
+
+    job_ids = None if args.jobs is None else split_job_ids(args.jobs)
+    # like slurmctld, the finished jobs are only listed when asked for
+    states = set(ACTIVE_STATES)
+    if args.states is not None:
+        full = {compact: state for state, compact in COMPACT_STATES.items()}
+        states = {full.get(s.upper(), s.upper()) for s in args.states.split(",")}
+        if "ALL" in states:
+            states = None
+    if args.reservation is not None:
+        jobs = []  # no reservation is simulated
+    else:
+        jobs = [
+            job
+            for job in select_jobs(db, config, job_ids)
+            if (states is None or job["state"] in states)
+            and (args.name is None or job["name"] in args.name.split(","))
+            and (
+                args.partition is None or job["partition"] in args.partition.split(",")
+            )
+        ]
+
+    now = time.time()
+    lines = [] if args.noheader else [squeue_line(args.format, None, now)]
+    lines.extend(squeue_line(args.format, job, now) for job in jobs)
+    sys.stdout.write("".join(line + "\n" for line in lines))
+    return 0
+
+
+def squeue_line(fmt: str, job: Optional[dict], now: float) -> str:
+    """Format the header (if 'job' is None) or a job, as squeue would"""
+
+    def field(match) -> str:
+        width, code = match.groups()
+        if job is None:
+            value = SQUEUE_HEADERS.get(code, code.upper())
+        else:
+            value = squeue_field(code, job, now)
+        return value.rjust(int(width)) if width else value
+
+    return SQUEUE_CODE.sub(field, fmt)
+
+
+def squeue_field(code: str, job: dict, now: float) -> str:
+    running = job["state"] == "RUNNING"
+    elapsed = int(now - job["start"]) if running else 0
+    minutes, seconds = divmod(elapsed, 60)
+    values = {
+        "i": str(job["job_id"]),
+        "j": job["name"],
+        "t": COMPACT_STATES[job["state"]],
+        "T": job["state"],
+        "M": f"{minutes}:{seconds:02d}",
+        "L": "UNLIMITED",
+        "D": "1",
+        "C": "1",
+        "m": "0",
+        "b": "N/A",
+        "R": "localhost" if running else "(None)",
+        "P": job["partition"],
+        "u": job["user"],
+    }
+    return values.get(code, "")
+
+
+def scancel(db: sqlite3.Connection, config: dict, argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="scancel")
+    parser.add_argument("job_ids", nargs="*")
+    parser.add_argument("--me", action="store_true")
+    parser.add_argument("-s", "--signal")
+    parser.add_argument("-n", "--name")
+    parser.add_argument("-t", "--state")
+    parser.add_argument("-p", "--partition")
+    args = parser.parse_args(argv)
+
+    known = {}
+    if args.job_ids:
+        job_ids = [int(job_id.split("_")[0]) for job_id in args.job_ids]
+        known = {job["job_id"]: job for job in select_jobs(db, config, job_ids)}
+    else:
+        job_ids = None
+    jobs = [
+        job
+        for job in (known.values() if job_ids else select_jobs(db, config))
+        if job["state"] in ACTIVE_STATES
+        and (args.name is None or job["name"] == args.name)
+        and (args.state is None or job["state"] == args.state.upper())
+        and (args.partition is None or job["partition"] == args.partition)
+    ]
+
+    signal = None if args.signal is None else args.signal.upper()
+    now = time.time()
+    db.execute("BEGIN IMMEDIATE")
+    # a job is killed (cancelled) by any signal but TERM, which it ignores
+    cancelled = [job["job_id"] for job in jobs if signal in (None, "KILL", "9")]
+    db.executemany(
+        "UPDATE jobs SET cancelled = ? WHERE job_id = ? AND cancelled IS NULL",
+        [(now, job_id) for job_id in cancelled],
+    )
+    if signal is not None:
+        db.executemany(
+            "UPDATE jobs SET signal = ? WHERE job_id = ?",
+            [(signal, job["job_id"]) for job in jobs],
+        )
+    db.commit()
+
+    returncode = 0
+    for job_id in job_ids or ():
+        if job_id not in known:
+            print(
+                f"scancel: error: Kill job error on job id {job_id}: "
+                "Invalid job id specified",
+                file=sys.stderr,
+            )
+            returncode = 1
+    return returncode
+
+
+def sacct(db: sqlite3.Connection, config: dict, argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="sacct")
+    parser.add_argument("-X", "--allocations", action="store_true")
+    parser.add_argument("-n", "--noheader", action="store_true")
+    parser.add_argument("-P", "--parsable2", action="store_true")
+    parser.add_argument("-o", "--format", default="JobID,JobName,Partition,State")
+    parser.add_argument("-j", "--jobs")
+    parser.add_argument("-s", "--state")
+    parser.add_argument("--name")
+    parser.add_argument("-S", "--starttime")
+    parser.add_argument("-E", "--endtime")
+    args = parser.parse_args(argv)
+
+    job_ids = None if args.jobs is None else split_job_ids(args.jobs)
+    jobs = select_jobs(db, config, job_ids)
+    if args.state is not None:
+        states = {state.upper() for state in args.state.split(",")}
+        jobs = [job for job in jobs if job["state"] in states]
+    if args.name is not None:
+        jobs = [job for job in jobs if job["name"] in args.name.split(",")]
+    # jobs eligible (ie. submitted) before the end and ended after the start
+    if args.starttime is not None:
+        start = parse_time(args.starttime)
+        jobs = [job for job in jobs if job["end"] is None or job["end"] >= start]
+    if args.endtime is not None:
+        end = parse_time(args.endtime)
+        jobs = [job for job in jobs if job["submit"] <= end]
+
+    fields = [field.strip() for field in args.format.split(",")]
+    lines = [] if args.noheader else [fields]
+    lines.extend([sacct_field(field, job) for field in fields] for job in jobs)
+    separator = "|" if args.parsable2 else " "
+    sys.stdout.write("".join(separator.join(line) + "\n" for line in lines))
+    return 0
+
+
+def sacct_field(field: str, job: dict) -> str:
+    key = field.lower()
+    if key == "jobid":
+        return str(job["job_id"])
+    if key == "jobname":
+        return job["name"]
+    if key == "state":
+        return job["state"]
+    if key in ("nnodes", "ncpus", "alloccpus"):
+        return "1"
+    if key == "exitcode":
+        return "1:0" if job["state"] == "FAILED" else "0:0"
+    if key in ("submit", "start", "end"):
+        value = job[key]
+        return "Unknown" if value is None else format_time(value)
+    if key == "elapsed":
+        if job["start"] is None:
+            return "00:00:00"
+        elapsed = int((job["end"] or time.time()) - job["start"])
+        return "{:02d}:{:02d}:{:02d}".format(
+            elapsed // 3600, elapsed // 60 % 60, elapsed % 60
+        )
+    return str(job.get(key, ""))
+
+
+def split_job_ids(value: str) -> List[int]:
+    return [int(job_id.split("_")[0]) for job_id in value.split(",") if job_id]
+
+
+def format_time(value: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(value))
+
+
+def parse_time(value: str) -> float:
+    """Parse a sacct time (ex. '2024-01-31T12:00:00', '2024-01-31' or 'now')"""
+    if value.lower() == "now":
+        return time.time()
+    for fmt in ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d"):
+        try:
+            return time.mktime(time.strptime(value, fmt))
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid time: {value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m simple_slurm.fake_slurm")
+    parser.add_argument("directory")
+    for option, default in DEFAULT_CONFIG.items():
+        parser.add_argument(f"--{option.replace('_', '-')}", type=type(default))
+    options = vars(parser.parse_args())
+    directory = options.pop("directory")
+    install(directory, **{k: v for k, v in options.items() if v is not None})
+    print(f"export PATH={os.path.abspath(os.path.join(directory, 'bin'))}:$PATH")
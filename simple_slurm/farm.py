@@ -0,0 +1,186 @@
+"""Task farm: many short commands run inside a single allocation.
+
+The commands are written to a task file (one per line) and dispatched by
+'Slurm.sbatch_farm' in one of two modes:
+    - "worker":     each task of the job step ('--ntasks') is a worker that
+                    claims the next pending command (work stealing) until all
+                    are done.
+    - "multi-prog": the commands are run in batches of '--ntasks' commands,
+                    with 'srun --multi-prog' (one command per task).
+The exit code of each command is appended to a results file, as lines
+"index<TAB>exit_code".
+
+This module is also the entry point run on the compute nodes:
+    $ python -m simple_slurm.farm worker --tasks tasks.txt --results results.tsv
+"""
+
+import argparse
+import fcntl
+import os
+import shlex
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+FARM_MODES = ("worker", "multi-prog")
+
+
+class TaskFarm:
+    """Handle of a task farm, as returned by 'Slurm.sbatch_farm'"""
+
+    def __init__(self, job_id: int, tasks: List[str], directory: str):
+        self.job_id = job_id
+        self.tasks = tasks
+        self.directory = directory
+
+    @property
+    def task_file(self) -> str:
+        return os.path.join(self.directory, "tasks.txt")
+
+    @property
+    def results_file(self) -> str:
+        return os.path.join(self.directory, "results.tsv")
+
+    def results(self) -> Dict[int, int]:
+        """Exit codes of the commands that finished, as {index: exit_code}"""
+        return read_results(self.results_file)
+
+    def failed(self) -> Dict[int, int]:
+        """Exit codes of the commands that failed"""
+        return {i: code for i, code in self.results().items() if code != 0}
+
+    def pending(self) -> List[int]:
+        """Indices of the commands that did not finish (yet)"""
+        results = self.results()
+        return [i for i in range(len(self.tasks)) if i not in results]
+
+
+def farm_commands(
+    directory: str,
+    ntasks: int,
+    mode: str = "worker",
+    python: str = sys.executable,
+    shell: str = "/bin/sh",
+    srun_cmd: str = "srun",
+) -> List[str]:
+    """Return the commands of the batch script dispatching the task file of
+    'directory' inside the allocation
+    """
+    if mode not in FARM_MODES:
+        raise ValueError(f"Unknown farm mode {mode!r}, expected one of {FARM_MODES}")
+    task_file = os.path.join(directory, "tasks.txt")
+    results_file = os.path.join(directory, "results.tsv")
+    runner = [python, "-m", "simple_slurm.farm"]
+    # since Slurm 22.05, srun does not inherit '--cpus-per-task' from sbatch
+    srun = f'{srun_cmd} --cpus-per-task="${{SLURM_CPUS_PER_TASK:-1}}"'
+    files = ["--tasks", task_file, "--results", results_file, "--shell", shell]
+
+    if mode == "worker":
+        counter_file = os.path.join(directory, "counter")
+        worker = [*runner, "worker", *files, "--counter", counter_file]
+        return [f"{srun} {' '.join(shlex.quote(arg) for arg in worker)}"]
+
+    # 'multi-prog': '%t' is replaced by srun with the rank of the task, the
+    # offset of the batch is given in the environment
+    config = os.path.join(directory, "multi_prog.conf")
+    run = [*runner, "run", *files]
+    with open(config, "w") as fid:
+        fid.write(f"* {' '.join(shlex.quote(arg) for arg in run)} --rank %t\n")
+    with open(task_file, "r") as fid:
+        count = sum(1 for _ in fid)
+    return [
+        f"for SIMPLE_SLURM_FARM_OFFSET in $(seq 0 {ntasks} {max(count - 1, 0)}); do",
+        "    export SIMPLE_SLURM_FARM_OFFSET",
+        f"    {srun} --multi-prog {shlex.quote(config)}",
+        "done",
+    ]
+
+
+def read_results(results_file: str) -> Dict[int, int]:
+    """Read a results file, as {index: exit_code}"""
+    results = {}
+    if not os.path.exists(results_file):
+        return results
+    with open(results_file, "r") as fid:
+        for line in fid:
+            index, _, code = line.strip().partition("\t")
+            if index.isdigit() and code:
+                results[int(index)] = int(code)
+    return results
+
+
+def run_task(tasks: List[str], index: int, results_file: str, shell: str) -> int:
+    """Run the command 'index' and append its exit code to the results"""
+    env = dict(os.environ, SIMPLE_SLURM_TASK_INDEX=str(index))
+    code = subprocess.run([shell, "-c", tasks[index]], env=env).returncode
+    # appends are not atomic on NFS (the end of the file is known by each
+    # client), the results file is locked as the counter file, the lock
+    # refreshing the size of the file
+    with open(results_file, "a") as fid:
+        fcntl.flock(fid, fcntl.LOCK_EX)
+        try:
+            fid.write(f"{index}\t{code}\n")
+            fid.flush()
+        finally:
+            fcntl.flock(fid, fcntl.LOCK_UN)
+    return code
+
+
+def claim_task(counter_file: str) -> int:
+    """Claim the index of the next pending command, shared between workers
+    through the (locked) counter file
+    """
+    with open(counter_file, "a+") as fid:
+        fcntl.flock(fid, fcntl.LOCK_EX)
+        try:
+            fid.seek(0)
+            index = int(fid.read() or 0)
+            fid.seek(0)
+            fid.truncate()
+            fid.write(str(index + 1))
+            fid.flush()
+        finally:
+            fcntl.flock(fid, fcntl.LOCK_UN)
+    return index
+
+
+def run_worker(task_file: str, results_file: str, counter_file: str, shell: str):
+    """Run pending commands until none is left"""
+    tasks = read_tasks(task_file)
+    while True:
+        index = claim_task(counter_file)
+        if index >= len(tasks):
+            return
+        run_task(tasks, index, results_file, shell)
+
+
+def read_tasks(task_file: str) -> List[str]:
+    with open(task_file, "r") as fid:
+        return fid.read().splitlines()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m simple_slurm.farm")
+    parser.add_argument("mode", choices=("worker", "run"))
+    parser.add_argument("--tasks", required=True)
+    parser.add_argument("--results", required=True)
+    parser.add_argument("--shell", default="/bin/sh")
+    parser.add_argument("--counter")
+    # in "multi-prog" mode, the offset of the batch is given by the script
+    parser.add_argument(
+        "--offset", type=int, default=os.getenv("SIMPLE_SLURM_FARM_OFFSET", 0)
+    )
+    parser.add_argument("--rank", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.mode == "worker":
+        run_worker(args.tasks, args.results, args.counter, args.shell)
+    else:
+        tasks = read_tasks(args.tasks)
+        index = args.offset + args.rank
+        if index < len(tasks):
+            run_task(tasks, index, args.results, args.shell)
+
+
+if __name__ == "__main__":
+    main()
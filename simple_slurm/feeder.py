@@ -0,0 +1,210 @@
+import collections
+import itertools
+import threading
+import time
+from concurrent.futures import CancelledError
+from typing import Iterable, Iterator, Optional, Tuple
+
+from simple_slurm.journal import SubmissionJournal
+
+
+class SubmissionFeeder:
+    """Submit a (possibly huge) stream of variants of a job while keeping at
+    most 'target' jobs in the queue, so that the QOS limits (ex.
+    MaxSubmitJobs) are never hit:
+        > variants = ((dict(job_name=f"run_{i}"), f"python run.py {i}")
+        >             for i in range(200_000))
+        > feeder = SubmissionFeeder(slurm, variants, target=4500)
+        > feeder.run()
+        > feeder.stats()  # submitted, failed, jobs per second...
+
+    The variants are given as in 'Slurm.sbatch_many' and are consumed lazily:
+    at each round the jobs of the current user are counted with a fresh squeue
+    snapshot (restricted by 'squeue_filters', see 'SlurmSqueueWrapper.query')
+    and only the free slots are filled, then the feeder waits 'poll_interval'
+    seconds. Note that squeue lists a pending job array as a single job.
+
+    The feeder can be resumed: 'run' stops after 'limit' submissions (or when
+    'stop' is called) and continues from there when called again. A new
+    feeder can skip the first 'start' variants (ex. the 'position' reached
+    before), or be given the 'journal' of the previous one, which skips the
+    variants already submitted.
+
+    A failed submission (after 'retries') is recorded in 'errors', as
+    (position, error), and the feeder moves on. Any other argument is passed
+    to 'sbatch'.
+    """
+
+    def __init__(
+        self,
+        slurm,
+        variants: Iterable,
+        target: int = 1000,
+        poll_interval: float = 30.0,
+        squeue_filters: Optional[dict] = None,
+        max_workers: int = 8,
+        retries: int = 2,
+        retry_delay: float = 1.0,
+        start: int = 0,
+        journal: Optional[SubmissionJournal] = None,
+        **sbatch_kwargs,
+    ):
+        if target < 1:
+            raise ValueError("The target number of jobs must be positive")
+        self.slurm = slurm
+        self.target = target
+        self.poll_interval = poll_interval
+        self.squeue_filters = squeue_filters or {}
+        self.max_workers = max_workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.journal = journal
+        if journal is not None:
+            sbatch_kwargs["journal"] = journal
+        self.sbatch_kwargs = sbatch_kwargs
+
+        self._variants = itertools.islice(iter(variants), start, None)
+        self._source_exhausted = False
+        # variants taken from '_variants' but not submitted yet
+        self._pending = collections.deque()
+        self._stop = threading.Event()
+        self.exhausted = False
+        # index of the next variant
+        self.position = start
+        self.submitted = 0
+        # variants already submitted according to the journal
+        self.skipped = 0
+        self.errors = []
+        self.in_queue = None
+        self.rounds = 0
+        self.elapsed = 0.0
+
+    def count_jobs(self) -> int:
+        """Number of jobs currently in the queue (pending or running)"""
+        return len(self.slurm.squeue.query(force=True, **self.squeue_filters))
+
+    def feed(self, limit: Optional[int] = None) -> Iterator[Tuple[int, Optional[int]]]:
+        """Submit the variants as slots free up, yielding (position, job_id)
+        for each of them (job_id is None if the submission failed). Stops
+        after 'limit' variants, when they are exhausted or 'stop' is called.
+        If the caller stops iterating, the variants whose submission had not
+        started are kept for the next call.
+        """
+        self._stop.clear()
+        started = time.monotonic()
+        count = 0
+        try:
+            while not self.exhausted and not self._stop.is_set():
+                if limit is not None and count >= limit:
+                    break
+                self.rounds += 1
+                self.in_queue = self.count_jobs()
+                free = self.target - self.in_queue
+                if limit is not None:
+                    free = min(free, limit - count)
+
+                if free > 0:
+                    before = len(self.journal) if self.journal is not None else 0
+                    failed = len(self.errors)
+                    batch = self._take(free)
+                    stop = threading.Event()
+                    stream = self.slurm._sbatch_stream(
+                        batch,
+                        self.max_workers,
+                        self.retries,
+                        self.retry_delay,
+                        stop,
+                        **self.sbatch_kwargs,
+                    )
+                    processed = 0
+                    try:
+                        for job_id, error in stream:
+                            position = self._record(job_id, error)
+                            processed += 1
+                            count += 1
+                            yield position, job_id
+                    except GeneratorExit:
+                        # the submissions already running are recorded, the
+                        # others are cancelled and kept for the next call
+                        stop.set()
+                        for job_id, error in stream:
+                            if not isinstance(error, CancelledError):
+                                self._record(job_id, error)
+                                processed += 1
+                        raise
+                    finally:
+                        self._pending.extendleft(reversed(batch[processed:]))
+                        self.exhausted = self._source_exhausted and not self._pending
+                        skipped = self._count_skipped(before, failed, processed)
+                    if skipped > 0:
+                        # the variants skipped by the journal took no slot: the
+                        # queue is counted again right away
+                        continue
+                if not self.exhausted:
+                    self._stop.wait(self.poll_interval)
+        finally:
+            self.elapsed += time.monotonic() - started
+
+    def run(self, limit: Optional[int] = None) -> dict:
+        """Submit the variants (see 'feed'), return the statistics"""
+        for _ in self.feed(limit):
+            pass
+        return self.stats()
+
+    def stop(self):
+        """Stop the feeder (from another thread), it can be resumed by 'run'"""
+        self._stop.set()
+
+    @property
+    def throughput(self) -> float:
+        """Average number of jobs submitted per second while running"""
+        return self.submitted / self.elapsed if self.elapsed > 0 else 0.0
+
+    def _take(self, count: int) -> list:
+        """Return the next 'count' variants (fewer once exhausted), starting
+        with those left over by a previous call
+        """
+        batch = []
+        while self._pending and len(batch) < count:
+            batch.append(self._pending.popleft())
+        if len(batch) < count and not self._source_exhausted:
+            variants = list(itertools.islice(self._variants, count - len(batch)))
+            if len(variants) < count - len(batch):
+                self._source_exhausted = True
+            batch.extend(variants)
+        return batch
+
+    def _record(self, job_id: Optional[int], error: Optional[Exception]) -> int:
+        """Record the submission of the next variant, return its position"""
+        if error is None:
+            self.submitted += 1
+        else:
+            self.errors.append((self.position, error))
+        self.position += 1
+        return self.position - 1
+
+    def _count_skipped(self, before: int, failed: int, processed: int) -> int:
+        """Number of the variants just processed that the journal skipped,
+        which are not counted as submitted
+        """
+        if self.journal is None:
+            return 0
+        new = len(self.journal) - before
+        skipped = processed - new - (len(self.errors) - failed)
+        if skipped > 0:
+            self.submitted -= skipped
+            self.skipped += skipped
+        return skipped
+
+    def stats(self) -> dict:
+        return dict(
+            position=self.position,
+            submitted=self.submitted,
+            skipped=self.skipped,
+            failed=len(self.errors),
+            in_queue=self.in_queue,
+            rounds=self.rounds,
+            elapsed=self.elapsed,
+            throughput=self.throughput,
+            exhausted=self.exhausted,
+        )
@@ -0,0 +1,90 @@
+import shlex
+from typing import List, Optional, Sequence, Tuple
+
+from simple_slurm.squeue import SlurmSqueueWrapper
+
+
+class JobArray:
+    """Handle of the job array(s) packing many tasks, as returned by
+    'Slurm.sbatch_array'.
+
+    Task 'i' of the packed list runs as the array task 'i % chunk_size' of
+    the job array 'job_ids[i // chunk_size]' (there is a single job array
+    unless 'max_array_size' was given).
+    """
+
+    def __init__(
+        self, job_ids: List[int], tasks: Sequence, task_file: str, chunk_size: int
+    ):
+        self.job_ids = job_ids
+        self.tasks = tasks
+        self.task_file = task_file
+        self.chunk_size = chunk_size
+
+    @property
+    def job_id(self) -> int:
+        """Id of the (first) job array"""
+        return self.job_ids[0]
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    def locate(self, index: int) -> Tuple[int, int]:
+        """Return the pair (job_id, array_task_id) running the given task"""
+        if not 0 <= index < len(self.tasks):
+            raise IndexError(f"Task index out of range: {index}")
+        chunk, array_task_id = divmod(index, self.chunk_size)
+        return self.job_ids[chunk], array_task_id
+
+    def task_job_id(self, index: int) -> str:
+        """Return the Slurm id of the given task (ex. '1234_5')"""
+        return "{}_{}".format(*self.locate(index))
+
+    def variant(self, array_task_id: int, job_id: Optional[int] = None):
+        """Return the original task (command or parameters) run by the given
+        array task of the given job array (by default the first one)
+        """
+        chunk = 0 if job_id is None else self.job_ids.index(int(job_id))
+        return self.tasks[chunk * self.chunk_size + int(array_task_id)]
+
+    def wait(self, timeout: float = None, **kwargs) -> dict:
+        """Wait for the job array(s) to finish, see 'SlurmJob.wait'"""
+        squeue = getattr(self.job_ids[0], "squeue", None)
+        if squeue is None:
+            squeue = SlurmSqueueWrapper()
+        return squeue.wait(self.job_ids, timeout=timeout, **kwargs)
+
+
+def format_tasks(tasks: Sequence, command: Optional[str] = None) -> List[str]:
+    """Return the command line of each task. Tasks are commands, unless a
+    'command' template is given, in which case they are its parameters:
+        - dict:  command.format(**task)
+        - tuple: command.format(*task)
+        - other: command.format(task)
+    """
+    lines = []
+    for task in tasks:
+        if command is None:
+            line = str(task)
+        elif isinstance(task, dict):
+            line = command.format(**task)
+        elif isinstance(task, tuple):
+            line = command.format(*task)
+        else:
+            line = command.format(task)
+        if "\n" in line:
+            raise ValueError(f"Task commands must be single lines: {line!r}")
+        lines.append(line)
+    return lines
+
+
+def task_lookup_cmd(task_file: str, task_id_var: str, offset: int = 0) -> str:
+    """Shell command running the line of 'task_file' of the current array
+    task ('task_id_var' being the array task id variable, ex.
+    '$SLURM_ARRAY_TASK_ID')
+    """
+    line = f"$(( {task_id_var} + {offset + 1} ))"
+    return (
+        f'SIMPLE_SLURM_TASK=$(sed -n "{line}p" {shlex.quote(task_file)})\n'
+        'eval "$SIMPLE_SLURM_TASK"'
+    )
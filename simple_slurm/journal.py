@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+class SubmissionJournal:
+    """Append-only journal of the submitted jobs, stored in a SQLite database.
+
+    Each submission is recorded with the content hash of its rendered script,
+    its arguments and the job id returned by sbatch. Given to 'Slurm.sbatch'
+    (or 'sbatch_many'), a job whose script was already submitted is skipped
+    and its recorded id is returned, so that a crashed driver can simply be
+    restarted:
+        > journal = SubmissionJournal("submissions.sqlite")
+        > job_ids = slurm.sbatch_many(variants, journal=journal)
+
+    The hash is the primary key of the table, so each lookup is a single
+    index probe. Jobs are recorded as soon as sbatch returns (and committed
+    before the id is returned), a job being submitted while the driver
+    crashes may still be submitted twice.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        self._db = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            # the write-ahead log keeps the commits durable if the process
+            # crashes, without a full sync of the database on each commit
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS submissions ("
+                "hash TEXT PRIMARY KEY, job_id INTEGER NOT NULL, "
+                "arguments TEXT, submitted REAL NOT NULL) WITHOUT ROWID"
+            )
+
+    @staticmethod
+    def digest(script: str) -> str:
+        """Content hash of a rendered script"""
+        return hashlib.sha256(script.encode()).hexdigest()
+
+    def lookup(self, digest: str) -> Optional[int]:
+        """Return the job id of the recorded script hash (None if unknown)"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT job_id FROM submissions WHERE hash = ?", (digest,)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def record(self, digest: str, job_id: int, arguments: Optional[dict] = None):
+        """Record a submission (the first record of a hash is kept)"""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR IGNORE INTO submissions VALUES (?, ?, ?, ?)",
+                (digest, int(job_id), json.dumps(arguments), time.time()),
+            )
+
+    def entries(self) -> list:
+        """Return all the submissions, as (hash, job_id, arguments, submitted)
+        tuples in submission order
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT hash, job_id, arguments, submitted FROM submissions "
+                "ORDER BY submitted"
+            ).fetchall()
+        return [(h, job_id, json.loads(args), t) for h, job_id, args, t in rows]
+
+    def __contains__(self, script: str) -> bool:
+        return self.lookup(self.digest(script)) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM submissions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
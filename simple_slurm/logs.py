@@ -0,0 +1,375 @@
+import getpass
+import mmap
+import os
+import re
+import select
+import struct
+import threading
+import time
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+
+# replacement symbols of sbatch's '--output' and '--error' ('%j', '%4a'...)
+FILENAME_PATTERN = re.compile(r"%(%|(\d*)([A-Za-z]))")
+
+# symbols only known once the job runs (node name, step...)
+RUNTIME_SYMBOLS = "Nnst"
+
+# inotify constants (see <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def parse_array_indices(array: str) -> List[int]:
+    """Return the task ids of a job array specification, ex.
+    '1-7:2,10%4' -> [1, 3, 5, 7, 10]
+    """
+    indices = []
+    for item in array.split("%")[0].split(","):
+        bounds, _, step = item.partition(":")
+        first, _, last = bounds.partition("-")
+        indices.extend(range(int(first), int(last or first) + 1, int(step or 1)))
+    return indices
+
+
+def expand_output_pattern(
+    pattern: str,
+    job_id: int,
+    array_task_id: Optional[int] = None,
+    task_job_id: Optional[int] = None,
+    job_name: Optional[str] = None,
+    user: Optional[str] = None,
+) -> str:
+    """Fill the replacement symbols of an '--output' (or '--error') pattern
+    for the given job (or array task of the job array 'job_id'):
+        - %A, %a: job id of the array and task id
+        - %j, %J: job id (of the array task: 'task_job_id')
+        - %x, %u: job name and user name
+        - %%: a '%'
+    A number between '%' and the symbol pads the value with zeros (ex. '%4a').
+    A pattern containing '\\\\' is not processed (the backslashes are removed).
+    """
+    if "\\" in pattern:
+        return pattern.replace("\\", "")
+
+    def replace(match) -> str:
+        if match.group(1) == "%":
+            return "%"
+        width, symbol = match.group(2), match.group(3)
+        if symbol == "A":
+            value = job_id
+        elif symbol == "a":
+            value = array_task_id
+        elif symbol in "jJ":
+            value = job_id if array_task_id is None else task_job_id
+        elif symbol == "x":
+            value = job_name
+        elif symbol == "u":
+            value = getpass.getuser() if user is None else user
+        elif symbol in RUNTIME_SYMBOLS:
+            raise ValueError(f"'%{symbol}' is only known once the job runs")
+        else:
+            return match.group(0)
+        if value is None:
+            raise ValueError(f"Missing value for '%{symbol}' in {pattern!r}")
+        return str(value).zfill(int(width)) if width else str(value)
+
+    return FILENAME_PATTERN.sub(replace, pattern)
+
+
+def output_paths(
+    job_id: int,
+    pattern: Optional[str] = None,
+    array: Optional[str] = None,
+    job_name: Optional[str] = None,
+    directory: Optional[str] = None,
+    task_job_ids: Optional[Dict[int, int]] = None,
+) -> Dict[Optional[int], str]:
+    """Return the output files of a job as {array_task_id: path}, with a
+    single None key if the job is not a job array. 'pattern' defaults to
+    sbatch's ('slurm-%j.out' or 'slurm-%A_%a.out'), relative paths are taken
+    from 'directory' (the working directory of the job). 'task_job_ids' gives
+    the job ids of the array tasks, only needed if the pattern uses '%j'.
+    """
+    if pattern is None:
+        pattern = "slurm-%j.out" if array is None else "slurm-%A_%a.out"
+    directory = os.getcwd() if directory is None else directory
+    if array is None:
+        tasks = [None]
+    else:
+        tasks = parse_array_indices(array)
+    task_job_ids = task_job_ids or {}
+    return {
+        task: os.path.join(
+            directory,
+            expand_output_pattern(
+                pattern, job_id, task, task_job_ids.get(task), job_name
+            ),
+        )
+        for task in tasks
+    }
+
+
+class _Inotify:
+    """Watch directories with the Linux inotify API (through ctypes)"""
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+
+        self._ctypes = ctypes
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        # written to by 'wake' to interrupt 'wait'
+        self._wakeup = os.pipe()
+
+    def add_watch(self, directory: str):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), INOTIFY_MASK)
+        if wd < 0:
+            errno = self._ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), directory)
+        self.directories[wd] = directory
+
+    def read_events(self) -> Optional[List[Tuple[str, str]]]:
+        """Return the (directory, name) of the modified files, None if events
+        were lost (the queue overflowed)
+        """
+        changes = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changes
+            position = 0
+            while position < len(data):
+                wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, position)
+                position += INOTIFY_EVENT.size
+                name = data[position : position + length].rstrip(b"\0")
+                position += length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if wd in self.directories:
+                    changes.append((self.directories[wd], os.fsdecode(name)))
+
+    def wait(self, timeout: float):
+        """Wait for an event, at most 'timeout' seconds or until 'wake'"""
+        ready, _, _ = select.select([self.fd, self._wakeup[0]], [], [], timeout)
+        if self._wakeup[0] in ready:
+            os.read(self._wakeup[0], 4096)
+
+    def wake(self):
+        os.write(self._wakeup[1], b"\0")
+
+    def close(self):
+        for fd in (self.fd,) + self._wakeup:
+            os.close(fd)
+
+
+class _LogFile:
+    __slots__ = ("path", "inode", "offset", "size", "mtime", "partial")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.inode = None
+        self.offset = 0
+        self.size = -1
+        self.mtime = None
+        self.partial = b""
+
+
+class LogTailer:
+    """Follow many log files (ex. the output files of the tasks of a job
+    array, see 'Slurm.output_paths') from a single watcher, yielding their new
+    lines as (task, line) events:
+        > paths = slurm.output_paths(job_id)  # {array_task_id: path}
+        > with LogTailer(paths) as tailer:
+        >     for task, line in tailer.follow(timeout=3600):
+        >         print(task, line)
+
+    Every 'poll_interval' seconds, each directory is listed once (instead of
+    one stat call per file, most of them missing while the tasks are pending)
+    and the files whose size changed are read. The appended bytes are read
+    through a memory map of the end of the file, only the complete lines are
+    returned (see 'flush' for the last one). A truncated or replaced file is
+    read again from its start.
+
+    With inotify (on Linux, by default when available) the files modified
+    from this machine are read as soon as they change. The polling is kept,
+    as inotify does not report the writes made by other machines to shared
+    filesystems (ex. NFS, Lustre), ie. by the compute nodes.
+    """
+
+    def __init__(
+        self,
+        paths: Dict[Hashable, str],
+        poll_interval: float = 2.0,
+        use_inotify: Optional[bool] = None,
+        encoding: str = "utf-8",
+    ):
+        self.poll_interval = poll_interval
+        self.encoding = encoding
+        self.files = {}
+        # tasks of each directory, by file name
+        self.directories = {}
+        for task, path in paths.items():
+            path = os.path.abspath(path)
+            self.files[task] = _LogFile(path)
+            directory, name = os.path.split(path)
+            self.directories.setdefault(directory, {})[name] = task
+
+        self._inotify = None
+        if use_inotify is None or use_inotify:
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError, TypeError):
+                if use_inotify:
+                    raise
+            else:
+                for directory in self.directories:
+                    try:
+                        self._inotify.add_watch(directory)
+                    except OSError:
+                        pass  # not created yet, the directory is polled
+        self._stop = threading.Event()
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._inotify is not None
+
+    def poll(self) -> List[Tuple[Hashable, str]]:
+        """Check all the files once, return the new lines as (task, line)"""
+        events = []
+        for directory, names in self.directories.items():
+            try:
+                entries = os.scandir(directory)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            with entries:
+                for entry in entries:
+                    task = names.get(entry.name)
+                    if task is None:
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    events.extend(self._read(task, stat))
+        return events
+
+    def follow(self, timeout: Optional[float] = None) -> Iterator[Tuple[Hashable, str]]:
+        """Yield the new lines as (task, line) as they are written, until
+        'stop' is called or for at most 'timeout' seconds
+        """
+        self._stop.clear()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        next_poll = 0.0
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                break
+            changes = None
+            if now < next_poll and self._inotify is not None:
+                changes = self._inotify.read_events()
+            if changes is None:
+                events = self.poll()
+                next_poll = now + self.poll_interval
+            else:
+                events = self._read_changes(changes)
+            yield from events
+            if self._stop.is_set():
+                break
+
+            delay = next_poll - time.monotonic()
+            if deadline is not None:
+                delay = min(delay, deadline - time.monotonic())
+            if delay > 0:
+                if self._inotify is not None:
+                    self._inotify.wait(delay)
+                else:
+                    self._stop.wait(delay)
+
+    def flush(self) -> List[Tuple[Hashable, str]]:
+        """Return the last lines that do not end with a newline (yet)"""
+        events = []
+        for task, log in self.files.items():
+            if log.partial:
+                events.append((task, log.partial.decode(self.encoding, "replace")))
+                log.partial = b""
+        return events
+
+    def stop(self):
+        """Stop 'follow' (from another thread or from the loop)"""
+        self._stop.set()
+        if self._inotify is not None:
+            self._inotify.wake()
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def __enter__(self) -> "LogTailer":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _read_changes(self, changes: List[Tuple[str, str]]) -> list:
+        """Read the files reported by inotify"""
+        events = []
+        for directory, name in set(changes):
+            task = self.directories.get(directory, {}).get(name)
+            if task is None:
+                continue
+            try:
+                stat = os.stat(self.files[task].path)
+            except FileNotFoundError:
+                continue
+            events.extend(self._read(task, stat))
+        return events
+
+    def _read(self, task: Hashable, stat: os.stat_result) -> list:
+        """Read the bytes appended to a file since the previous read"""
+        log = self.files[task]
+        if stat.st_size == log.size and stat.st_mtime_ns == log.mtime:
+            return []
+        if stat.st_ino != log.inode or stat.st_size < log.offset:
+            # replaced or truncated (ex. the job was requeued)
+            log.inode, log.offset, log.partial = stat.st_ino, 0, b""
+        log.mtime = stat.st_mtime_ns
+
+        try:
+            fid = open(log.path, "rb")
+        except FileNotFoundError:
+            return []
+        with fid:
+            size = os.fstat(fid.fileno()).st_size
+            log.size = size
+            if size <= log.offset:
+                return []
+            # map the end of the file only (from a multiple of the granularity)
+            start = log.offset - log.offset % mmap.ALLOCATIONGRANULARITY
+            with mmap.mmap(
+                fid.fileno(), size - start, access=mmap.ACCESS_READ, offset=start
+            ) as data:
+                lines = []
+                position, end = log.offset - start, size - start
+                newline = data.find(b"\n", position, end)
+                while newline >= 0:
+                    line = log.partial + data[position:newline]
+                    log.partial = b""
+                    lines.append((task, line.decode(self.encoding, "replace")))
+                    position = newline + 1
+                    newline = data.find(b"\n", position, end)
+                log.partial += data[position:end]
+        log.offset = size
+        return lines
@@ -0,0 +1,356 @@
+import itertools
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+from simple_slurm.commands import stream_command
+from simple_slurm.squeue import _join_values, _job_id_key, _parse_int, parse_duration
+
+# fields that are always queried, as they are indexed by the cache
+REQUIRED_FIELDS = ("JobID", "JobName", "State", "Submit", "Start", "End")
+
+DEFAULT_FIELDS = REQUIRED_FIELDS + ("Partition", "Elapsed", "ExitCode", "NNodes")
+
+# sacct's time format (in local time)
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+# the watermark goes back by this margin (in seconds), so that jobs updated
+# while the previous query ran are not missed
+WATERMARK_MARGIN = 60
+
+# number of jobs inserted into the cache at once, while sacct's output is read
+UPDATE_BATCH_SIZE = 5000
+
+
+@lru_cache(maxsize=65536)
+def parse_time(value: str) -> Optional[datetime]:
+    """Parse a sacct time (None if 'Unknown', 'None'...)"""
+    try:
+        return datetime.strptime(value, TIME_FORMAT)
+    except ValueError:
+        return None
+
+
+SACCT_CONVERTERS = {
+    "JobID": _job_id_key,
+    "Submit": parse_time,
+    "Eligible": parse_time,
+    "Start": parse_time,
+    "End": parse_time,
+    "Elapsed": parse_duration,
+    "Timelimit": parse_duration,
+    "CPUTime": parse_duration,
+    "TotalCPU": parse_duration,
+    "NNodes": _parse_int,
+    "NCPUS": _parse_int,
+    "AllocCPUS": _parse_int,
+    "ReqCPUS": _parse_int,
+    "NTasks": _parse_int,
+}
+
+
+def field_name(field: str) -> str:
+    """Attribute name of a sacct field, ex. 'JobID' -> 'job_id'"""
+    return re.sub(
+        r"(?<=[a-z0-9])(?=[A-Z])|(?<=[A-Z])(?=[A-Z][a-z])", "_", field
+    ).lower()
+
+
+@lru_cache(maxsize=None)
+def sacct_record_type(fields: tuple) -> tuple:
+    """Return the record type (namedtuple) and the value converters for the
+    given sacct fields
+    """
+    record_type = namedtuple("SacctJob", [field_name(f) for f in fields], rename=True)
+    converters = [SACCT_CONVERTERS.get(field, str) for field in fields]
+    return record_type, converters
+
+
+def parse_sacct_stream(lines: Iterable[str], fields: Sequence[str]) -> Iterator[tuple]:
+    """Parse the output of 'sacct --parsable2 --noheader' (with the given
+    fields) line by line, yielding a typed record per job:
+        - JobID: int (job array tasks and steps, ex. '1234_5', are kept as str)
+        - Submit, Start, End...: datetime.datetime (None if unknown)
+        - Elapsed, Timelimit...: datetime.timedelta
+        - NNodes, NCPUS...: int
+    """
+    record_type, converters = sacct_record_type(tuple(fields))
+    for values in split_sacct_stream(lines, len(fields)):
+        yield record_type._make(
+            [convert(value) for convert, value in zip(converters, values)]
+        )
+
+
+def split_sacct_stream(lines: Iterable[str], count: int) -> Iterator[List[str]]:
+    """Split the output of 'sacct --parsable2' line by line, yielding the
+    (raw) values of each job, the lines without 'count' values are skipped
+    """
+    for line in lines:
+        values = line.rstrip("\n").split("|")
+        if len(values) == count:
+            yield values
+
+
+def _timestamp(value: str) -> Optional[float]:
+    """Epoch time of a sacct time, as stored (and indexed) by the cache"""
+    parsed = parse_time(value)
+    return None if parsed is None else parsed.timestamp()
+
+
+def _format_time(value) -> str:
+    """Format a datetime (or epoch time) as a sacct time"""
+    if not isinstance(value, datetime):
+        value = datetime.fromtimestamp(value)
+    return value.strftime(TIME_FORMAT)
+
+
+class SlurmSacctWrapper:
+    """Access to the finished (and running) jobs from the accounting (sacct).
+
+    The jobs are stored in a local SQLite cache ('cache_path', in memory by
+    default) keyed by job id. Each 'update' only asks sacct for the jobs that
+    changed since the previous one (the watermark), and 'query' is served by
+    the cache:
+        > sacct = SlurmSacctWrapper("~/.cache/sacct.sqlite")
+        > sacct.update(start=datetime.now() - timedelta(days=7))
+        > failed = sacct.query(states="FAILED", name="train")
+    """
+
+    def __init__(
+        self,
+        cache_path: Optional[str] = None,
+        fields: Sequence[str] = DEFAULT_FIELDS,
+        command: str = "sacct",
+    ):
+        self.command = command
+        self.fields = list(REQUIRED_FIELDS) + [
+            field for field in fields if field not in REQUIRED_FIELDS
+        ]
+        self.columns = [field_name(field) for field in self.fields]
+
+        if cache_path is None:
+            cache_path = ":memory:"
+        else:
+            cache_path = os.path.expanduser(cache_path)
+        self.cache_path = cache_path
+        self._db = sqlite3.connect(cache_path, timeout=60, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._init_cache()
+
+    def _init_cache(self):
+        """Create the tables, the cache is reset if the fields changed"""
+        fields = ",".join(self.fields)
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            row = self._db.execute(
+                "SELECT value FROM meta WHERE key = 'fields'"
+            ).fetchone()
+            if row is not None and row[0] != fields:
+                self._db.execute("DROP TABLE IF EXISTS jobs")
+                self._db.execute("DELETE FROM meta")
+            columns = ", ".join(f'"{column}" TEXT' for column in self.columns)
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS jobs ({columns}, state_name TEXT, "
+                "submit_ts REAL, start_ts REAL, end_ts REAL, PRIMARY KEY (job_id))"
+            )
+            for column in ("job_name", "state_name", "submit_ts", "end_ts"):
+                self._db.execute(
+                    f"CREATE INDEX IF NOT EXISTS jobs_{column} ON jobs ({column})"
+                )
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('fields', ?)", (fields,)
+            )
+
+    @property
+    def watermark(self) -> Optional[float]:
+        """Epoch time since which the jobs are to be fetched by 'update'"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM meta WHERE key = 'watermark'"
+            ).fetchone()
+        return None if row is None else float(row[0])
+
+    def iter_sacct(
+        self,
+        start=None,
+        end=None,
+        job_ids=None,
+        states=None,
+        name=None,
+        allocations: bool = True,
+    ) -> Iterator[tuple]:
+        """Run sacct and yield the jobs as they are read from its output
+        (see 'parse_sacct_stream'), without caching them. 'start' and 'end'
+        (datetime, or epoch time) select the jobs that were pending or running
+        within this time range.
+        """
+        command = self._sacct_command(start, end, job_ids, states, name, allocations)
+        yield from stream_command(
+            command,
+            "SlurmSacctWrapper.iter_sacct",
+            lambda stdout: parse_sacct_stream(stdout, self.fields),
+        )
+
+    def update(self, start=None) -> int:
+        """Fetch the jobs that changed since the watermark (or since 'start',
+        by default midnight as sacct does, for the first update) into the
+        cache, return their number. A 'start' older than the watermark fills
+        the cache with the older jobs as well.
+
+        The output of sacct is parsed as it is read, and inserted into the
+        cache by batches (of UPDATE_BATCH_SIZE jobs).
+        """
+        watermark = self.watermark
+        if watermark is not None:
+            since = watermark - WATERMARK_MARGIN
+            start = since if start is None else min(_epoch(start), since)
+        elif start is None:
+            start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        now = time.time()
+
+        rows = stream_command(
+            self._sacct_command(start=start),
+            "SlurmSacctWrapper.update",
+            self._cache_rows,
+        )
+        marks = ",".join("?" * (len(self.fields) + 4))
+        count = 0
+        while True:
+            batch = list(itertools.islice(rows, UPDATE_BATCH_SIZE))
+            with self._lock, self._db:
+                self._db.executemany(
+                    f"INSERT OR REPLACE INTO jobs VALUES ({marks})", batch
+                )
+                count += len(batch)
+                if len(batch) < UPDATE_BATCH_SIZE:
+                    # sacct is done (a RuntimeError is raised if it failed)
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO meta VALUES ('watermark', ?)",
+                        (str(now),),
+                    )
+                    return count
+
+    def _cache_rows(self, lines: Iterable[str]) -> Iterator[list]:
+        """Rows of the cache (the raw values, then the indexed columns) of the
+        jobs listed by sacct
+        """
+        state = self.fields.index("State")
+        times = [self.fields.index(field) for field in ("Submit", "Start", "End")]
+        for values in split_sacct_stream(lines, len(self.fields)):
+            yield (
+                values
+                + [values[state].split(" ")[0]]
+                + [_timestamp(values[i]) for i in times]
+            )
+
+    def query(
+        self,
+        job_ids=None,
+        name=None,
+        states=None,
+        start=None,
+        end=None,
+        refresh: bool = True,
+    ) -> List[tuple]:
+        """Return the cached jobs (as typed records, see 'parse_sacct_stream')
+        matching all the given filters, after fetching the recent changes
+        (unless 'refresh' is False):
+            - job_ids:  job id(s)
+            - name:     job name(s)
+            - states:   state(s), ex. 'FAILED' or ['FAILED', 'TIMEOUT']
+            - start:    jobs that ended after (or did not end before) 'start'
+            - end:      jobs that were submitted before 'end'
+        """
+        if refresh:
+            self.update()
+
+        conditions, parameters = [], []
+        for column, values in (
+            ("job_id", job_ids),
+            ("job_name", name),
+            ("state_name", states),
+        ):
+            values = _join_values(values)
+            if values:
+                values = values.split(",")
+                conditions.append(f"{column} IN ({','.join('?' * len(values))})")
+                parameters.extend(values)
+        if start is not None:
+            conditions.append("(end_ts IS NULL OR end_ts >= ?)")
+            parameters.append(_epoch(start))
+        if end is not None:
+            conditions.append("submit_ts <= ?")
+            parameters.append(_epoch(end))
+
+        columns = ",".join(f'"{column}"' for column in self.columns)
+        sql = f"SELECT {columns} FROM jobs"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        with self._lock:
+            rows = self._db.execute(sql + " ORDER BY submit_ts", parameters).fetchall()
+
+        record_type, converters = sacct_record_type(tuple(self.fields))
+        return [
+            record_type._make(
+                [convert(value) for convert, value in zip(converters, row)]
+            )
+            for row in rows
+        ]
+
+    def get(self, job_id, refresh: bool = False) -> Optional[tuple]:
+        """Return the cached record of a job (None if unknown)"""
+        records = self.query(job_ids=job_id, refresh=refresh)
+        return records[0] if records else None
+
+    def clear(self):
+        """Empty the cache (and reset the watermark)"""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM jobs")
+            self._db.execute("DELETE FROM meta WHERE key = 'watermark'")
+
+    def close(self):
+        self._db.close()
+
+    def _sacct_command(
+        self,
+        start=None,
+        end=None,
+        job_ids=None,
+        states=None,
+        name=None,
+        allocations: bool = True,
+    ) -> list:
+        """Arguments of the sacct call, with the given filters"""
+        command = [
+            self.command,
+            "--parsable2",
+            "--noheader",
+            f"--format={','.join(self.fields)}",
+        ]
+        if allocations:
+            command.append("--allocations")
+        if start is not None:
+            command.append(f"--starttime={_format_time(start)}")
+        if end is not None:
+            command.append(f"--endtime={_format_time(end)}")
+        for option, value in (
+            ("--jobs", job_ids),
+            ("--state", states),
+            ("--name", name),
+        ):
+            value = _join_values(value)
+            if value:
+                command.append(f"{option}={value}")
+        return command
+
+
+def _epoch(value) -> float:
+    return value.timestamp() if isinstance(value, datetime) else float(value)
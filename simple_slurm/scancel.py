@@ -1,25 +1,72 @@
+import heapq
+import itertools
+import os
+import re
 import subprocess
-from datetime import datetime, timedelta
+import threading
+import time
+from datetime import timedelta
 import logging
+from typing import Iterable, List, Optional
+
+from simple_slurm.commands import run_command
 
-logging.basicConfig()
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
 
+# job ids reported in scancel's error messages, ex.
+# "scancel: error: Kill job error on job id 1234: Invalid job id specified"
+FAILED_JOB_ID = re.compile(r"job id (\d+(?:_\d+)?)")
 
-class SlurmScancelWrapper:
-    sigmtems = {}
-    sigmkills = {}
-    stale_delta = None
 
-    def __init__(self, staledelta=timedelta(minutes=30)):
+# escalation steps of 'signal_job': the name of the step and its scancel option
+ESCALATION_STEPS = (
+    ("TERM", "--signal=TERM"),
+    ("KILL", "--signal=KILL"),
+    ("CANCEL", None),  # plain scancel
+)
+
+
+class _Escalation:
+    """Escalation state of a single job"""
+
+    __slots__ = ("step", "sent", "version")
+
+    def __init__(self, step: int, sent: float, version: int):
+        self.step = step
+        self.sent = sent
+        self.version = version
+
+
+class SlurmScancelWrapper:
+    def __init__(
+        self,
+        staledelta=timedelta(minutes=30),
+        grace_periods=(timedelta(0), timedelta(0)),
+    ):
+        """'grace_periods' are the minimum delays before escalating from TERM
+        to KILL and from KILL to a plain scancel. The escalation state of a
+        job is forgotten 'staledelta' after its last signal.
+        """
         self.stale_delta = staledelta
+        self.grace_periods = tuple(grace_periods)
+
+        self._escalations = {}
+        # heaps of (time, version, job_id), entries whose version does not
+        # match the current escalation of the job are outdated
+        self._stale_heap = []
+        self._due_heap = []
+        self._sequence = itertools.count()
+        self._lock = threading.RLock()
+
+        self._reaper = None
+        self._reaper_stop = threading.Event()
 
     def cancel_job(self, job_id: int):
         """Sends a straightforward scancel to a job"""
         job_id = str(job_id)
-        result = subprocess.run(
+        result = run_command(
             ["scancel", job_id],
+            "SlurmScancelWrapper.cancel_job",
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
@@ -27,26 +74,123 @@ class SlurmScancelWrapper:
         if result.returncode != 0:
             raise RuntimeError(f"Error cancelling job: {result.stderr.strip()}")
 
-    def signal_job(self, job_id: int):
+    def signal_job(self, job_id: int) -> Optional[str]:
         """First time it is sent to a job, tries send a SIGTERM to the job id
-        If sent again to the same job, attempts a SIGKILL instead
-        if that fails as well, involkes scancel without term arguments
+        If sent again to the same job (after the first grace period), attempts
+        a SIGKILL instead. If sent once more (after the second grace period),
+        invokes scancel without term arguments.
+
+        Returns the step that was sent ('TERM', 'KILL' or 'CANCEL'), or None
+        if the grace period of the current step has not elapsed yet.
         """
         job_id = str(job_id)
-        self.prune_old_jobs()
-        signal = "--signal=TERM"
-        if job_id not in self.sigmtems:
-            self.sigmtems[job_id] = datetime.now()
-        elif job_id in self.sigmtems:
-            signal = "--signal=KILL"
-            self.sigmkills[job_id] = datetime.now()
+        with self._lock:
+            self.prune_old_jobs()
+            escalation = self._escalations.get(job_id)
+            if escalation is None:
+                step = 0
+            elif self._is_due(escalation, time.monotonic()):
+                step = min(escalation.step + 1, len(ESCALATION_STEPS) - 1)
+            else:
+                return None
+            return self._send_step(job_id, step)
+
+    def forget_job(self, job_id: int):
+        """Clears out the signals information of a job (ex. once it ended)"""
+        with self._lock:
+            self._escalations.pop(str(job_id), None)
+            self._compact_heaps()
+
+    def prune_old_jobs(self):
+        """Clears out signals information older than self.stale_delta"""
+        with self._lock:
+            now = time.monotonic()
+            while self._stale_heap and self._stale_heap[0][0] <= now:
+                _, version, job_id = heapq.heappop(self._stale_heap)
+                escalation = self._escalations.get(job_id)
+                if escalation is not None and escalation.version == version:
+                    del self._escalations[job_id]
+            self._compact_heaps()
+
+    def _compact_heaps(self):
+        """Drops the outdated entries of the heaps once they make up most of
+        them, so that they stay proportional to the number of jobs (the due
+        heap is otherwise only drained by 'escalate_due_jobs')
+        """
+        limit = 2 * len(self._escalations)
+        for heap in (self._stale_heap, self._due_heap):
+            if len(heap) > limit:
+                heap[:] = [
+                    entry
+                    for entry in heap
+                    if entry[2] in self._escalations
+                    and self._escalations[entry[2]].version == entry[1]
+                ]
+                heapq.heapify(heap)
+
+    def escalate_due_jobs(self) -> dict:
+        """Escalates all the jobs whose grace period has elapsed, without
+        waiting for another 'signal_job' call. Returns the steps that were
+        sent, as a dict {job_id: step}. Jobs that cannot be signaled anymore
+        (ex. finished) are forgotten.
+        """
+        sent = {}
+        with self._lock:
+            self.prune_old_jobs()
+            now = time.monotonic()
+            while self._due_heap and self._due_heap[0][0] <= now:
+                _, version, job_id = heapq.heappop(self._due_heap)
+                escalation = self._escalations.get(job_id)
+                if escalation is None or escalation.version != version:
+                    continue
+                try:
+                    sent[job_id] = self._send_step(job_id, escalation.step + 1)
+                except RuntimeError as error:
+                    logger.warning(f"Failed to escalate {job_id}: {error}")
+                    del self._escalations[job_id]
+        return sent
+
+    def start_reaper(self, interval: float = 1.0):
+        """Starts a background thread escalating the jobs every 'interval'
+        seconds (see 'escalate_due_jobs')
+        """
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+        self._reaper_stop.clear()
+        self._reaper = threading.Thread(
+            target=self._reap, args=(interval,), name="scancel-reaper", daemon=True
+        )
+        self._reaper.start()
+
+    def stop_reaper(self):
+        """Stops the background reaper thread"""
+        self._reaper_stop.set()
+        if self._reaper is not None:
+            self._reaper.join()
+            self._reaper = None
+
+    def _reap(self, interval: float):
+        while not self._reaper_stop.wait(interval):
+            self.escalate_due_jobs()
+
+    def _is_due(self, escalation: _Escalation, now: float) -> bool:
+        """Whether the grace period of the current step has elapsed"""
+        if escalation.step >= len(self.grace_periods):
+            return True
+        grace = self.grace_periods[escalation.step].total_seconds()
+        return now - escalation.sent >= grace
+
+    def _send_step(self, job_id: str, step: int) -> str:
+        """Runs scancel for the given escalation step and records it"""
+        name, option = ESCALATION_STEPS[step]
+        if step == 1:
             logger.warning(f"Failed to SIGTERM {job_id}. Sending SIGKILL")
-        # Just straight up kills the node via slurm
-        elif job_id in self.sigmkills:
-            signal = ""
+        elif step == 2:
+            # Just straight up kills the node via slurm
             logger.warning(f"Failed to SIGKILL {job_id}. Terminating with scancel")
-        result = subprocess.run(
-            ["scancel", signal, job_id],
+        result = run_command(
+            ["scancel", *([option] if option else []), job_id],
+            "SlurmScancelWrapper.signal_job",
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
@@ -54,20 +198,118 @@ class SlurmScancelWrapper:
         if result.returncode != 0:
             raise RuntimeError(f"Error cancelling job: {result.stderr.strip()}")
 
-    def prune_old_jobs(self):
-        """Clears out signals information older than self.stale_delta"""
-        for signals in [self.sigmtems, self.sigmkills]:
-            for job_id in signals:
-                if self.sigmtems[job_id] < datetime.now() - self.stale_delta:
-                    del self.sigmtems[job_id]
+        now = time.monotonic()
+        version = next(self._sequence)
+        self._escalations[job_id] = _Escalation(step, now, version)
+        stale = now + self.stale_delta.total_seconds()
+        heapq.heappush(self._stale_heap, (stale, version, job_id))
+        if step < len(ESCALATION_STEPS) - 1:
+            due = now + self.grace_periods[step].total_seconds()
+            heapq.heappush(self._due_heap, (due, version, job_id))
+        return name
 
     def cancel_all(self):
         """Cancels all jobs from the current user"""
-        result = subprocess.run(
+        result = run_command(
             ["scancel", "--me"],
+            "SlurmScancelWrapper.cancel_all",
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
         )
         if result.returncode != 0:
             raise RuntimeError(f"Error cancelling job: {result.stderr.strip()}")
+
+    def cancel_jobs(
+        self,
+        job_ids: Iterable[int] = (),
+        name: Optional[str] = None,
+        state: Optional[str] = None,
+        partition: Optional[str] = None,
+        signal: Optional[str] = None,
+    ) -> List[int]:
+        """Cancels many jobs (or sends them 'signal', ex. 'TERM'), using as
+        few scancel calls as possible: the job ids are grouped into chunks
+        that fit in the maximum command line length of the system.
+
+        The jobs can also be selected by 'name', 'state' and 'partition'. When
+        no job id is given, these filters apply to all jobs of the current
+        user, otherwise only to the given jobs.
+
+        Returns the job ids that could not be cancelled.
+        """
+        options = [
+            f"{option}={value}"
+            for option, value in (
+                ("--signal", signal),
+                ("--name", name),
+                ("--state", state),
+                ("--partition", partition),
+            )
+            if value is not None
+        ]
+        job_ids = list(job_ids)
+        if not job_ids:
+            if name is None and state is None and partition is None:
+                raise ValueError("Provide job ids or filters to select the jobs")
+            self._bulk_scancel(["scancel", "--me", *options], [])
+            return []
+
+        failed = []
+        for chunk in self._chunk_job_ids(["scancel", *options], job_ids):
+            failed.extend(self._bulk_scancel(["scancel", *options], chunk))
+        return failed
+
+    def signal_jobs(
+        self, job_ids: Iterable[int], signal: str = "TERM", **filters
+    ) -> List[int]:
+        """Sends 'signal' to many jobs, see 'cancel_jobs'"""
+        return self.cancel_jobs(job_ids, signal=signal, **filters)
+
+    def _bulk_scancel(self, command: List[str], job_ids: list) -> list:
+        """Run a single scancel call and return the job ids that failed"""
+        result = run_command(
+            command + [str(job_id) for job_id in job_ids],
+            "SlurmScancelWrapper.cancel_jobs",
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        by_str = {str(job_id): job_id for job_id in job_ids}
+        failed = [
+            by_str[match]
+            for match in FAILED_JOB_ID.findall(result.stderr)
+            if match in by_str
+        ]
+        if result.returncode != 0 and not failed:
+            if not job_ids:
+                raise RuntimeError(f"Error cancelling job: {result.stderr.strip()}")
+            failed = job_ids
+        for job_id in failed:
+            logger.warning(f"Failed to cancel {job_id}")
+        return list(dict.fromkeys(failed))
+
+    @staticmethod
+    def _chunk_job_ids(command: List[str], job_ids: list) -> Iterable[list]:
+        """Split the job ids into chunks that fit, with the command, in the
+        maximum length of the arguments and environment (ARG_MAX)
+        """
+        try:
+            arg_max = os.sysconf("SC_ARG_MAX")
+        except (AttributeError, ValueError, OSError):
+            arg_max = 131072
+        # each argument also takes a pointer, keep a safety margin
+        environment = sum(len(k) + len(v) + 2 + 8 for k, v in os.environ.items())
+        budget = arg_max // 2 - environment - sum(len(arg) + 1 + 8 for arg in command)
+        budget = max(budget, 4096)
+
+        chunk, size = [], 0
+        for job_id in job_ids:
+            length = len(str(job_id)) + 1 + 8
+            if chunk and size + length > budget:
+                yield chunk
+                chunk, size = [], 0
+            chunk.append(job_id)
+            size += length
+        if chunk:
+            yield chunk
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from typing import Optional
+
+
+def write_atomic(path: str, text: str):
+    """Write 'text' to 'path' through a temporary file renamed over it, so
+    that readers (and concurrent writers) never see a partial file
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as fid:
+            fid.write(text)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+class ScriptStore:
+    """Directory of job scripts stored under their content hash, which can be
+    given as 'job_file' to 'Slurm.sbatch':
+        > store = ScriptStore("~/.cache/slurm_scripts", max_age=7 * 24 * 3600)
+        > slurm.sbatch("python main.py", job_file=store)
+
+    Each script is written once (atomically), identical scripts reuse the
+    same file: scripts already stored by this object need no I/O at all. The
+    scripts are spread over 256 subdirectories to keep directories small.
+
+    Slurm keeps its own copy of the script of a submitted job, so the stored
+    files can be removed at any time: 'evict' removes the scripts older than
+    'max_age' seconds, then the oldest ones until the store is smaller than
+    'max_size' bytes. It is run when the store is created. As the scripts
+    known by a store are not checked again, a store shared by several
+    processes should only evict scripts older than these processes.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_age: Optional[float] = None,
+        max_size: Optional[int] = None,
+    ):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_age = max_age
+        self.max_size = max_size
+        self._known = set()
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.evict()
+
+    @staticmethod
+    def digest(script: str) -> str:
+        return hashlib.sha256(script.encode()).hexdigest()
+
+    def path(self, digest: str) -> str:
+        """Path of the script with the given content hash"""
+        return os.path.join(self.directory, digest[:2], digest + ".sh")
+
+    def put(self, script: str) -> str:
+        """Store a script (if needed), return its path"""
+        digest = self.digest(script)
+        path = self.path(digest)
+        with self._lock:
+            if digest in self._known:
+                return path
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, script)
+        with self._lock:
+            self._known.add(digest)
+        return path
+
+    def __contains__(self, script: str) -> bool:
+        return os.path.exists(self.path(self.digest(script)))
+
+    def _scripts(self) -> list:
+        """Return the stored scripts, as (mtime, size, path) tuples"""
+        scripts = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir():
+                continue
+            for script in os.scandir(entry.path):
+                if script.name.endswith(".sh"):
+                    try:
+                        stat = script.stat()
+                    except FileNotFoundError:
+                        continue  # removed concurrently
+                    scripts.append((stat.st_mtime, stat.st_size, script.path))
+        return scripts
+
+    def evict(self, max_age: Optional[float] = None, max_size: Optional[int] = None):
+        """Remove the scripts older than 'max_age' seconds, then the oldest
+        scripts until the total size is at most 'max_size' bytes (by default
+        the limits of the store). Returns the number of removed scripts.
+        """
+        max_age = self.max_age if max_age is None else max_age
+        max_size = self.max_size if max_size is None else max_size
+        if max_age is None and max_size is None:
+            return 0
+
+        # oldest scripts first
+        scripts = sorted(self._scripts())
+        count = 0
+        if max_age is not None:
+            limit = time.time() - max_age
+            while count < len(scripts) and scripts[count][0] < limit:
+                count += 1
+        if max_size is not None:
+            size = sum(script[1] for script in scripts[count:])
+            while count < len(scripts) and size > max_size:
+                size -= scripts[count][1]
+                count += 1
+        removed = [path for _, _, path in scripts[:count]]
+
+        for path in removed:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._known.difference_update(
+                os.path.basename(path)[: -len(".sh")] for path in removed
+            )
+        return len(removed)
@@ -1,11 +1,300 @@
 import os
+import re
 import subprocess
 import csv
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+from functools import lru_cache
 from io import StringIO
+from typing import Callable, Iterable, Iterator, Optional
 
+from simple_slurm.commands import run_command, stream_command
+
+
+# header of the job state in squeue's output, for the compact (%t) and
+# extended (%T) formats
+STATE_COLUMNS = ("ST", "STATE")
+
+# states of the jobs that are done, with their compact form
+FINAL_STATES = {
+    "BF": "BOOT_FAIL",
+    "CA": "CANCELLED",
+    "CD": "COMPLETED",
+    "DL": "DEADLINE",
+    "F": "FAILED",
+    "NF": "NODE_FAIL",
+    "OOM": "OUT_OF_MEMORY",
+    "PR": "PREEMPTED",
+    "RV": "REVOKED",
+    "SE": "SPECIAL_EXIT",
+    "TO": "TIMEOUT",
+}
+
+
+class SqueueSnapshot:
+    """The parsed output of a single squeue call"""
+
+    def __init__(self, jobs: dict):
+        self.jobs = jobs
+        self.created = time.monotonic()
+        self._indexes = {}
+
+    def index(self, *columns: str) -> dict:
+        """Jobs grouped by the value of the first existing column, as a dict
+        {value: {job_id: job}}. Built on first use and kept with the snapshot.
+        """
+        if columns not in self._indexes:
+            index = {}
+            for job_id, job in self.jobs.items():
+                value = next((job[c] for c in columns if c in job), None)
+                index.setdefault(value, {})[job_id] = job
+            self._indexes[columns] = index
+        return self._indexes[columns]
+
+    @property
+    def age(self) -> float:
+        """Seconds elapsed since the squeue call"""
+        return time.monotonic() - self.created
+
+
+class SqueueSnapshotCache:
+    """Snapshots of squeue, keyed by the arguments of the squeue call.
+
+    A single instance is shared by all the SlurmSqueueWrapper objects of the
+    process. Concurrent requests for the same key share a single in-flight
+    squeue call. Each request decides with its own 'ttl' whether a snapshot
+    is recent enough, the snapshots being evicted once older than 'max_age'
+    seconds (whatever the 'ttl' of their creator).
+    """
+
+    def __init__(self, max_age: float = 300.0):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._snapshots = {}
+        self._in_flight = {}
+
+    def get(
+        self,
+        key: tuple,
+        ttl: float,
+        fetch: Callable[[], dict],
+        force: bool = False,
+    ) -> SqueueSnapshot:
+        """Return the snapshot for 'key' if it is not older than 'ttl' seconds
+        (and 'force' is False), otherwise create it with 'fetch'. If another
+        thread is already fetching it, wait for its result instead.
+        """
+        with self._lock:
+            self._evict_expired()
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None and not force and snapshot.age <= ttl:
+                return snapshot
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.snapshot
+
+        try:
+            flight.snapshot = SqueueSnapshot(fetch())
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if flight.snapshot is not None:
+                    self._snapshots[key] = flight.snapshot
+            flight.done.set()
+        return flight.snapshot
+
+    def peek(self, key: tuple, ttl: float) -> Optional[SqueueSnapshot]:
+        """Return the snapshot for 'key' if it is not older than 'ttl'
+        seconds, without creating it
+        """
+        with self._lock:
+            self._evict_expired()
+            snapshot = self._snapshots.get(key)
+        if snapshot is not None and snapshot.age <= ttl:
+            return snapshot
+        return None
+
+    def put(self, key: tuple, jobs: dict) -> SqueueSnapshot:
+        """Store the jobs listed by a squeue call made by the caller (ex.
+        asynchronously), return their snapshot
+        """
+        snapshot = SqueueSnapshot(jobs)
+        with self._lock:
+            self._snapshots[key] = snapshot
+        return snapshot
+
+    def clear(self):
+        """Drop all the snapshots"""
+        with self._lock:
+            self._snapshots.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._evict_expired()
+            return len(self._snapshots)
+
+    def _evict_expired(self):
+        oldest = time.monotonic() - self.max_age
+        expired = [k for k, v in self._snapshots.items() if v.created < oldest]
+        for key in expired:
+            del self._snapshots[key]
+
+
+def _join_values(*values) -> str:
+    """Join single values and iterables of values into a comma separated list"""
+    items = []
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, (str, int)):
+            items.append(str(value))
+        else:
+            items.extend(str(item) for item in value)
+    return ",".join(items)
+
+
+def _job_id_key(job_id: str):
+    """Jobs are keyed by their integer id, job array tasks (ex. '1234_5') keep
+    their string id
+    """
+    return int(job_id) if job_id.isdigit() else job_id
+
+
+def parse_squeue_stream(lines: Iterable[str]) -> Iterator[tuple]:
+    """Parse squeue's output line by line, yielding a namedtuple per job.
+
+    The fields are named after the header (ex. 'JOBID' -> 'job_id',
+    'NODELIST(REASON)' -> 'nodelist_reason') and known columns are typed:
+        - job ids: int (job array tasks, ex. '1234_5', are kept as str)
+        - TIME, TIME_LEFT, TIME_LIMIT: datetime.timedelta (None if unlimited)
+        - NODES, CPUS: int
+    """
+    reader = csv.reader(lines, delimiter=",", quotechar='"', skipinitialspace=True)
+    header = next(reader, None)
+    if header is None:
+        return
+    record_type, converters = squeue_record_type(tuple(header))
+    make = record_type._make
+    for row in reader:
+        if row:
+            yield make([convert(value) for convert, value in zip(converters, row)])
+
+
+@lru_cache(maxsize=None)
+def squeue_record_type(header: tuple) -> tuple:
+    """Return the record type (namedtuple) and the value converters for the
+    given squeue header
+    """
+    fields = [SQUEUE_FIELDS.get(column, column) for column in header]
+    fields = [re.sub(r"\W+", "_", field).strip("_").lower() for field in fields]
+    record_type = namedtuple("SqueueJob", fields, rename=True)
+    converters = [SQUEUE_CONVERTERS.get(column, str) for column in header]
+    return record_type, converters
+
+
+@lru_cache(maxsize=65536)
+def parse_duration(value: str) -> Optional[timedelta]:
+    """Parse a Slurm duration ([days-][hours:]minutes:seconds), durations are
+    cached as many jobs share the same values (ex. time limits)
+    """
+    days, _, clock = value.rpartition("-")
+    try:
+        parts = [int(part) for part in clock.split(":")]
+        days = int(days) if days else 0
+    except ValueError:
+        return None  # ex. 'UNLIMITED', 'INVALID', 'N/A'
+    seconds = 0
+    for part in parts:
+        seconds = seconds * 60 + part
+    if len(parts) == 1:
+        seconds *= 60  # a single value is given in minutes
+    return timedelta(days=days, seconds=seconds)
+
+
+def _parse_int(value: str) -> Optional[int]:
+    return int(value) if value.isdigit() else None
+
+
+SQUEUE_FIELDS = {
+    "JOBID": "job_id",
+    "ST": "state",
+    "NODELIST(REASON)": "nodelist_reason",
+}
+SQUEUE_CONVERTERS = {
+    "JOBID": _job_id_key,
+    "ARRAY_JOB_ID": _job_id_key,
+    "TIME": parse_duration,
+    "TIME_LEFT": parse_duration,
+    "TIME_LIMIT": parse_duration,
+    "NODES": _parse_int,
+    "CPUS": _parse_int,
+}
+
+
+def _summarize_states(states: list) -> str:
+    """State of a job from the states of its tasks: the first one that did not
+    complete, if any
+    """
+    return next((state for state in states if state != "COMPLETED"), "COMPLETED")
+
+
+def sacct_final_states(job_ids: Iterable[int]) -> dict:
+    """Return the states of finished jobs, from the accounting (sacct), as a
+    dict {job_id: state}. Jobs unknown to sacct are given the state 'UNKNOWN'.
+    """
+    job_ids = sorted(job_ids)
+    result = run_command(
+        ["sacct", "-X", "-n", "-P", "-o", "JobID,State"]
+        + ["-j", ",".join(str(job_id) for job_id in job_ids)],
+        "sacct_final_states",
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    found = {}
+    if result.returncode == 0:
+        for line in result.stdout.splitlines():
+            key, _, state = line.partition("|")
+            job_id = key.split("_")[0].split(".")[0]
+            if job_id.isdigit() and state:
+                # ex. 'CANCELLED by 1000'
+                found.setdefault(int(job_id), []).append(state.split()[0])
+    return {
+        job_id: _summarize_states(found[job_id]) if job_id in found else "UNKNOWN"
+        for job_id in job_ids
+    }
+
+
+class _Flight:
+    """A squeue call in progress, shared by the threads waiting for it"""
 
-class SlurmSqueueWrapper:
     def __init__(self):
+        self.done = threading.Event()
+        self.snapshot = None
+        self.error = None
+
+
+class SlurmSqueueWrapper:
+    # snapshots shared by all the wrappers (and thus all the Slurm objects)
+    cache = SqueueSnapshotCache()
+
+    # maximum age (in seconds) of a snapshot that can be reused, set it at the
+    # class level to modify the default of all wrappers
+    ttl = 0.0
+
+    def __init__(self, ttl: Optional[float] = None):
         self.command = "squeue"
         self.default_format = '"%i","%j","%t","%M","%L","%D","%C","%m","%b","%R"'
         self.output_format = os.getenv("SQUEUE_FORMAT", self.default_format)
@@ -13,12 +302,99 @@ class SlurmSqueueWrapper:
         if not self._is_valid_csv_format(self.output_format):
             raise ValueError("Invalid CSV format in SQUEUE_FORMAT environment variable")
 
+        if ttl is not None:
+            self.ttl = ttl
+
         self.jobs = {}
+        self.snapshot = None
+
+    def update_squeue(
+        self,
+        force: bool = False,
+        job_ids=None,
+        name=None,
+        states=None,
+        partitions=None,
+        array_job_id=None,
+        reservation=None,
+    ):
+        """Refresh the information from the current queue for the current user
+
+        The optional filters are given to squeue (see 'query'), so that only
+        the matching jobs are listed.
+
+        A snapshot of the queue taken less than 'ttl' seconds ago, by any
+        wrapper of this process, is reused unless 'force' is True. Concurrent
+        calls share a single squeue call.
+        """
+        command = self._squeue_command(
+            job_ids=job_ids,
+            name=name,
+            states=states,
+            partitions=partitions,
+            array_job_id=array_job_id,
+            reservation=reservation,
+        )
+        self.snapshot = self.cache.get(
+            tuple(command), self.ttl, lambda: self._fetch_squeue(command), force
+        )
+        self.jobs = self.snapshot.jobs
+
+    def query(
+        self,
+        job_ids=None,
+        name=None,
+        states=None,
+        partitions=None,
+        array_job_id=None,
+        reservation=None,
+        force: bool = False,
+    ) -> dict:
+        """Refresh and return the jobs of the current user matching all the
+        given filters. The filtering is done by squeue itself:
+            - job_ids:      job id(s), as '--jobs'
+            - name:         exact job name(s), as '--name'
+            - states:       state(s) (ex. 'PD', 'RUNNING'), as '--states'
+            - partitions:   partition name(s), as '--partition'
+            - array_job_id: all the tasks of a job array, as '--jobs'
+            - reservation:  reservation name, as '--reservation'
+        Each filter accepts a single value or an iterable of values, ex.
+            > slurm.squeue.query(name="train", states=("PD", "R"))
+        """
+        self.update_squeue(
+            force=force,
+            job_ids=job_ids,
+            name=name,
+            states=states,
+            partitions=partitions,
+            array_job_id=array_job_id,
+            reservation=reservation,
+        )
+        return self.jobs
 
-    def update_squeue(self):
-        """Refresh the information from the current queue for the current user"""
-        result = subprocess.run(
-            [self.command, "--me", "-o", self.output_format],
+    def iter_squeue(self, **filters) -> Iterator[tuple]:
+        """Run squeue (with the filters of 'query') and yield the jobs as they
+        are read from its output, without storing them. Each job is a compact
+        typed record (see 'parse_squeue_stream'), ex.
+            > for job in slurm.squeue.iter_squeue(states="PD"):
+            >     print(job.job_id, job.time_left)
+        """
+        yield from stream_command(
+            self._squeue_command(**filters),
+            "SlurmSqueueWrapper.iter_squeue",
+            parse_squeue_stream,
+        )
+
+    @property
+    def snapshot_age(self) -> Optional[float]:
+        """Seconds elapsed since the current snapshot was taken (if any)"""
+        return None if self.snapshot is None else self.snapshot.age
+
+    def _fetch_squeue(self, command: list) -> dict:
+        """Run squeue and parse its output"""
+        result = run_command(
+            command,
+            "SlurmSqueueWrapper.update_squeue",
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
@@ -27,7 +403,32 @@ class SlurmSqueueWrapper:
         if result.returncode != 0:
             raise RuntimeError(f"Error running squeue: {result.stderr}")
 
-        self.jobs = self._parse_output(result.stdout)
+        return self._parse_output(result.stdout)
+
+    def _squeue_command(
+        self,
+        job_ids=None,
+        name=None,
+        states=None,
+        partitions=None,
+        array_job_id=None,
+        reservation=None,
+    ) -> list:
+        """Arguments of the squeue call listing the jobs of the current user,
+        with the given filters
+        """
+        command = [self.command, "--me", "-o", self.output_format]
+        jobs = _join_values(job_ids, array_job_id)
+        for option, value in (
+            ("--jobs", jobs),
+            ("--name", _join_values(name)),
+            ("--states", _join_values(states)),
+            ("--partition", _join_values(partitions)),
+            ("--reservation", _join_values(reservation)),
+        ):
+            if value:
+                command.append(f"{option}={value}")
+        return command
 
     def _is_valid_csv_format(self, format_str: str):
         """validates that the output is a valid csv"""
@@ -50,7 +451,7 @@ class SlurmSqueueWrapper:
         )
         jobs = {}
         for row in reader:
-            jobs[int(row["JOBID"])] = row
+            jobs[_job_id_key(row["JOBID"])] = row
         return jobs
 
     def display_jobs(self):
@@ -58,6 +459,20 @@ class SlurmSqueueWrapper:
         for job in self.jobs.values():
             print(job)
 
+    def get_jobs_by_name(self, name: str) -> dict:
+        """Jobs of the current snapshot with exactly the given name"""
+        if self.snapshot is None:
+            return {}
+        return dict(self.snapshot.index("NAME").get(name, {}))
+
+    def get_jobs_by_state(self, state: str) -> dict:
+        """Jobs of the current snapshot in the given state, as displayed by
+        squeue (ex. 'PD' for the default format)
+        """
+        if self.snapshot is None:
+            return {}
+        return dict(self.snapshot.index(*STATE_COLUMNS).get(state, {}))
+
     def get_filtered_jobs(self, name_seek: str):
         """Filters jobs by name"""
         matching_jobs = {}
@@ -65,3 +480,104 @@ class SlurmSqueueWrapper:
             if name_seek in job["NAME"]:
                 matching_jobs[job_id] = job
         return matching_jobs
+
+    def wait(
+        self,
+        job_ids: Iterable[int],
+        timeout: Optional[float] = None,
+        poll_interval: float = 1.0,
+        max_interval: float = 60.0,
+        backoff: float = 1.5,
+        sentinel: Optional[str] = None,
+    ) -> dict:
+        """Wait for the given jobs to finish and return their final states,
+        as a dict {job_id: state} (ex. 'COMPLETED', 'FAILED', 'TIMEOUT').
+
+        All the jobs still being waited for are queried with a single squeue
+        call per poll. The first poll happens after 'poll_interval' seconds,
+        the interval then grows by a factor 'backoff' (up to 'max_interval')
+        while no job finishes. Jobs that already left the queue are looked up
+        with sacct ('UNKNOWN' if not found).
+
+        'sentinel' is an optional path pattern (ex. '/scratch/done/{job_id}'),
+        typically a file written by the job epilogue, whose appearance wakes
+        up the waiter for an immediate poll (once per job, the interval being
+        kept if the job is not done yet).
+
+        A 'TimeoutError' is raised if the jobs are not done after 'timeout'
+        seconds.
+        """
+        remaining = {int(job_id) for job_id in job_ids}
+        states = {}
+        deadline = None if timeout is None else time.monotonic() + timeout
+        interval = poll_interval
+        # jobs whose sentinel file was already found
+        seen = set()
+        while remaining:
+            woken = self._sleep_until_poll(
+                interval, deadline, remaining - seen, sentinel, seen
+            )
+            done = self._poll_final_states(remaining)
+            states.update(done)
+            remaining.difference_update(done)
+            if done:
+                interval = poll_interval
+            elif not woken:
+                interval = min(interval * backoff, max_interval)
+            if remaining and deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Jobs still running: {sorted(remaining)}")
+        return states
+
+    def _sleep_until_poll(
+        self,
+        interval: float,
+        deadline: Optional[float],
+        job_ids: set,
+        sentinel: Optional[str],
+        seen: set,
+    ) -> bool:
+        """Sleep for 'interval' seconds (at most until 'deadline'), return True
+        if the sentinel file of one of 'job_ids' appeared meanwhile (the jobs
+        found are added to 'seen')
+        """
+        wake_up = time.monotonic() + interval
+        if deadline is not None:
+            wake_up = min(wake_up, deadline)
+        while True:
+            now = time.monotonic()
+            if now >= wake_up:
+                return False
+            if sentinel is None or not job_ids:
+                time.sleep(wake_up - now)
+                continue
+            found = {j for j in job_ids if os.path.exists(sentinel.format(job_id=j))}
+            if found:
+                seen.update(found)
+                return True
+            time.sleep(min(0.2, wake_up - now))
+
+    def _poll_final_states(self, job_ids: set) -> dict:
+        """Return the final states of the given jobs that are done"""
+        try:
+            jobs = self.query(job_ids=sorted(job_ids), states="all", force=True)
+        except RuntimeError as error:
+            # squeue fails if none of the jobs is known anymore
+            if "Invalid job id" not in str(error):
+                raise
+            jobs = {}
+
+        in_queue = {}
+        for key, job in jobs.items():
+            job_id = int(str(key).split("_")[0])
+            state = next((job[c] for c in STATE_COLUMNS if c in job), None)
+            in_queue.setdefault(job_id, []).append(FINAL_STATES.get(state, state))
+
+        done = {}
+        for job_id in job_ids.intersection(in_queue):
+            job_states = in_queue[job_id]
+            if all(state in FINAL_STATES.values() for state in job_states):
+                done[job_id] = _summarize_states(job_states)
+        gone = job_ids.difference(in_queue)
+        if gone:
+            done.update(sacct_final_states(gone))
+        return done
@@ -0,0 +1,253 @@
+import collections
+import datetime
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+# dependency types between two jobs (see sbatch's '--dependency')
+DEPENDENCY_TYPES = (
+    "after",
+    "afterany",
+    "afterburstbuffer",
+    "aftercorr",
+    "afternotok",
+    "afterok",
+)
+
+
+def parse_time_limit(value: str) -> Optional[datetime.timedelta]:
+    """Parse a time limit as given to sbatch's '--time': "minutes",
+    "minutes:seconds", "hours:minutes:seconds", "days-hours",
+    "days-hours:minutes" or "days-hours:minutes:seconds". Unlike squeue's
+    durations, a single value after the days is given in hours. Returns None
+    for "UNLIMITED" (or "INFINITE").
+    """
+    days, separator, clock = str(value).strip().rpartition("-")
+    try:
+        parts = [int(part) for part in clock.split(":")]
+        days = int(days) if separator else 0
+    except ValueError:
+        if str(value).strip().upper() in ("UNLIMITED", "INFINITE"):
+            return None
+        raise ValueError(f"Invalid time limit: {value!r}") from None
+    if len(parts) > 3:
+        raise ValueError(f"Invalid time limit: {value!r}")
+    if separator:
+        hours, minutes, seconds = parts + [0] * (3 - len(parts))
+    elif len(parts) == 3:
+        hours, minutes, seconds = parts
+    else:
+        hours, (minutes, seconds) = 0, (parts + [0])[:2]
+    return datetime.timedelta(days=days, hours=hours, minutes=minutes, seconds=seconds)
+
+
+class Workflow:
+    """Graph of jobs (Slurm objects) linked by dependencies, ex.
+        > workflow = Workflow()
+        > workflow.add("prepare", Slurm(time="00:10:00"), cmd="python prepare.py")
+        > for i in range(10):
+        >     workflow.add(f"train_{i}", Slurm(time="02:00:00"), after="prepare")
+        > workflow.add("report", Slurm(), after=dict.fromkeys(
+        >     [f"train_{i}" for i in range(10)], "afterany"))
+        > job_ids = workflow.submit()
+        > workflow.critical_path()  # (['prepare', 'train_0', 'report'], duration)
+
+    Each job is submitted as soon as all its parents were, with their job ids
+    filled in its '--dependency' (so independent branches are submitted
+    concurrently, each level of the graph in parallel).
+
+    If the submission of a job fails, its descendants are not submitted (and
+    are reported in 'skipped'), the other branches are not affected. Calling
+    'submit' again only submits the jobs without a job id.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.commands = {}
+        self.durations = {}
+        # dependencies of each node, as {parent: dependency type}
+        self.parents = {}
+        self.job_ids = {}
+        self.errors = {}
+        self.skipped = set()
+
+    def add(
+        self,
+        name: str,
+        slurm,
+        cmd: Union[str, Iterable[str]] = (),
+        after: Union[None, str, Iterable[str], Dict[str, str]] = None,
+        duration: Union[None, float, datetime.timedelta] = None,
+    ) -> str:
+        """Add the job 'name', submitted by (a copy of) the 'slurm' object
+        with the commands 'cmd'. It depends on the jobs 'after' (names), by
+        default with the 'afterok' type, or on a dict {name: type}.
+
+        Its 'duration' (seconds or timedelta, by default its time limit) is
+        used to find the critical path.
+        """
+        if name in self.nodes:
+            raise ValueError(f"Duplicate node: {name}")
+        self.nodes[name] = slurm._clone()
+        self.commands[name] = (cmd,) if isinstance(cmd, str) else tuple(cmd)
+        self.parents[name] = {}
+        if duration is not None:
+            if not isinstance(duration, datetime.timedelta):
+                duration = datetime.timedelta(seconds=duration)
+            self.durations[name] = duration
+
+        if after is None:
+            after = {}
+        elif isinstance(after, str):
+            after = {after: "afterok"}
+        elif not isinstance(after, dict):
+            after = dict.fromkeys(after, "afterok")
+        for parent, dependency in after.items():
+            self.add_edge(parent, name, dependency)
+        return name
+
+    def add_edge(self, parent: str, child: str, dependency: str = "afterok"):
+        """Make the job 'child' depend on the job 'parent'"""
+        for node in (parent, child):
+            if node not in self.nodes:
+                raise KeyError(f"Unknown node: {node}")
+        if dependency not in DEPENDENCY_TYPES:
+            raise ValueError(
+                f"Unknown dependency type {dependency!r}, "
+                f"expected one of {DEPENDENCY_TYPES}"
+            )
+        self.parents[child][parent] = dependency
+
+    def children(self) -> Dict[str, List[str]]:
+        children = {name: [] for name in self.nodes}
+        for child, parents in self.parents.items():
+            for parent in parents:
+                children[parent].append(child)
+        return children
+
+    def levels(self) -> List[List[str]]:
+        """Sort the graph topologically: return the nodes by level, the
+        nodes of a level only depend on nodes of the previous levels
+        """
+        children = self.children()
+        remaining = {name: len(parents) for name, parents in self.parents.items()}
+        level = [name for name, count in remaining.items() if count == 0]
+        levels = []
+        while level:
+            levels.append(level)
+            following = []
+            for name in level:
+                for child in children[name]:
+                    remaining[child] -= 1
+                    if remaining[child] == 0:
+                        following.append(child)
+            level = following
+        if sum(len(level) for level in levels) != len(self.nodes):
+            cycle = sorted(name for name, count in remaining.items() if count > 0)
+            raise ValueError(f"The workflow has a cycle, among: {cycle}")
+        return levels
+
+    def submit(
+        self,
+        max_workers: int = 8,
+        retries: int = 2,
+        retry_delay: float = 1.0,
+        **sbatch_kwargs,
+    ) -> Dict[str, Optional[int]]:
+        """Submit the jobs without a job id, return the job id of every job
+        as {name: job_id} (None for the failed and skipped ones, see 'errors'
+        and 'skipped'). Failed submissions are retried as in 'sbatch_many',
+        any other argument is passed to 'sbatch'.
+        """
+        self.levels()  # reject cycles before submitting anything
+        sbatch_kwargs.setdefault("verbose", False)
+        children = self.children()
+        self.errors.clear()
+        self.skipped.clear()
+
+        # number of parents of each node that are yet to be submitted
+        waiting = {
+            name: sum(parent not in self.job_ids for parent in parents)
+            for name, parents in self.parents.items()
+            if name not in self.job_ids
+        }
+        ready = collections.deque(name for name in self.nodes if waiting.get(name) == 0)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {}
+            while ready or pending:
+                while ready:
+                    name = ready.popleft()
+                    slurm = self._node_job(name)
+                    future = executor.submit(
+                        slurm._sbatch_with_retries, retries, retry_delay, sbatch_kwargs
+                    )
+                    pending[future] = name
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = pending.pop(future)
+                    try:
+                        self.job_ids[name] = future.result()
+                    except Exception as error:
+                        self.errors[name] = error
+                        self._skip_descendants(name, children)
+                        continue
+                    for child in children[name]:
+                        if child in waiting and child not in self.skipped:
+                            waiting[child] -= 1
+                            if waiting[child] == 0:
+                                ready.append(child)
+        return {name: self.job_ids.get(name) for name in self.nodes}
+
+    def _node_job(self, name: str):
+        """Return the Slurm object submitting the node, with the job ids of
+        its parents in its dependencies
+        """
+        slurm = self.nodes[name]._clone()
+        slurm.add_cmd(*self.commands[name])
+        by_type = {}
+        for parent, dependency in self.parents[name].items():
+            by_type.setdefault(dependency, []).append(str(self.job_ids[parent]))
+        if by_type:
+            dependencies = [f"{k}:{':'.join(v)}" for k, v in sorted(by_type.items())]
+            existing = getattr(slurm.namespace, "dependency", None)
+            if existing:
+                dependencies.insert(0, existing)
+            slurm.set_dependency(",".join(dependencies))
+        return slurm
+
+    def _skip_descendants(self, name: str, children: Dict[str, List[str]]):
+        stack = list(children[name])
+        while stack:
+            child = stack.pop()
+            if child not in self.skipped and child not in self.job_ids:
+                self.skipped.add(child)
+                stack.extend(children[child])
+
+    def duration(self, name: str) -> datetime.timedelta:
+        """Duration of a node: the given one, or else its time limit"""
+        if name in self.durations:
+            return self.durations[name]
+        limit = getattr(self.nodes[name].namespace, "time", None)
+        duration = parse_time_limit(limit) if limit else None
+        return datetime.timedelta(0) if duration is None else duration
+
+    def critical_path(self) -> Tuple[List[str], datetime.timedelta]:
+        """Return the longest chain of dependent jobs (by duration), which
+        bounds the duration of the whole workflow, and its duration
+        """
+        finish, previous = {}, {}
+        for level in self.levels():
+            for name in level:
+                start, previous[name] = datetime.timedelta(0), None
+                for parent in self.parents[name]:
+                    if finish[parent] > start:
+                        start, previous[name] = finish[parent], parent
+                finish[name] = start + self.duration(name)
+        if not finish:
+            return [], datetime.timedelta(0)
+
+        name = max(finish, key=finish.get)
+        total, path = finish[name], []
+        while name is not None:
+            path.append(name)
+            name = previous[name]
+        return path[::-1], total
@@ -0,0 +1,160 @@
+import asyncio
+import contextlib
+import io
+import os
+import subprocess
+import tempfile
+import time
+import unittest
+
+from simple_slurm import AsyncSlurm, Slurm, SlurmJob
+from simple_slurm.journal import SubmissionJournal
+from simple_slurm.squeue import SlurmSqueueWrapper
+
+from .utils import fake_commands
+
+
+class Testing(unittest.TestCase):
+    def test_01_sbatch(self):
+        slurm = AsyncSlurm(job_name="name", parsable=True)
+        with fake_commands(sbatch="grep -q 'echo \\$HOME' && echo 1234\n"):
+            with contextlib.redirect_stdout(io.StringIO()) as stdout:
+                job_id = asyncio.run(slurm.sbatch("echo $HOME"))
+
+        self.assertEqual(1234, job_id)
+        self.assertEqual("1234\n", stdout.getvalue())
+        # as for Slurm.sbatch, a SlurmJob is returned, also from the journal
+        self.assertIsInstance(job_id, SlurmJob)
+        self.assertIs(slurm.squeue, job_id.squeue)
+
+        # 'sbatch_cmd' is split into arguments
+        sbatch = 'test "$1" = --quiet && test "$2" = --test-only && echo 1235\n'
+        with tempfile.TemporaryDirectory() as directory:
+            journal = SubmissionJournal(os.path.join(directory, "journal.sqlite"))
+            with fake_commands(sbatch=sbatch):
+                for _ in range(2):
+                    job_id = asyncio.run(
+                        slurm.sbatch(
+                            sbatch_cmd="sbatch --quiet --test-only",
+                            verbose=False,
+                            journal=journal,
+                        )
+                    )
+                    self.assertEqual(1235, job_id)
+                    self.assertIsInstance(job_id, SlurmJob)
+
+    def test_02_sbatch_concurrent(self):
+        async def submit_all():
+            return await asyncio.gather(
+                *(
+                    AsyncSlurm(job_name=i).sbatch("echo Hello!", verbose=False)
+                    for i in range(50)
+                )
+            )
+
+        sbatch = "sleep 0.2; echo Submitted batch job $(sed -n 's/^#SBATCH --job-name *//p')\n"
+        with fake_commands(sbatch=sbatch):
+            start = time.perf_counter()
+            job_ids = asyncio.run(submit_all())
+            elapsed = time.perf_counter() - start
+
+        self.assertEqual(list(range(50)), job_ids)
+        self.assertLess(elapsed, 5)
+
+    def test_03_timeout(self):
+        slurm = AsyncSlurm(job_name="name")
+        with fake_commands(sbatch="exec sleep 10\n"):
+            start = time.perf_counter()
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(slurm.sbatch("echo Hello!", timeout=0.2))
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_04_srun(self):
+        slurm = AsyncSlurm(contiguous=True)
+        srun = 'test "$1" = --contiguous && shift && exec "$@"\n'
+        with fake_commands(srun=srun):
+            self.assertEqual(0, asyncio.run(slurm.srun("true")))
+            with self.assertRaises(subprocess.CalledProcessError):
+                asyncio.run(slurm.srun("false", connector="&&"))
+
+    def test_05_squeue_and_scancel(self):
+        squeue = 'echo \'"JOBID","NAME","ST"\'; echo \'"1234","name","R"\'\n'
+        scancel = 'test "$1" = 1234\n'
+        slurm = AsyncSlurm()
+        with fake_commands(squeue=squeue, scancel=scancel):
+            jobs = asyncio.run(slurm.update_squeue())
+            self.assertEqual("name", jobs[1234]["NAME"])
+            self.assertIs(jobs, slurm.squeue.jobs)
+            self.assertEqual([1234], list(slurm.squeue.get_jobs_by_name("name")))
+            self.assertEqual([1234], list(slurm.squeue.get_jobs_by_state("R")))
+            self.assertLess(slurm.squeue.snapshot_age, 5)
+
+            asyncio.run(slurm.cancel_job(1234))
+            with self.assertRaises(RuntimeError):
+                asyncio.run(slurm.cancel_job(5678))
+
+    def test_06_squeue_snapshots_shared(self):
+        squeue = """echo x >> "$(dirname "$0")/calls"
+sleep 0.1
+echo '"JOBID","NAME","ST"'; echo '"1234","name","R"'
+"""
+
+        async def refresh(count):
+            slurms = [AsyncSlurm() for _ in range(count)]
+            await asyncio.gather(*(slurm.update_squeue() for slurm in slurms))
+            return slurms
+
+        SlurmSqueueWrapper.cache.clear()
+        with fake_commands(squeue=squeue) as directory:
+            slurms = asyncio.run(refresh(5))
+            # the snapshot is reused by the synchronous wrappers
+            wrapper = SlurmSqueueWrapper(ttl=60)
+            wrapper.update_squeue()
+            with open(os.path.join(directory, "calls")) as fid:
+                self.assertEqual(1, len(fid.readlines()))
+        for slurm in slurms:
+            self.assertIs(wrapper.snapshot, slurm.squeue.snapshot)
+
+    def test_07_sbatch_many(self):
+        # the fake sbatch answers with the job name, and fails for "fail"
+        sbatch = """name=$(sed -n 's/^#SBATCH --job-name *//p')
+test "$name" = fail && exit 1
+sleep 0.1
+echo "$name"
+"""
+        slurm = AsyncSlurm(parsable=True)
+        with fake_commands(sbatch=sbatch):
+            start = time.perf_counter()
+            job_ids = asyncio.run(
+                slurm.sbatch_many([dict(job_name=i) for i in range(20)], max_workers=10)
+            )
+            elapsed = time.perf_counter() - start
+            self.assertEqual(list(range(20)), job_ids)
+            self.assertLess(elapsed, 1.5)
+
+            # the variants after the failure are not submitted
+            variants = [dict(job_name="fail")] + [dict(job_name=i) for i in range(5)]
+            with self.assertRaises(AssertionError) as context:
+                asyncio.run(slurm.sbatch_many(variants, max_workers=1, retries=0))
+            self.assertEqual([None] * 6, context.exception.job_ids)
+
+            job_ids = asyncio.run(
+                slurm.sbatch_many(variants, retries=0, raise_errors=False)
+            )
+            self.assertEqual([None, 0, 1, 2, 3, 4], job_ids)
+
+    def test_08_synchronous_only(self):
+        slurm = AsyncSlurm()
+        for method, args in (
+            (slurm.sbatch_array, (["echo 1"], "tasks.txt")),
+            (slurm.sbatch_farm, ("farm",)),
+            (slurm.wait, ([1234],)),
+        ):
+            with self.assertRaises(TypeError):
+                method(*args)
+        with self.assertRaises(TypeError):
+            asyncio.run(AsyncSlurm().sbatch_many([Slurm()]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,6 @@
 import contextlib
 import io
+import json
 import os
 import shutil
 import subprocess
@@ -8,6 +9,8 @@ import unittest
 from unittest.mock import patch
 
 from simple_slurm.cli import cli
+from simple_slurm.fake_slurm import FakeSlurm
+from simple_slurm.squeue import SlurmSqueueWrapper
 
 
 class Testing(unittest.TestCase):
@@ -18,6 +21,9 @@ class Testing(unittest.TestCase):
 #SBATCH --time                00:01:00
 """.strip()
 
+    def setUp(self):
+        SlurmSqueueWrapper.cache.clear()
+
     def test_01_using_equal(self):
         self.__run_test(
             [
@@ -54,6 +60,70 @@ class Testing(unittest.TestCase):
             ]
         )
 
+    def test_04_batch(self):
+        lines = "\n".join(
+            [
+                "echo first",
+                "",
+                '{"job_name": "second", "cmd": ["echo", "second"]}',
+                '{"not_an_argument": 1}',
+                "{invalid json",
+                '{"job_name": "third", "cmd": "echo third"}',
+            ]
+        )
+        with FakeSlurm() as fake:
+            status, stdout = self.__run_cli(
+                ["batch", "--partition=gpu", "--max_workers=2"], stdin=lines
+            )
+            jobs = fake.jobs()
+
+        records = sorted((json.loads(line) for line in stdout), key=lambda r: r["line"])
+        self.assertEqual(1, status)
+        self.assertEqual([1, 3, 4, 5, 6], [record["line"] for record in records])
+        job_ids = {record["line"]: record.get("job_id") for record in records}
+        self.assertEqual([None, None], [job_ids[4], job_ids[5]])
+        self.assertEqual({1000, 1001, 1002}, {job_ids[1], job_ids[3], job_ids[6]})
+        self.assertIn("not_an_argument", records[2]["error"])
+        self.assertEqual(["gpu"] * 3, [job["partition"] for job in jobs.values()])
+        self.assertEqual("second", jobs[job_ids[3]]["name"])
+        self.assertIn("echo second", jobs[job_ids[3]]["script"])
+        self.assertEqual("third", jobs[job_ids[6]]["name"])
+
+    def test_05_queue_and_cancel(self):
+        with FakeSlurm(pending_time=60) as fake:
+            fake.populate(2, name="a")
+            fake.populate(1, name="b")
+            status, stdout = self.__run_cli(["queue", "--name", "a"])
+            self.assertEqual(0, status)
+            jobs = [json.loads(line) for line in stdout]
+            self.assertEqual(["1000", "1001"], [job["JOBID"] for job in jobs])
+            self.assertEqual({"PD"}, {job["ST"] for job in jobs})
+
+            # the job ids can be piped from batch or queue
+            ids = '{"line": 1, "job_id": 1000}\n1002\n'
+            status, stdout = self.__run_cli(["cancel", "--from", "-"], stdin=ids)
+            self.assertEqual(0, status)
+            self.assertEqual(
+                [
+                    {"job_id": 1000, "cancelled": True},
+                    {"job_id": 1002, "cancelled": True},
+                ],
+                [json.loads(line) for line in stdout],
+            )
+            states = {job_id: job["state"] for job_id, job in fake.jobs().items()}
+        self.assertEqual(
+            {1000: "CANCELLED", 1001: "PENDING", 1002: "CANCELLED"}, states
+        )
+
+    def __run_cli(self, args, stdin=""):
+        with io.StringIO() as buffer:
+            with contextlib.redirect_stdout(buffer):
+                with patch.object(sys, "argv", ["simple_slurm", *args]):
+                    with patch.object(sys, "stdin", io.StringIO(stdin)):
+                        status = cli()
+            stdout = buffer.getvalue().splitlines()
+        return status, stdout
+
     def __run_test(self, args):
         with io.StringIO() as buffer:
             with contextlib.redirect_stdout(buffer):
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from simple_slurm import AsyncSlurm, Slurm, commands
+from simple_slurm.scancel import SlurmScancelWrapper
+from simple_slurm.squeue import SlurmSqueueWrapper
+
+from .utils import fake_commands
+
+
+class Testing(unittest.TestCase):
+    def setUp(self):
+        commands.metrics.reset()
+        SlurmSqueueWrapper.cache.clear()
+
+    def series(self, command: str, caller: str) -> dict:
+        for series in commands.metrics.snapshot():
+            if (series["command"], series["caller"]) == (command, caller):
+                return series
+        self.fail(f"No metrics for {command} ({caller})")
+
+    def test_01_hooks(self):
+        calls = []
+
+        def pre(call):
+            calls.append(("pre", call.command, call.caller))
+
+        def post(call):
+            calls.append(("post", call.returncode, call.output_size))
+
+        commands.add_hook(pre=pre, post=post)
+        try:
+            with fake_commands(sbatch="echo 1234\n", scancel="exit 0\n"):
+                Slurm(parsable=True).sbatch("echo Hello!", verbose=False)
+                SlurmScancelWrapper().cancel_job(1234)
+        finally:
+            commands.remove_hook(pre=pre, post=post)
+
+        self.assertEqual(
+            [
+                ("pre", "sbatch", "Slurm.sbatch"),
+                ("post", 0, 5),
+                ("pre", "scancel", "SlurmScancelWrapper.cancel_job"),
+                ("post", 0, 0),
+            ],
+            calls,
+        )
+
+    def test_02_pre_hook_aborts(self):
+        def pre(call):
+            raise PermissionError("Too many calls")
+
+        commands.add_hook(pre=pre)
+        try:
+            with fake_commands(squeue="exit 0\n"):
+                with self.assertRaises(PermissionError):
+                    SlurmSqueueWrapper().update_squeue()
+        finally:
+            commands.remove_hook(pre=pre)
+        self.assertEqual([], commands.metrics.snapshot())
+
+    def test_03_metrics(self):
+        squeue = '"JOBID","NAME","ST"\n"1","a","R"\n'
+        with fake_commands(squeue=f"printf '{squeue}'\n", scancel="exit 1\n"):
+            wrapper = SlurmSqueueWrapper()
+            for _ in range(3):
+                wrapper.update_squeue(force=True)
+            self.assertEqual(1, len(list(wrapper.iter_squeue())))
+            with self.assertRaises(RuntimeError):
+                SlurmScancelWrapper().cancel_all()
+            asyncio.run(AsyncSlurm().update_squeue())
+
+        series = self.series("squeue", "SlurmSqueueWrapper.update_squeue")
+        self.assertEqual(3, series["calls"])
+        self.assertEqual(0, series["failures"])
+        self.assertEqual(3 * len(squeue), series["output_bytes"])
+        self.assertEqual(3, sum(series["latency_buckets"].values()))
+        self.assertEqual(1, self.series("squeue", "AsyncSlurm.update_squeue")["calls"])
+        self.assertEqual(
+            1, self.series("squeue", "SlurmSqueueWrapper.iter_squeue")["calls"]
+        )
+        series = self.series("scancel", "SlurmScancelWrapper.cancel_all")
+        self.assertEqual((1, 1), (series["calls"], series["failures"]))
+
+    def test_04_retries(self):
+        # the fake sbatch times out the first submission
+        sbatch = """marker="$(dirname "$0")/marker"
+if [ ! -f "$marker" ]; then
+    touch "$marker"
+    echo "sbatch: error: Socket timed out on send/recv operation" >&2
+    exit 1
+fi
+echo 1234
+"""
+        with fake_commands(sbatch=sbatch) as path:
+            # the retries are recorded under the name of the command
+            Slurm(parsable=True).sbatch_many(
+                [dict(job_name="a")],
+                retry_delay=0,
+                sbatch_cmd=os.path.join(path, "sbatch") + " --quiet",
+            )
+        series = self.series("sbatch", "Slurm.sbatch")
+        self.assertEqual(
+            (2, 1, 1), (series["calls"], series["failures"], series["retries"])
+        )
+
+    def test_05_exporters(self):
+        with fake_commands(squeue="exit 0\n"):
+            SlurmSqueueWrapper().update_squeue()
+
+        text = commands.metrics.to_prometheus()
+        labels = 'command="squeue",caller="SlurmSqueueWrapper.update_squeue"'
+        self.assertIn(f"simple_slurm_command_calls_total{{{labels}}} 1\n", text)
+        self.assertIn(
+            f'simple_slurm_command_duration_seconds_bucket{{{labels},le="+Inf"}} 1\n',
+            text,
+        )
+        self.assertIn("# TYPE simple_slurm_command_duration_seconds histogram\n", text)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.json")
+            commands.metrics.write(path, format="json")
+            with open(path) as fid:
+                (series,) = json.load(fid)
+        self.assertEqual(1, series["calls"])
+
+    def test_06_stream_stopped_early(self):
+        # the consumer of iter_squeue breaking out early is not a failure
+        squeue = """echo '"JOBID","NAME","ST"'
+for i in $(seq 1 1000); do echo "\"$i\",\"a\",\"R\""; sleep 0.01; done
+"""
+        with fake_commands(squeue=squeue):
+            for job in SlurmSqueueWrapper().iter_squeue():
+                break
+        series = self.series("squeue", "SlurmSqueueWrapper.iter_squeue")
+        self.assertEqual((1, 0), (series["calls"], series["failures"]))
+        self.assertLess(series["latency_sum"], 5)
+
+        with fake_commands(squeue="echo error >&2; exit 1\n"):
+            with self.assertRaises(RuntimeError):
+                list(SlurmSqueueWrapper().iter_squeue())
+        series = self.series("squeue", "SlurmSqueueWrapper.iter_squeue")
+        self.assertEqual((2, 1), (series["calls"], series["failures"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,12 +1,21 @@
 import contextlib
 import datetime
+import glob
 import io
 import os
 import shutil
 import subprocess
+import sys
+import tempfile
+import time
+import types
 import unittest
+from unittest.mock import patch
 
-from simple_slurm import Slurm
+from simple_slurm import ScriptStore, Slurm, SubmissionJournal
+from simple_slurm.core import Namespace
+
+from .utils import fake_commands
 
 
 class Testing(unittest.TestCase):
@@ -337,6 +346,480 @@ echo "done"
         self.assertIsInstance(job_id, int)
         self.assertEqual(f"{job_id}\n", stdout)
 
+    def test_23_shared_schema(self):
+        slurm_a = Slurm(job_name="a")
+        slurm_b = Slurm(job_name="b")
+
+        self.assertIs(slurm_a.parser, slurm_b.parser)
+        self.assertIsNot(slurm_a.namespace, slurm_b.namespace)
+        self.assertEqual(slurm_a.namespace.job_name, "a")
+        self.assertEqual(slurm_b.namespace.job_name, "b")
+
+    def test_24_fast_arguments_match_argparse(self):
+        slurm = Slurm("-a", "3-11", "--cpus_per_task", 15, job_name="name")
+        expected = Namespace()
+        slurm.parser.parse_args(
+            ["-a", "3-11", "--cpus_per_task", "15", "--job_name", "name"],
+            namespace=expected,
+        )
+        self.assertEqual(
+            list(vars(expected).items()), list(vars(slurm.namespace).items())
+        )
+
+    def test_25_argparse_fallback(self):
+        slurm = Slurm(job_nam="name", nice="-5")
+        self.assertEqual(slurm.namespace.job_name, "name")
+        self.assertEqual(slurm.namespace.nice, "-5")
+
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            with self.assertRaises(SystemExit):
+                Slurm(invalid_argument="value")
+        self.assertIn("unrecognized arguments: --invalid_argument", stderr.getvalue())
+
+    def test_26_sbatch_many(self):
+        # the fake sbatch answers with the job name as job id
+        sbatch = "echo Submitted batch job $(sed -n 's/^#SBATCH --job-name *//p')\n"
+        slurm = Slurm(contiguous=True)
+        slurm.add_cmd("module load python")
+        variants = [
+            (dict(job_name=i), ("python", "main.py", "--input", i)) for i in range(20)
+        ]
+        with fake_commands(sbatch=sbatch):
+            job_ids = slurm.sbatch_many(variants, max_workers=4)
+
+        self.assertEqual(list(range(20)), job_ids)
+        self.assertEqual(["module load python"], slurm.run_cmds)
+        self.assertIsNone(slurm.namespace.job_name)
+
+    def test_27_sbatch_many_retries(self):
+        # the fake sbatch times out the first submission of every job name
+        sbatch = """name=$(sed -n 's/^#SBATCH --job-name *//p')
+marker="$(dirname "$0")/$name"
+if [ ! -f "$marker" ]; then
+    touch "$marker"
+    echo "sbatch: error: Socket timed out on send/recv operation" >&2
+    exit 1
+fi
+echo "$name"
+"""
+        slurm = Slurm(parsable=True)
+        variants = [dict(job_name=i) for i in range(5)]
+        with fake_commands(sbatch=sbatch):
+            job_ids = slurm.sbatch_many(variants, retry_delay=0)
+            self.assertEqual(list(range(5)), job_ids)
+
+        # the permanent errors are not retried
+        sbatch = """echo x >> "$(dirname "$0")/calls"
+echo "sbatch: error: invalid partition specified: gpu" >&2
+exit 1
+"""
+        with fake_commands(sbatch=sbatch) as path:
+            with self.assertRaises(AssertionError) as context:
+                slurm.sbatch_many(variants[:1], retries=2, retry_delay=0)
+            self.assertIn("invalid partition", str(context.exception))
+            with open(os.path.join(path, "calls")) as file:
+                self.assertEqual(1, len(file.readlines()))
+
+        with fake_commands(sbatch="echo try again later >&2; exit 1\n"):
+            with self.assertRaises(AssertionError):
+                slurm.sbatch_many(variants, retries=1, retry_delay=0)
+            job_ids = slurm.sbatch_many(
+                variants, retries=0, retry_delay=0, raise_errors=False
+            )
+            self.assertEqual([None] * 5, job_ids)
+
+        # on an error, the queued submissions are cancelled and the job ids of
+        # the finished ones are attached to the error
+        sbatch = """name=$(sed -n 's/^#SBATCH --job-name *//p')
+echo "$name" >> "$(dirname "$0")/calls"
+if [ "$name" = 0 ]; then exit 1; fi
+echo "$name"
+"""
+        variants = [dict(job_name=i) for i in range(20)]
+        with fake_commands(sbatch=sbatch) as directory:
+            with self.assertRaises(Exception) as context:
+                slurm.sbatch_many(variants, max_workers=2, retries=0)
+            with open(os.path.join(directory, "calls")) as fid:
+                calls = fid.read().split()
+        job_ids = context.exception.job_ids
+        self.assertLessEqual(len(calls), 4)
+        self.assertEqual(None, job_ids[0])
+        self.assertEqual(sorted(calls), [str(i) for i in range(len(calls))])
+        self.assertEqual(len(calls), len([i for i in job_ids if i is not None]) + 1)
+
+    def test_28_incremental_script(self):
+        def legacy_script(slurm, shell=None, convert=True):
+            shell = slurm.shell if shell is None else shell
+            lines = (
+                f"#SBATCH --{k.replace('_', '-'):<19} {v}"
+                for k, v in vars(slurm.namespace).items()
+                if v is not None
+            )
+            arguments = "\n".join((f"#!{shell}", "", *lines)) + "\n"
+            commands = "\n".join(
+                [c.replace("$", "\\$") if convert else c for c in slurm.run_cmds]
+            )
+            return "\n".join((arguments, commands)).strip() + "\n"
+
+        slurm = Slurm()
+        steps = [
+            lambda: None,
+            lambda: slurm.set_job_name("name"),
+            lambda: slurm.add_cmd("echo $HOME"),
+            lambda: slurm.add_arguments(array=range(3, 12), ignore_pbs=True),
+            lambda: slurm.set_job_name("other"),
+            lambda: slurm.add_arguments(job_nam="abbreviated"),
+            lambda: slurm.add_arguments(nice="-5"),
+            lambda: slurm.run_cmds.append("echo $USER"),
+            lambda: slurm.run_cmds.__setitem__(0, "echo $PWD"),
+            lambda: setattr(slurm, "run_cmds", ["echo $NEW", "echo $USER"]),
+            lambda: setattr(slurm.namespace, "job_name", "direct"),
+            lambda: slurm.parser.parse_args(
+                ["--job_name", "parsed", "--mem", "4G"], namespace=slurm.namespace
+            ),
+            lambda: setattr(slurm.namespace, "mem", None),
+            lambda: slurm.reset_cmd(),
+            lambda: slurm.add_cmd("python", "main.py", Slurm.SLURM_ARRAY_TASK_ID),
+        ]
+        for step in steps:
+            step()
+            for shell, convert in ((None, True), ("/bin/bash", False)):
+                self.assertEqual(
+                    legacy_script(slurm, shell, convert), slurm.script(shell, convert)
+                )
+
+        clone = slurm._clone()
+        clone.set_job_name("clone")
+        self.assertEqual(legacy_script(slurm), slurm.script())
+        self.assertEqual(legacy_script(clone), clone.script())
+
+        # the derived objects see the arguments set directly too
+        slurm.namespace.job_name = "template"
+        derived = slurm.derive(mem="1G")
+        expected = Slurm(mem="1G")
+        vars(expected.namespace).update(vars(slurm.namespace), mem="1G")
+        expected.run_cmds = list(slurm.run_cmds)
+        self.assertEqual(legacy_script(expected), derived.script())
+        self.assertEqual(derived.script(), derived.script())
+
+    def test_29_sbatch_array(self):
+        # the fake sbatch stores the submitted scripts as script_0, script_1...
+        sbatch = """dir=$(dirname "$0")
+n=$(ls "$dir" | grep -c script_)
+cat > "$dir/script_$n"
+echo $((100 + n))
+"""
+        slurm = Slurm(job_name="name", parsable=True)
+        slurm.add_cmd("cd /tmp")
+        tasks = [dict(x=x, y=x * x) for x in range(5)]
+        with fake_commands(sbatch=sbatch) as directory:
+            task_file = os.path.join(directory, "tasks.txt")
+            array = slurm.sbatch_array(
+                tasks,
+                task_file,
+                command="echo {x} {y}",
+                throttle=2,
+                max_array_size=3,
+            )
+            with open(task_file) as fid:
+                self.assertEqual("echo 0 0\necho 1 1\necho 2 4\n", fid.read()[:27])
+            scripts = []
+            for n in range(2):
+                with open(os.path.join(directory, f"script_{n}")) as fid:
+                    scripts.append(fid.read())
+
+            # run the second array task of the second job array
+            output = subprocess.run(
+                ["sh", "-c", scripts[1]],
+                env=dict(os.environ, SLURM_ARRAY_TASK_ID="1"),
+                stdout=subprocess.PIPE,
+                text=True,
+            ).stdout
+
+        self.assertEqual([100, 101], array.job_ids)
+        self.assertIn("#SBATCH --array               0-2%2\n", scripts[0])
+        self.assertIn("#SBATCH --array               0-1%2\n", scripts[1])
+        self.assertEqual("4 16\n", output)
+        self.assertEqual(tasks[4], array.variant(1, job_id=101))
+        self.assertEqual((101, 1), array.locate(4))
+        self.assertEqual("100_2", array.task_job_id(2))
+        self.assertEqual(["cd /tmp"], slurm.run_cmds)
+        self.assertIsNone(slurm.namespace.array)
+
+        with self.assertRaises(ValueError):
+            slurm.sbatch_array(["echo a\necho b"], task_file)
+
+    def test_30_sbatch_farm(self):
+        sbatch = 'cat > "$(dirname "$0")/script"\necho 1234\n'
+        # the fake srun runs 3 tasks, expanding the multi-prog configuration
+        srun = """test "$1" = "--cpus-per-task=2" && shift || exit 1
+if [ "$1" = "--multi-prog" ]; then
+    line=$(sed 's/^\\* //' "$2")
+    for rank in 0 1 2; do sh -c "$(echo "$line" | sed "s/%t/$rank/")" & done
+else
+    for rank in 0 1 2; do "$@" & done
+fi
+wait
+"""
+        tasks = [f"exit $(( {i} % 4 ))" for i in range(10)]
+        for mode in ("worker", "multi-prog"):
+            slurm = Slurm(ntasks=3, cpus_per_task=2, parsable=True)
+            with fake_commands(sbatch=sbatch, srun=srun) as directory:
+                farm_dir = os.path.join(directory, "farm dir")
+                farm = slurm.sbatch_farm(farm_dir, tasks, mode=mode)
+                with open(os.path.join(directory, "script")) as fid:
+                    script = fid.read()
+                self.assertEqual(list(range(10)), farm.pending())
+
+                env = dict(os.environ, SLURM_CPUS_PER_TASK="2")
+                subprocess.run(["sh", "-c", script], check=True, env=env)
+                self.assertEqual({i: i % 4 for i in range(10)}, farm.results())
+                self.assertEqual([1, 2, 3, 5, 6, 7, 9], sorted(farm.failed()))
+                self.assertEqual([], farm.pending())
+
+            self.assertEqual(1234, farm.job_id)
+            self.assertEqual([], slurm.run_cmds)
+
+        slurm.add_cmd("echo $SIMPLE_SLURM_TASK_INDEX")
+        with self.assertRaises(ValueError):
+            slurm.sbatch_farm(farm_dir, mode="unknown")
+        self.assertEqual(["echo $SIMPLE_SLURM_TASK_INDEX"], slurm.run_cmds)
+
+    def test_31_lazy_import(self):
+        # a fresh interpreter, importing the package should read no file,
+        # create no object, import no heavy module and leave logging untouched
+        heavy = [
+            "asyncio",
+            "concurrent.futures",
+            "hashlib",
+            "json",
+            "mmap",
+            "sqlite3",
+            "tempfile",
+            "simple_slurm.farm",
+            "simple_slurm.journal",
+            "simple_slurm.logs",
+            "simple_slurm.script_store",
+            "simple_slurm.workflow",
+        ]
+        # the standard modules imported by the package before it grew
+        baseline = ("argparse", "csv", "datetime", "math", "subprocess", "typing")
+        code = f"""import logging, sys
+import {", ".join(baseline)}
+import simple_slurm
+import simple_slurm.core
+assert simple_slurm.core._schema is None
+assert not logging.getLogger().handlers
+print(sorted(name for name in {heavy!r} if name in sys.modules))
+print(simple_slurm.Slurm.SLURM_ARRAY_TASK_ID, simple_slurm.AsyncSlurm.__name__)
+"""
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        self.assertEqual(0, result.returncode, result.stderr)
+        self.assertEqual("[]\n$SLURM_ARRAY_TASK_ID AsyncSlurm\n", result.stdout)
+
+        # cumulative import times (in us) of the top-level modules: on top of
+        # the baseline modules, the package should cost about as much as them
+        # (with a margin, and a floor for the interpreters importing them early)
+        import_times = {}
+        for line in result.stderr.splitlines()[1:]:
+            _, cumulative, name = line.split("|")
+            if not name.startswith("  "):
+                import_times[name.strip()] = int(cumulative)
+        reference = sum(import_times.get(name, 0) for name in baseline)
+        self.assertLess(import_times["simple_slurm"], max(reference, 10_000) * 2)
+
+    def test_32_journal(self):
+        # the fake sbatch answers with the number of submissions (one at a time)
+        sbatch = """dir=$(dirname "$0")
+echo >> "$dir/count"
+wc -l < "$dir/count"
+"""
+        variants = [dict(job_name=i) for i in range(10)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "journal.sqlite")
+            journal = SubmissionJournal(path)
+            with fake_commands(sbatch=sbatch):
+                slurm = Slurm(parsable=True)
+                first = slurm.sbatch_many(variants[:4], max_workers=1, journal=journal)
+                journal.close()
+
+                # restarted after a crash: only the new variants are submitted
+                journal = SubmissionJournal(path)
+                job_ids = slurm.sbatch_many(variants, max_workers=1, journal=journal)
+                job_id = slurm.sbatch("echo other", verbose=False, journal=journal)
+
+            self.assertEqual(job_ids[:4], first)
+            self.assertEqual(list(range(1, 11)), sorted(job_ids))
+            self.assertEqual(11, job_id)
+            self.assertEqual(11, len(journal))
+            _, recorded, arguments, _ = journal.entries()[-1]
+            self.assertEqual(11, recorded)
+            self.assertEqual(["echo other"], arguments["commands"])
+            self.assertEqual(dict(parsable=""), arguments["arguments"])
+            journal.close()
+
+    def test_33_shell_free(self):
+        # the fake sbatch stores the submitted scripts as script_0, script_1...
+        sbatch = """dir=$(dirname "$0")
+n=$(ls "$dir" | grep -c script_)
+if [ -n "$1" ]; then cp "$1" "$dir/script_$n"; else cat > "$dir/script_$n"; fi
+echo $((100 + n))
+"""
+        # the fake srun stores its arguments, one per line
+        srun = 'for arg in "$@"; do echo "$arg"; done > "$(dirname "$0")/srun"\n'
+        slurm = Slurm(job_name="my job", parsable=True)
+        slurm.add_cmd('echo "$HOME" `date`')
+        with fake_commands(sbatch=sbatch, srun=srun) as directory:
+            job_file = os.path.join(directory, "job.sh")
+            job_ids = [
+                slurm.sbatch(verbose=False),
+                slurm.sbatch(verbose=False, use_shell=False),
+                slurm.sbatch(verbose=False, use_shell=False, job_file=job_file),
+            ]
+            scripts = []
+            for n in range(3):
+                with open(os.path.join(directory, f"script_{n}")) as fid:
+                    scripts.append(fid.read())
+
+            # the default can be changed for all objects
+            with patch.object(Slurm, "use_shell", False):
+                slurm.reset_cmd()
+                slurm.srun("echo $USER", "&& echo '2'")
+            with open(os.path.join(directory, "srun")) as fid:
+                srun_args = fid.read().splitlines()
+
+        self.assertEqual([100, 101, 102], job_ids)
+        # the here document of the shell expands the backquotes
+        self.assertNotIn("`date`", scripts[0])
+        self.assertEqual(scripts[1], scripts[2])
+        self.assertIn('echo "$HOME" `date`\n', scripts[1])
+        self.assertEqual(
+            [
+                "--job-name=my job",
+                "--parsable",
+                "/bin/sh",
+                "-c",
+                "echo $USER && echo '2'",
+            ],
+            srun_args,
+        )
+
+    def test_34_script_store(self):
+        # the fake sbatch logs the path of the scripts
+        sbatch = 'echo "$1" >> "$(dirname "$0")/paths"\necho 1\n'
+        with fake_commands(sbatch=sbatch) as directory:
+            store = ScriptStore(os.path.join(directory, "scripts"))
+            slurm = Slurm(parsable=True)
+            slurm.add_cmd("echo $HOME")
+            for name in ("a", "b", "a"):
+                slurm.set_job_name(name)
+                slurm.sbatch(job_file=store, use_shell=False, verbose=False)
+            with open(os.path.join(directory, "paths")) as fid:
+                paths = fid.read().splitlines()
+
+            self.assertEqual(paths[0], paths[2])
+            self.assertNotEqual(paths[0], paths[1])
+            with open(paths[0]) as fid:
+                self.assertEqual(slurm.script(convert=False), fid.read())
+            self.assertIn(slurm.script(convert=False), store)
+            self.assertEqual(
+                [], glob.glob(os.path.join(store.directory, "*", ".tmp-*"))
+            )
+
+            # the identical script is reused without any I/O
+            os.remove(paths[0])
+            slurm.set_job_name("a")
+            self.assertEqual(paths[0], store.put(slurm.script(convert=False)))
+            self.assertFalse(os.path.exists(paths[0]))
+
+            # eviction, by age then by size
+            old = time.time() - 3600
+            os.utime(paths[1], (old, old))
+            self.assertEqual(1, store.evict(max_age=60))
+            self.assertFalse(os.path.exists(paths[1]))
+            for i in range(5):
+                store.put(f"echo {i}\n")
+            self.assertEqual(3, store.evict(max_size=len("echo 0\n") * 2))
+            self.assertEqual(
+                2, len(glob.glob(os.path.join(store.directory, "*", "*.sh")))
+            )
+
+    def test_35_derive(self):
+        base = Slurm(partition="gpu", time="02:00:00", output="%j.out")
+        base.add_cmd("module load python")
+        variant = base.derive(job_name="lr_0.1", partition="cpu", cpus_per_task=8)
+
+        expected = base._clone()
+        expected.add_arguments(job_name="lr_0.1", partition="cpu", cpus_per_task=8)
+        self.assertEqual(expected.script(), variant.script())
+        self.assertIsInstance(variant, Slurm)
+        # the arguments of the parent are shared, not copied
+        self.assertNotIn("namespace", vars(variant))
+        self.assertIs(base._get_template(), variant._base)
+
+        # the parent and the variant are independent
+        base.set_time("00:10:00")
+        variant.set_mem("4G")
+        variant.add_cmd("python train.py")
+        expected.set_mem("4G")
+        expected.add_cmd("python train.py")
+        self.assertEqual(expected.script(), variant.script())
+        self.assertNotIn("--mem", base.script())
+        self.assertEqual(["module load python"], base.run_cmds)
+        self.assertIn("00:10:00", base.derive().script())
+
+        # overrides are validated as arguments
+        self.assertEqual({"partition": "cpu"}, base.derive(part="cpu").overrides)
+        with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+            base.derive(not_an_argument=1)
+
+        with fake_commands(sbatch='echo "$(grep -c SBATCH)"\n'):
+            job_id = base.derive(parsable=True).sbatch(verbose=False)
+        self.assertEqual(4, job_id)
+
+        # variants of a variant
+        derived = Slurm(partition="gpu").derive(job_name="x").derive(mem="4G")
+        expected = Slurm(partition="gpu", job_name="x", mem="4G")
+        self.assertEqual(expected.script(), derived.script())
+
+    def test_36_grid(self):
+        base = Slurm(job_name="sweep")
+        variants = base.grid(partition=["cpu", "gpu"], mem=("4G", "8G"), nodes=[1])
+        self.assertIsInstance(variants, types.GeneratorType)
+        overrides = [variant.overrides for variant in variants]
+        self.assertEqual(
+            [
+                dict(partition="cpu", mem="4G", nodes="1"),
+                dict(partition="cpu", mem="8G", nodes="1"),
+                dict(partition="gpu", mem="4G", nodes="1"),
+                dict(partition="gpu", mem="8G", nodes="1"),
+            ],
+            overrides,
+        )
+
+        # grid on a derived object
+        derived = Slurm(partition="gpu").derive(job_name="x")
+        self.assertEqual(
+            [
+                Slurm(partition="gpu", job_name="x", mem=mem).script()
+                for mem in ("1G", "2G")
+            ],
+            [variant.script() for variant in derived.grid(mem=["1G", "2G"])],
+        )
+
+        # the variants are lazily submitted by 'sbatch_many'
+        sbatch = 'echo "$(grep -- --partition | tr -s " " | cut -d" " -f3)" >> "$(dirname "$0")/log"\necho 1\n'
+        base.add_arguments(parsable=True)
+        with fake_commands(sbatch=sbatch) as directory:
+            base.sbatch_many(base.grid(partition=["a", "b", "c"]))
+            with open(os.path.join(directory, "log")) as fid:
+                self.assertEqual(["a", "b", "c"], sorted(fid.read().split()))
+
     def __run_sbatch(self, slurm, *args, **kwargs):
         with io.StringIO() as buffer:
             with contextlib.redirect_stdout(buffer):
@@ -0,0 +1,106 @@
+import subprocess
+import time
+import unittest
+
+from simple_slurm import Slurm
+from simple_slurm.fake_slurm import FakeSlurm
+from simple_slurm.scancel import SlurmScancelWrapper
+from simple_slurm.squeue import SlurmSqueueWrapper
+
+
+class Testing(unittest.TestCase):
+    def setUp(self):
+        SlurmSqueueWrapper.cache.clear()
+
+    def test_01_sbatch(self):
+        with FakeSlurm() as fake:
+            slurm = Slurm(job_name="name", partition="gpu")
+            first = slurm.sbatch("echo Hello!", verbose=False)
+            second = Slurm(parsable=True).sbatch("echo Hello!", verbose=False)
+
+            jobs = fake.jobs()
+        self.assertEqual([1000, 1001], [first, second])
+        self.assertEqual("name", jobs[first]["name"])
+        self.assertEqual("gpu", jobs[first]["partition"])
+        self.assertEqual(slurm.script().strip(), jobs[first]["script"].strip())
+
+    def test_02_lifecycle(self):
+        with FakeSlurm(pending_time=60, run_time=60) as fake:
+            (job_id,) = fake.populate(1)
+            squeue = SlurmSqueueWrapper()
+            squeue.update_squeue()
+            self.assertEqual("PD", squeue.jobs[job_id]["ST"])
+
+            # the states follow the durations, shortening them moves forward
+            fake.configure(pending_time=0)
+            squeue.update_squeue()
+            self.assertEqual("R", squeue.jobs[job_id]["ST"])
+
+            fake.configure(run_time=0)
+            squeue.update_squeue()
+            self.assertEqual({}, squeue.jobs)
+            output = subprocess.run(
+                ["sacct", "-X", "-n", "-P", "-o", "JobID,State", "-j", str(job_id)],
+                stdout=subprocess.PIPE,
+                text=True,
+            ).stdout
+        self.assertEqual(f"{job_id}|COMPLETED\n", output)
+
+    def test_03_squeue_filters(self):
+        with FakeSlurm(pending_time=60) as fake:
+            fake.populate(3, name="a")
+            fake.populate(2, name="b", partition="gpu")
+            squeue = SlurmSqueueWrapper()
+            self.assertEqual([1003, 1004], list(squeue.query(name="b")))
+            self.assertEqual([1003, 1004], list(squeue.query(partitions="gpu")))
+            self.assertEqual([1000, 1004], list(squeue.query(job_ids=[1000, 1004])))
+            self.assertEqual([], list(squeue.query(states="RUNNING")))
+
+        # the finished jobs are listed for their states, or all of them
+        with FakeSlurm(pending_time=0, run_time=0) as fake:
+            fake.populate(2)
+            squeue = SlurmSqueueWrapper()
+            self.assertEqual([], list(squeue.query()))
+            jobs = squeue.query(states="all", force=True)
+            self.assertEqual([1000, 1001], list(jobs))
+            self.assertEqual([1000, 1001], list(squeue.query(states="CD", force=True)))
+
+    def test_04_scancel(self):
+        with FakeSlurm(pending_time=60) as fake:
+            job_ids = fake.populate(10)
+            scancel = SlurmScancelWrapper()
+            failed = scancel.cancel_jobs(job_ids[:5] + [1])
+            self.assertEqual([1], failed)
+            states = [job["state"] for job in fake.jobs().values()]
+            self.assertEqual(["CANCELLED"] * 5 + ["PENDING"] * 5, states)
+
+            # TERM is ignored by the fake jobs, KILL cancels them
+            self.assertEqual("TERM", scancel.signal_job(job_ids[5]))
+            self.assertEqual("PENDING", fake.jobs()[job_ids[5]]["state"])
+            self.assertEqual("KILL", scancel.signal_job(job_ids[5]))
+            self.assertEqual("CANCELLED", fake.jobs()[job_ids[5]]["state"])
+
+            scancel.cancel_all()
+            states = {job["state"] for job in fake.jobs().values()}
+        self.assertEqual({"CANCELLED"}, states)
+
+    def test_05_failures(self):
+        with FakeSlurm(failure_rate=1.0) as fake:
+            with self.assertRaises(RuntimeError):
+                SlurmSqueueWrapper().update_squeue()
+            fake.configure(failure_rate=0.0, latency=0.2)
+            start = time.perf_counter()
+            SlurmSqueueWrapper().update_squeue(force=True)
+            self.assertGreaterEqual(time.perf_counter() - start, 0.2)
+
+        # failed jobs are drawn from their id, with a fixed seed
+        with FakeSlurm(job_failure_rate=0.5, seed=1) as fake:
+            fake.populate(100)
+            states = [job["state"] for job in fake.jobs().values()]
+            self.assertEqual(states, [job["state"] for job in fake.jobs().values()])
+        self.assertTrue(10 < states.count("FAILED") < 90)
+        self.assertEqual(100, states.count("FAILED") + states.count("COMPLETED"))
+
+
+if __name__ == "__main__":
+    unittest.main()
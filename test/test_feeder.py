@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+
+from simple_slurm import Slurm, SubmissionFeeder, SubmissionJournal
+from simple_slurm.fake_slurm import FakeSlurm
+from simple_slurm.squeue import SlurmSqueueWrapper
+
+
+class Testing(unittest.TestCase):
+    def setUp(self):
+        SlurmSqueueWrapper.cache.clear()
+
+    def variants(self, count: int):
+        for i in range(count):
+            yield dict(job_name=f"run_{i}"), f"echo {i}"
+
+    def test_01_backpressure(self):
+        with FakeSlurm(pending_time=0.1, run_time=0.2) as fake:
+            feeder = SubmissionFeeder(
+                Slurm(), self.variants(12), target=4, poll_interval=0.05
+            )
+            stats = feeder.run()
+            jobs = list(fake.jobs().values())
+
+        self.assertEqual(12, len(jobs))
+        self.assertEqual(12, stats["submitted"])
+        self.assertEqual(0, stats["failed"])
+        self.assertTrue(stats["exhausted"])
+        self.assertGreater(stats["throughput"], 0)
+        # at most 4 jobs were in the queue at any time
+        duration = 0.3
+        for job in jobs:
+            overlap = [
+                other
+                for other in jobs
+                if other["submit"] <= job["submit"] < other["submit"] + duration
+            ]
+            self.assertLessEqual(len(overlap), 4)
+
+    def test_02_resume(self):
+        with tempfile.TemporaryDirectory() as directory, FakeSlurm() as fake:
+            journal = SubmissionJournal(os.path.join(directory, "journal.sqlite"))
+            feeder = SubmissionFeeder(
+                Slurm(), self.variants(10), target=100, poll_interval=0, journal=journal
+            )
+            positions = [position for position, _ in feeder.feed(limit=3)]
+            self.assertEqual([0, 1, 2], positions)
+            self.assertEqual(3, feeder.position)
+            self.assertFalse(feeder.exhausted)
+            self.assertEqual(3, len(fake.jobs()))
+
+            # a new feeder skips the variants submitted by the previous one
+            feeder = SubmissionFeeder(
+                Slurm(), self.variants(10), target=100, poll_interval=0, journal=journal
+            )
+            stats = feeder.run()
+            self.assertEqual(10, len(fake.jobs()))
+            self.assertEqual(3, stats["skipped"])
+            self.assertEqual(7, stats["submitted"])
+
+            # or starts from a given position
+            feeder = SubmissionFeeder(Slurm(), self.variants(12), start=10)
+            stats = feeder.run()
+            self.assertEqual(12, len(fake.jobs()))
+            self.assertEqual(12, stats["position"])
+            journal.close()
+
+    def test_03_break_and_resume(self):
+        # the variants not submitted when the caller breaks out are kept
+        with FakeSlurm() as fake:
+            feeder = SubmissionFeeder(
+                Slurm(), self.variants(30), target=100, poll_interval=0
+            )
+            for position, _ in feeder.feed():
+                if position == 3:
+                    break
+            self.assertFalse(feeder.exhausted)
+            self.assertEqual(len(fake.jobs()), feeder.submitted)
+            self.assertEqual(feeder.submitted, feeder.position)
+
+            stats = feeder.run()
+            names = sorted(job["name"] for job in fake.jobs().values())
+
+        self.assertEqual(sorted(f"run_{i}" for i in range(30)), names)
+        self.assertEqual(30, stats["submitted"])
+        self.assertEqual(30, stats["position"])
+        self.assertTrue(stats["exhausted"])
+
+
+if __name__ == "__main__":
+    unittest.main()
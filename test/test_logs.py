@@ -0,0 +1,111 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from simple_slurm import LogTailer, Slurm
+from simple_slurm.logs import expand_output_pattern, parse_array_indices
+
+
+class Testing(unittest.TestCase):
+    def test_01_output_paths(self):
+        self.assertEqual([1, 3, 5, 7, 10], parse_array_indices("1-7:2,10%4"))
+        self.assertEqual(
+            "train-1234_007-%.out",
+            expand_output_pattern("%x-%A_%3a-%%.out", 1234, 7, job_name="train"),
+        )
+        self.assertEqual("a%j.out", expand_output_pattern("a\\%j.out", 1234))
+        with self.assertRaises(ValueError):
+            expand_output_pattern("%N.out", 1234)
+        with self.assertRaises(ValueError):
+            expand_output_pattern("%j.out", 1234, array_task_id=0)
+
+        output = f"logs/{Slurm.JOB_ARRAY_MASTER_ID}_{Slurm.JOB_ARRAY_ID}.out"
+        slurm = Slurm(array=range(2), output=output, chdir="/scratch")
+        self.assertEqual(
+            {0: "/scratch/logs/42_0.out", 1: "/scratch/logs/42_1.out"},
+            slurm.output_paths(42),
+        )
+        slurm = Slurm(error=f"{Slurm.JOB_ID}.err")
+        self.assertEqual(
+            {None: os.path.join(os.getcwd(), "slurm-42.out")}, slurm.output_paths(42)
+        )
+        self.assertEqual(
+            {None: os.path.join(os.getcwd(), "42.err")}, slurm.output_paths(42, "error")
+        )
+
+    def test_02_poll(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = {i: os.path.join(directory, f"{i}.out") for i in range(3)}
+            with LogTailer(paths, use_inotify=False) as tailer:
+                self.assertFalse(tailer.uses_inotify)
+                self.assertEqual([], tailer.poll())
+
+                with open(paths[0], "w") as fid:
+                    fid.write("first\nsecond\nthi")
+                with open(paths[2], "w") as fid:
+                    fid.write("other\n")
+                self.assertEqual(
+                    [(0, "first"), (0, "second"), (2, "other")],
+                    sorted(tailer.poll()),
+                )
+                self.assertEqual([], tailer.poll())
+
+                # the partial line is completed
+                with open(paths[0], "a") as fid:
+                    fid.write("rd\nlast")
+                self.assertEqual([(0, "third")], tailer.poll())
+                self.assertEqual([(0, "last")], tailer.flush())
+
+                # a truncated file is read from its start
+                with open(paths[2], "w") as fid:
+                    fid.write("new\n")
+                self.assertEqual([(2, "new")], tailer.poll())
+
+                # reads beyond the mmap granularity
+                line = "x" * 1000
+                with open(paths[1], "w") as fid:
+                    fid.write(f"{line}\n" * 100)
+                self.assertEqual([(1, line)] * 100, tailer.poll())
+                with open(paths[1], "a") as fid:
+                    fid.write("end\n")
+                self.assertEqual([(1, "end")], tailer.poll())
+
+    def follow(self, use_inotify: bool, poll_interval: float):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = {i: os.path.join(directory, f"{i}.out") for i in range(50)}
+
+            def write():
+                for i in range(50):
+                    with open(paths[i], "w") as fid:
+                        fid.write(f"task {i}\n")
+
+            with LogTailer(
+                paths, poll_interval=poll_interval, use_inotify=use_inotify
+            ) as tailer:
+                self.assertEqual(use_inotify, tailer.uses_inotify)
+                writer = threading.Timer(0.1, write)
+                writer.start()
+                events = []
+                start = time.monotonic()
+                for event in tailer.follow(timeout=10):
+                    events.append(event)
+                    if len(events) == 50:
+                        tailer.stop()
+                writer.join()
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual([(i, f"task {i}") for i in range(50)], sorted(events))
+
+    def test_03_follow_polling(self):
+        self.follow(use_inotify=False, poll_interval=0.05)
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is Linux only")
+    def test_04_follow_inotify(self):
+        # the files are read as soon as they change, well before the next poll
+        self.follow(use_inotify=True, poll_interval=60)
+
+
+if __name__ == "__main__":
+    unittest.main()
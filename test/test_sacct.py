@@ -0,0 +1,120 @@
+import datetime
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from simple_slurm.fake_slurm import FakeSlurm
+from simple_slurm.sacct import SlurmSacctWrapper, parse_sacct_stream
+
+from .utils import fake_commands
+
+
+class Testing(unittest.TestCase):
+    fields = ("JobID", "JobName", "State", "Submit", "Start", "End", "Elapsed")
+    output = """1001|train|COMPLETED|2024-01-31T10:00:00|2024-01-31T10:05:00|2024-01-31T11:05:00|01:00:00
+1002|train|FAILED|2024-01-31T10:00:00|2024-01-31T10:05:00|2024-01-31T10:06:00|00:01:00
+1003_1|test|CANCELLED by 1000|2024-01-31T12:00:00|Unknown|2024-01-31T12:01:00|00:00:00
+1004|test|RUNNING|2024-02-01T09:00:00|2024-02-01T09:00:00|Unknown|1-02:00:00
+"""
+
+    def test_01_parse_stream(self):
+        records = list(parse_sacct_stream(self.output.splitlines(), self.fields))
+        self.assertEqual(4, len(records))
+        self.assertEqual(1001, records[0].job_id)
+        self.assertEqual("1003_1", records[2].job_id)
+        self.assertEqual(datetime.datetime(2024, 1, 31, 10, 5), records[0].start)
+        self.assertIsNone(records[2].start)
+        self.assertEqual(datetime.timedelta(days=1, hours=2), records[3].elapsed)
+
+    def test_02_cache(self):
+        # the fake sacct logs its arguments and prints the jobs
+        sacct = f"""echo "$@" >> "$(dirname "$0")/calls"
+cat << EOF
+{self.output}EOF
+"""
+        with fake_commands(sacct=sacct) as directory:
+            sacct = SlurmSacctWrapper(fields=["Elapsed"])
+            start = datetime.datetime(2024, 1, 25)
+            self.assertEqual(4, sacct.update(start=start))
+            watermark = sacct.watermark
+            sacct.update()
+            with open(os.path.join(directory, "calls")) as fid:
+                calls = fid.read().splitlines()
+
+            failed = sacct.query(states="FAILED", refresh=False)
+            by_name = sacct.query(name=["test"], refresh=False)
+            in_range = sacct.query(
+                start=datetime.datetime(2024, 1, 31, 11),
+                end=datetime.datetime(2024, 1, 31, 23),
+                refresh=False,
+            )
+            cancelled = sacct.get("1003_1")
+
+            # an older start fills the cache with the older jobs
+            sacct.update(start=datetime.datetime(2024, 1, 1))
+            with open(os.path.join(directory, "calls")) as fid:
+                self.assertIn("--starttime=2024-01-01T00:00:00", fid.read())
+
+        self.assertEqual(2, len(calls))
+        self.assertIn("--starttime=2024-01-25T00:00:00", calls[0])
+        watermark = datetime.datetime.fromtimestamp(watermark - 60)
+        self.assertIn(f"--starttime={watermark:%Y-%m-%dT%H:%M:%S}", calls[1])
+        self.assertIn("--format=JobID,JobName,State,Submit,Start,End,Elapsed", calls[1])
+
+        self.assertEqual([1002], [job.job_id for job in failed])
+        self.assertEqual(["1003_1", 1004], [job.job_id for job in by_name])
+        self.assertEqual([1001, "1003_1"], [job.job_id for job in in_range])
+        self.assertEqual("CANCELLED by 1000", cancelled.state)
+
+    def test_03_streamed_update(self):
+        # the jobs are inserted by batches while sacct runs, the watermark is
+        # only moved once it succeeded
+        sacct = f"""cat << EOF
+{self.output}EOF
+if [ -f "$(dirname "$0")/fail" ]; then exit 1; fi
+"""
+        with (
+            fake_commands(sacct=sacct) as directory,
+            patch("simple_slurm.sacct.UPDATE_BATCH_SIZE", 3),
+        ):
+            wrapper = SlurmSacctWrapper(fields=["Elapsed"])
+            self.assertEqual(4, wrapper.update(start=0))
+            self.assertEqual(4, len(wrapper.query(refresh=False)))
+            watermark = wrapper.watermark
+
+            wrapper.clear()
+            open(os.path.join(directory, "fail"), "w").close()
+            with self.assertRaises(RuntimeError):
+                wrapper.update(start=0)
+            self.assertEqual(3, len(wrapper.query(refresh=False)))
+            self.assertIsNone(wrapper.watermark)
+        self.assertIsNotNone(watermark)
+
+    def test_04_persistent_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sacct.sqlite")
+            with FakeSlurm(run_time=0) as fake:
+                fake.populate(3, name="a")
+                sacct = SlurmSacctWrapper(path)
+                self.assertEqual(3, len(sacct.query(name="a")))
+                watermark = sacct.watermark
+                sacct.close()
+
+            # served from the file, without sacct
+            sacct = SlurmSacctWrapper(path)
+            self.assertEqual(watermark, sacct.watermark)
+            jobs = sacct.query(refresh=False)
+            self.assertEqual([1000, 1001, 1002], [job.job_id for job in jobs])
+            self.assertEqual({"COMPLETED"}, {job.state for job in jobs})
+            sacct.close()
+
+            # the cache is reset when the fields change
+            sacct = SlurmSacctWrapper(path, fields=["ExitCode"])
+            self.assertEqual([], sacct.query(refresh=False))
+            self.assertIsNone(sacct.watermark)
+            sacct.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import os
+import time
+import unittest
+from datetime import timedelta
+from unittest.mock import patch
+
+from simple_slurm.scancel import SlurmScancelWrapper
+
+from .utils import fake_commands
+
+# the fake scancel logs its arguments (one call per line) and fails on job 13
+SCANCEL = """echo "$@" >> "$(dirname "$0")/calls"
+for arg in "$@"; do
+    if [ "$arg" = 13 ]; then
+        echo "scancel: error: Kill job error on job id 13: Invalid job id specified" >&2
+        exit 1
+    fi
+done
+"""
+
+
+class Testing(unittest.TestCase):
+    def test_01_cancel_jobs_single_call(self):
+        scancel = SlurmScancelWrapper()
+        with fake_commands(scancel=SCANCEL) as directory:
+            failed = scancel.cancel_jobs(range(1, 1001))
+            calls = self.__read_calls(directory)
+
+        self.assertEqual([13], failed)
+        self.assertEqual(1, len(calls))
+        self.assertEqual([str(i) for i in range(1, 1001)], calls[0])
+
+    def test_02_cancel_jobs_chunks(self):
+        scancel = SlurmScancelWrapper()
+        with fake_commands(scancel=SCANCEL) as directory:
+            with patch("os.sysconf", return_value=2**16):
+                failed = scancel.signal_jobs(range(100000, 120000), "KILL")
+            calls = self.__read_calls(directory)
+
+        self.assertEqual([], failed)
+        self.assertGreater(len(calls), 1)
+        self.assertTrue(all(call[0] == "--signal=KILL" for call in calls))
+        job_ids = [int(job_id) for call in calls for job_id in call[1:]]
+        self.assertEqual(list(range(100000, 120000)), job_ids)
+
+    def test_03_cancel_jobs_filters(self):
+        scancel = SlurmScancelWrapper()
+        with fake_commands(scancel=SCANCEL) as directory:
+            scancel.cancel_jobs(name="train", state="PENDING", partition="gpu")
+            calls = self.__read_calls(directory)
+
+        self.assertEqual(
+            [["--me", "--name=train", "--state=PENDING", "--partition=gpu"]], calls
+        )
+        with self.assertRaises(ValueError):
+            scancel.cancel_jobs(signal="TERM")
+
+    def test_04_cancel_jobs_failure(self):
+        scancel = SlurmScancelWrapper()
+        with fake_commands(scancel="echo error >&2; exit 1\n"):
+            self.assertEqual([1, 2], scancel.cancel_jobs([1, 2]))
+            with self.assertRaises(RuntimeError):
+                scancel.cancel_jobs(name="train")
+
+    def test_05_signal_job_escalation(self):
+        scancel = SlurmScancelWrapper()
+        other = SlurmScancelWrapper()
+        with fake_commands(scancel=SCANCEL) as directory:
+            steps = [scancel.signal_job(1234) for _ in range(4)]
+            self.assertEqual("TERM", other.signal_job(1234))
+            calls = self.__read_calls(directory)
+
+        self.assertEqual(["TERM", "KILL", "CANCEL", "CANCEL"], steps)
+        self.assertEqual(
+            [
+                ["--signal=TERM", "1234"],
+                ["--signal=KILL", "1234"],
+                ["1234"],
+                ["1234"],
+                ["--signal=TERM", "1234"],
+            ],
+            calls,
+        )
+
+    def test_06_signal_job_grace_periods(self):
+        grace = timedelta(seconds=0.2)
+        scancel = SlurmScancelWrapper(grace_periods=(grace, grace))
+        with fake_commands(scancel=SCANCEL):
+            self.assertEqual("TERM", scancel.signal_job(1234))
+            self.assertIsNone(scancel.signal_job(1234))
+            time.sleep(0.25)
+            self.assertEqual("KILL", scancel.signal_job(1234))
+            with self.assertRaises(RuntimeError):
+                scancel.signal_job(13)
+
+    def test_07_prune_old_jobs(self):
+        scancel = SlurmScancelWrapper(staledelta=timedelta(seconds=0.1))
+        with fake_commands(scancel=SCANCEL):
+            scancel.signal_job(1234)
+            scancel.signal_job(1235)
+            time.sleep(0.15)
+            scancel.signal_job(1235)
+            scancel.prune_old_jobs()
+            self.assertEqual(["1235"], list(scancel._escalations))
+            self.assertEqual("TERM", scancel.signal_job(1234))
+
+    def test_08_reaper(self):
+        grace = timedelta(seconds=0.1)
+        scancel = SlurmScancelWrapper(grace_periods=(grace, grace))
+        with fake_commands(scancel=SCANCEL) as directory:
+            scancel.signal_job(1234)
+            scancel.start_reaper(interval=0.05)
+            try:
+                time.sleep(0.6)
+            finally:
+                scancel.stop_reaper()
+            calls = self.__read_calls(directory)
+
+        self.assertEqual(
+            [["--signal=TERM", "1234"], ["--signal=KILL", "1234"], ["1234"]], calls
+        )
+
+    def test_09_bounded_heaps(self):
+        # without reaper, the heaps stay proportional to the jobs tracked
+        grace = timedelta(hours=1)
+        scancel = SlurmScancelWrapper(grace_periods=(grace, grace))
+        with fake_commands(scancel=SCANCEL):
+            for job_id in range(100, 200):
+                scancel.signal_job(job_id)
+                scancel.forget_job(job_id)
+            self.assertEqual({}, scancel._escalations)
+            self.assertLessEqual(len(scancel._stale_heap), 1)
+            self.assertLessEqual(len(scancel._due_heap), 1)
+
+            scancel.signal_job(1234)
+            for job_id in range(100, 200):
+                scancel.forget_job(job_id)
+                scancel.prune_old_jobs()
+            self.assertEqual([1, 1], [len(scancel._stale_heap), len(scancel._due_heap)])
+        self.assertEqual(["1234"], list(scancel._escalations))
+
+    def __read_calls(self, directory):
+        with open(os.path.join(directory, "calls")) as fid:
+            return [line.split() for line in fid.read().splitlines()]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,224 @@
+import datetime
+import os
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from simple_slurm import SlurmJob
+from simple_slurm.squeue import SlurmSqueueWrapper
+
+from .utils import fake_commands
+
+# the fake squeue logs each call in the "calls" file of its directory
+SQUEUE = """echo call >> "$(dirname "$0")/calls"
+sleep 0.2
+echo '"JOBID","NAME","ST"'
+echo '"1234","name","R"'
+"""
+
+
+class Testing(unittest.TestCase):
+    def setUp(self):
+        SlurmSqueueWrapper.cache.clear()
+
+    def test_01_update_squeue(self):
+        squeue = SlurmSqueueWrapper()
+        with fake_commands(squeue=SQUEUE) as directory:
+            squeue.update_squeue()
+            squeue.update_squeue()
+            self.assertEqual(2, self.__count_calls(directory))
+
+        self.assertEqual(
+            {1234: {"JOBID": "1234", "NAME": "name", "ST": "R"}}, squeue.jobs
+        )
+        self.assertLess(squeue.snapshot_age, 5)
+
+    def test_02_ttl_shared_between_wrappers(self):
+        squeue_a = SlurmSqueueWrapper(ttl=60)
+        squeue_b = SlurmSqueueWrapper(ttl=60)
+        with fake_commands(squeue=SQUEUE) as directory:
+            squeue_a.update_squeue()
+            squeue_b.update_squeue()
+            self.assertEqual(1, self.__count_calls(directory))
+            self.assertIs(squeue_a.jobs, squeue_b.jobs)
+
+            squeue_b.update_squeue(force=True)
+            self.assertEqual(2, self.__count_calls(directory))
+
+    def test_03_single_flight(self):
+        wrappers = [SlurmSqueueWrapper() for _ in range(8)]
+        with fake_commands(squeue=SQUEUE) as directory:
+            threads = [threading.Thread(target=w.update_squeue) for w in wrappers]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(1, self.__count_calls(directory))
+
+        for wrapper in wrappers:
+            self.assertIs(wrappers[0].snapshot, wrapper.snapshot)
+
+    def test_04_expired_snapshots_are_evicted(self):
+        squeue = SlurmSqueueWrapper(ttl=60)
+        cache = SlurmSqueueWrapper.cache
+        with (
+            fake_commands(squeue=SQUEUE) as directory,
+            patch.object(cache, "max_age", 0.1),
+        ):
+            squeue.update_squeue()
+            self.assertEqual(1, len(cache))
+            time.sleep(0.2)
+            self.assertEqual(0, len(cache))
+            squeue.update_squeue()
+            self.assertEqual(2, self.__count_calls(directory))
+
+        # a snapshot taken by a wrapper without ttl is reused by the others
+        uncached = SlurmSqueueWrapper(ttl=0)
+        with fake_commands(squeue=SQUEUE) as directory:
+            squeue.update_squeue(force=True)
+            uncached.update_squeue()
+            squeue.update_squeue()
+            self.assertEqual(2, self.__count_calls(directory))
+            self.assertIs(uncached.snapshot, squeue.snapshot)
+
+    def test_05_error(self):
+        squeue = SlurmSqueueWrapper()
+        with fake_commands(squeue="echo error >&2; exit 1\n"):
+            with self.assertRaises(RuntimeError):
+                squeue.update_squeue()
+        self.assertEqual(0, len(SlurmSqueueWrapper.cache))
+
+    def test_06_query_filters(self):
+        squeue = """echo "$@" > "$(dirname "$0")/args"
+echo '"JOBID","NAME","ST"'
+echo '"1234_1","train","PD"'
+echo '"1234_2","train","R"'
+echo '"1300","eval","R"'
+"""
+        wrapper = SlurmSqueueWrapper()
+        with fake_commands(squeue=squeue) as directory:
+            jobs = wrapper.query(
+                job_ids=[1300],
+                array_job_id=1234,
+                name="train",
+                states=("PD", "R"),
+                partitions="gpu",
+                reservation="resv",
+            )
+            with open(os.path.join(directory, "args")) as fid:
+                args = fid.read().split()
+
+        self.assertEqual(
+            [
+                "--jobs=1300,1234",
+                "--name=train",
+                "--states=PD,R",
+                "--partition=gpu",
+                "--reservation=resv",
+            ],
+            args[-5:],
+        )
+        self.assertEqual(["1234_1", "1234_2", 1300], list(jobs))
+
+        self.assertEqual(["1234_1", "1234_2"], list(wrapper.get_jobs_by_name("train")))
+        self.assertEqual(["1234_2", 1300], list(wrapper.get_jobs_by_state("R")))
+        self.assertEqual({}, wrapper.get_jobs_by_state("CG"))
+
+    def test_07_iter_squeue(self):
+        squeue = """echo '"JOBID","NAME","ST","TIME","TIME_LEFT","NODES","CPUS","NODELIST(REASON)"'
+echo '"1234","train","R","1:02:03","1-00:00:00","2","8","node[01-02]"'
+echo '"1235_7","eval","PD","0:00","UNLIMITED","1","4","(Priority)"'
+"""
+        wrapper = SlurmSqueueWrapper()
+        with fake_commands(squeue=squeue):
+            jobs = list(wrapper.iter_squeue(states=("R", "PD")))
+
+        self.assertEqual(2, len(jobs))
+        job = jobs[0]
+        self.assertEqual(1234, job.job_id)
+        self.assertEqual("train", job.name)
+        self.assertEqual("R", job.state)
+        self.assertEqual(datetime.timedelta(hours=1, minutes=2, seconds=3), job.time)
+        self.assertEqual(datetime.timedelta(days=1), job.time_left)
+        self.assertEqual((2, 8), (job.nodes, job.cpus))
+        self.assertEqual("node[01-02]", job.nodelist_reason)
+        self.assertEqual("1235_7", jobs[1].job_id)
+        self.assertIsNone(jobs[1].time_left)
+        self.assertEqual({}, wrapper.jobs)
+
+        with fake_commands(squeue="echo error >&2; exit 1\n"):
+            with self.assertRaises(RuntimeError):
+                list(wrapper.iter_squeue())
+
+    def test_08_wait(self):
+        squeue = """dir=$(dirname "$0")
+polls=$(cat "$dir/polls" 2>/dev/null || echo 0)
+echo $((polls + 1)) > "$dir/polls"
+echo '"JOBID","NAME","ST"'
+if [ "$polls" -lt 2 ]; then echo '"1234","a","R"'; fi
+echo '"1235_1","b","CD"'
+echo '"1235_2","b","F"'
+"""
+        sacct = "echo '1234|CANCELLED by 0'\n"
+        wrapper = SlurmSqueueWrapper()
+        with fake_commands(squeue=squeue, sacct=sacct) as directory:
+            states = wrapper.wait([1234, 1235], poll_interval=0.01)
+            with open(os.path.join(directory, "polls")) as fid:
+                self.assertEqual("3", fid.read().strip())
+
+        self.assertEqual({1234: "CANCELLED", 1235: "FAILED"}, states)
+
+    def test_09_wait_jobs_left_the_queue(self):
+        squeue = "echo 'slurm_load_jobs error: Invalid job id specified' >&2; exit 1\n"
+        sacct = "echo '1234|COMPLETED'\n"
+        with fake_commands(squeue=squeue, sacct=sacct):
+            states = SlurmSqueueWrapper().wait([1234, 99], poll_interval=0)
+
+        self.assertEqual({1234: "COMPLETED", 99: "UNKNOWN"}, states)
+
+    def test_10_wait_timeout(self):
+        squeue = 'echo \'"JOBID","NAME","ST"\'; echo \'"1234","a","PD"\'\n'
+        with fake_commands(squeue=squeue):
+            with self.assertRaises(TimeoutError):
+                SlurmSqueueWrapper().wait([1234], timeout=0.2, poll_interval=0.01)
+
+    def test_11_wait_sentinel(self):
+        squeue = """echo '"JOBID","NAME","ST"'
+if [ -f "$(dirname "$0")/done_1234" ]; then echo '"1234","a","CD"'
+else echo '"1234","a","R"'; fi
+"""
+        with fake_commands(squeue=squeue) as directory:
+            sentinel = os.path.join(directory, "done_{job_id}")
+            timer = threading.Timer(0.3, Path(sentinel.format(job_id=1234)).touch)
+            timer.start()
+            start = time.perf_counter()
+            job = SlurmJob(1234, SlurmSqueueWrapper())
+            state = job.wait(timeout=20, poll_interval=10, sentinel=sentinel)
+            timer.join()
+
+        self.assertEqual("COMPLETED", state)
+        self.assertLess(time.perf_counter() - start, 5)
+
+        # a job still completing once its sentinel exists is not polled again
+        # right away
+        squeue = """echo x >> "$(dirname "$0")/calls"
+echo '"JOBID","NAME","ST"'; echo '"1234","a","CG"'
+"""
+        with fake_commands(squeue=squeue) as directory:
+            sentinel = os.path.join(directory, "done_{job_id}")
+            Path(sentinel.format(job_id=1234)).touch()
+            with self.assertRaises(TimeoutError):
+                SlurmSqueueWrapper().wait(
+                    [1234], timeout=1, poll_interval=0.2, sentinel=sentinel
+                )
+            self.assertLessEqual(self.__count_calls(directory), 6)
+
+    def __count_calls(self, directory):
+        with open(os.path.join(directory, "calls")) as fid:
+            return len(fid.readlines())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import datetime
+import os
+import unittest
+
+from simple_slurm import Slurm, Workflow
+from simple_slurm.workflow import parse_time_limit
+
+from .utils import fake_commands
+
+# the fake sbatch answers with the job name (a number) as job id, failing for
+# the names listed in the 'fail' file, and logs the dependencies
+SBATCH = """dir=$(dirname "$0")
+script=$(cat)
+name=$(echo "$script" | sed -n 's/^#SBATCH --job-name *//p')
+dependency=$(echo "$script" | sed -n 's/^#SBATCH --dependency *//p')
+if grep -qx "$name" "$dir/fail" 2>/dev/null; then exit 1; fi
+echo "$name $dependency" >> "$dir/log"
+echo "$name"
+"""
+
+
+class Testing(unittest.TestCase):
+    def build(self) -> Workflow:
+        # 1 -> (2, 3) -> 4, 5 -> 6 (independent branch)
+        workflow = Workflow()
+        for name, after, hours in (
+            ("1", None, 1),
+            ("2", "1", 2),
+            ("3", {"1": "afterany"}, 5),
+            ("4", ["2", "3"], 1),
+            ("5", None, 3),
+            ("6", "5", 3),
+        ):
+            slurm = Slurm(job_name=name, parsable=True, time=f"{hours}:00:00")
+            workflow.add(name, slurm, cmd="echo Hello!", after=after)
+        return workflow
+
+    def read_log(self, directory: str) -> dict:
+        with open(os.path.join(directory, "log")) as fid:
+            return dict(line.rstrip("\n").split(" ", 1) for line in fid)
+
+    def test_01_levels(self):
+        workflow = self.build()
+        self.assertEqual([["1", "5"], ["2", "3", "6"], ["4"]], workflow.levels())
+        workflow.add_edge("4", "1")
+        with self.assertRaises(ValueError):
+            workflow.levels()
+        with self.assertRaises(ValueError):
+            workflow.add_edge("1", "2", "afterwards")
+
+    def test_02_submit(self):
+        workflow = self.build()
+        with fake_commands(sbatch=SBATCH) as directory:
+            job_ids = workflow.submit(max_workers=3)
+            log = self.read_log(directory)
+
+        self.assertEqual({str(i): i for i in range(1, 7)}, job_ids)
+        self.assertEqual("", log["1"])
+        self.assertEqual("afterok:1", log["2"])
+        self.assertEqual("afterany:1", log["3"])
+        self.assertEqual("afterok:2:3", log["4"])
+        self.assertEqual("afterok:5", log["6"])
+
+    def test_03_failures(self):
+        workflow = self.build()
+        with fake_commands(sbatch=SBATCH) as directory:
+            with open(os.path.join(directory, "fail"), "w") as fid:
+                fid.write("3\n")
+            job_ids = workflow.submit(retries=0)
+            self.assertEqual(
+                {"3": None, "4": None}, {k: v for k, v in job_ids.items() if v is None}
+            )
+            self.assertEqual({"3"}, set(workflow.errors))
+            self.assertEqual({"4"}, workflow.skipped)
+
+            # the submitted jobs are not submitted again
+            os.remove(os.path.join(directory, "fail"))
+            os.remove(os.path.join(directory, "log"))
+            job_ids = workflow.submit(retries=0)
+            log = self.read_log(directory)
+
+        self.assertEqual({str(i): i for i in range(1, 7)}, job_ids)
+        self.assertEqual({"3": "afterany:1", "4": "afterok:2:3"}, log)
+
+    def test_04_critical_path(self):
+        workflow = self.build()
+        path, duration = workflow.critical_path()
+        self.assertEqual(["1", "3", "4"], path)
+        self.assertEqual(datetime.timedelta(hours=7), duration)
+
+        workflow.durations["6"] = datetime.timedelta(hours=5)
+        self.assertEqual(
+            (["5", "6"], datetime.timedelta(hours=8)), workflow.critical_path()
+        )
+
+    def test_05_time_limits(self):
+        for value, expected in (
+            ("30", datetime.timedelta(minutes=30)),
+            ("30:15", datetime.timedelta(minutes=30, seconds=15)),
+            ("2:00:00", datetime.timedelta(hours=2)),
+            ("1-12", datetime.timedelta(days=1, hours=12)),
+            ("0-12", datetime.timedelta(hours=12)),
+            ("2-00:30", datetime.timedelta(days=2, minutes=30)),
+            ("1-02:03:04", datetime.timedelta(days=1, hours=2, minutes=3, seconds=4)),
+            ("UNLIMITED", None),
+        ):
+            self.assertEqual(expected, parse_time_limit(value), value)
+        with self.assertRaises(ValueError):
+            parse_time_limit("1:2:3:4")
+
+        workflow = Workflow()
+        workflow.add("a", Slurm(time="1-12"))
+        workflow.add("b", Slurm(time="2-00:30"), after="a")
+        self.assertEqual(
+            (["a", "b"], datetime.timedelta(days=3, hours=12, minutes=30)),
+            workflow.critical_path(),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,20 @@
+import contextlib
+import os
+import tempfile
+from unittest.mock import patch
+
+
+@contextlib.contextmanager
+def fake_commands(**scripts: str):
+    """Write the given shell scripts as executables (named after the keyword)
+    into a temporary directory, placed first on PATH. Yields the directory.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        for name, body in scripts.items():
+            path = os.path.join(directory, name)
+            with open(path, "w") as fid:
+                fid.write("#!/bin/sh\n" + body)
+            os.chmod(path, 0o755)
+        path = directory + os.pathsep + os.environ.get("PATH", "")
+        with patch.dict(os.environ, {"PATH": path}):
+            yield directory